@@ -0,0 +1,346 @@
+"""
+Multi-session assistant server for bloom_music_voice_assistant.py
+
+Instead of one process per room, many rooms stream their microphone audio
+to one server over WebSockets. Each connection is a session with its own
+wake-word state; wake-word detection and command handling run on shared
+worker pools, and every session shares one music catalog, one pooled LLM
+HTTP client and one TTS cache.
+
+Protocol (per WebSocket connection):
+- client -> server, binary: raw 16 kHz mono 16-bit PCM, any chunk size
+- client -> server, text JSON: {"type": "ping", "id": ...},
+  {"type": "stats"} or {"type": "end"}
+- server -> client, text JSON: {"type": "wake"}, {"type": "reply", ...},
+  {"type": "pong", "id": ...}, {"type": "stats", ...}, or
+  {"type": "error", ...} for a control message it couldn't parse
+- server -> client, binary: MP3 speech following a "wake" or "reply"
+
+Usage:
+    python assistant_server.py --port 8765 --wake-workers 4 --command-workers 16
+"""
+import argparse
+import array
+import asyncio
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import websockets
+
+import bloom_music_voice_assistant as assistant
+
+# ===== CONFIGURATION =====
+DEFAULT_PORT = 8765
+COMMAND_ENERGY_THRESHOLD = 3000
+COMMAND_PAUSE_THRESHOLD = 0.8
+COMMAND_PHRASE_TIME_LIMIT = 8
+EXIT_WORDS = ["stop", "exit", "quit"]
+# Silence fed to a returned Porcupine handle to clear what it heard
+PORCUPINE_RESET_SECONDS = 1.0
+
+SERVER_STATS = {"active_sessions": 0, "total_sessions": 0, "commands": 0}
+SERVER_STATS_LOCK = threading.Lock()
+SESSION_IDS = itertools.count(1)
+CONVERSATIONS = assistant.ConversationStore()
+
+# ===== WAKE-WORD ENGINES =====
+class PorcupinePool:
+    """Reuses Porcupine handles across sessions
+
+    A handle can only follow one audio stream at a time, so each session
+    borrows one for its lifetime; creating them is the expensive part, so
+    handles are kept for the next session instead of deleted.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = []
+        self.created = 0
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+            self.created += 1
+        return assistant.pvporcupine.create(
+            access_key=assistant.ACCESS_KEY,
+            keyword_paths=[assistant.CUSTOM_WAKEWORD_PATH]
+        )
+
+    def release(self, porcupine):
+        """Take a handle back, cleared of the last session's audio"""
+        try:
+            self.reset(porcupine)
+        except Exception as e:
+            print(f"Could not reset wake-word engine, discarding it: {e}")
+            porcupine.delete()
+            return
+        with self.lock:
+            self.idle.append(porcupine)
+
+    def reset(self, porcupine):
+        """Porcupine has no reset call, so flush its stream state with silence"""
+        silence = [0] * porcupine.frame_length
+        for _ in range(int(PORCUPINE_RESET_SECONDS * porcupine.sample_rate / porcupine.frame_length)):
+            porcupine.process(silence)
+
+    def close(self):
+        with self.lock:
+            for porcupine in self.idle:
+                porcupine.delete()
+            self.idle = []
+
+# ===== SESSIONS =====
+class AssistantSession:
+    """Wake-word and command-capture state for one connected audio stream"""
+
+    def __init__(self, session_id, porcupine):
+        self.session_id = session_id
+        self.porcupine = porcupine
+        self.conversation = CONVERSATIONS.get(session_id)
+        self.browser = assistant.CatalogBrowser()
+        self.pending = array.array("h")
+        self.leftover = b""
+        self.endpointer = None
+        self.reply_lock = asyncio.Lock()
+
+    def feed(self, pcm_bytes):
+        """Process newly received audio and return a list of (event, payload)"""
+        data = self.leftover + pcm_bytes
+        usable = len(data) - len(data) % assistant.SAMPLE_WIDTH
+        self.leftover = data[usable:]
+        self.pending.frombytes(data[:usable])
+
+        events = []
+        position = 0
+        frame_length = self.porcupine.frame_length
+        while True:
+            if self.endpointer is None:
+                if len(self.pending) - position < frame_length:
+                    break
+                frame = self.pending[position:position + frame_length]
+                position += frame_length
+                if self.porcupine.process(frame) >= 0:
+                    events.append(("wake", None))
+                    self.endpointer = assistant.CommandEndpointer(
+                        COMMAND_ENERGY_THRESHOLD, COMMAND_PAUSE_THRESHOLD, COMMAND_PHRASE_TIME_LIMIT)
+            else:
+                chunk_samples = self.endpointer.chunk_samples
+                if len(self.pending) - position < chunk_samples:
+                    break
+                if self.endpointer.feed(self.pending[position:position + chunk_samples]):
+                    if self.endpointer.heard_speech:
+                        events.append(("command", self.endpointer.audio_data()))
+                    else:
+                        events.append(("no_command", None))
+                    self.endpointer = None
+                position += chunk_samples
+        del self.pending[:position]
+        return events
+
+def respond_to_command(command, conversation=None, browser=None):
+    """Answer a recognized command as text plus optional song info
+
+    Server sessions have no local speaker, so music requests are answered
+    with the catalog entry instead of starting a player here. Song lists
+    are answered a page at a time; "more" continues the session's list.
+    """
+    if assistant.parse_similar_command(command) is not None:
+        song_info, message = assistant.find_similar_song(assistant.parse_similar_command(command))
+        return message, song_info
+    if command.startswith("play "):
+        song_info = assistant.search_song(command[5:].strip())
+        if song_info is None:
+            return "Song is not available in the database.", None
+        return f"Now playing: {song_info['title']} by {song_info['artist']}", song_info
+    listing = assistant.parse_listing_command(command)
+    if listing is not None:
+        browser = browser or assistant.CatalogBrowser()
+        return browser.start(*listing), None
+    if browser is not None and browser.active and assistant.is_more_request(command):
+        return browser.more(), None
+    if conversation is not None and any(phrase in command for phrase in ["new conversation", "start over", "forget that"]):
+        conversation.reset()
+        return "Okay, starting a new conversation.", None
+    return assistant.ask_llama3(command, conversation=conversation), None
+
+def handle_command(audio_data, conversation=None, browser=None):
+    """Recognize, answer and synthesize one command (runs on the command pool)"""
+    recognizer = assistant.sr.Recognizer()
+    start = time.perf_counter()
+    try:
+        with assistant.timed_stage("server_stt"):
+            command = assistant.recognize_speech(recognizer, audio_data).lower()
+    except assistant.sr.UnknownValueError:
+        command = ""
+    except Exception as e:
+        print(f"Speech recognition error: {e}")
+        command = ""
+
+    song_info = None
+    if not command:
+        reply = "Sorry, I did not understand that."
+    elif any(word in command for word in EXIT_WORDS):
+        reply = "Goodbye!"
+    else:
+        with assistant.timed_stage("server_respond"):
+            reply, song_info = respond_to_command(command, conversation, browser)
+
+    with assistant.timed_stage("server_tts"):
+        try:
+            speech = assistant.synthesize_speech(reply)
+        except Exception as e:
+            print(f"TTS Error: {e}")
+            speech = None
+    assistant.record_stage("server_command", time.perf_counter() - start)
+    with SERVER_STATS_LOCK:
+        SERVER_STATS["commands"] += 1
+    return command, reply, song_info, speech
+
+# ===== SERVER =====
+class AssistantServer:
+    """Accepts WebSocket audio sessions and runs them on shared worker pools"""
+
+    def __init__(self, wake_workers=4, command_workers=16):
+        self.wake_pool = ThreadPoolExecutor(max_workers=wake_workers, thread_name_prefix="wake")
+        self.command_pool = ThreadPoolExecutor(max_workers=command_workers, thread_name_prefix="command")
+        self.porcupines = PorcupinePool()
+
+    async def send_json(self, websocket, payload):
+        await websocket.send(json.dumps(payload))
+
+    async def reply(self, websocket, session, audio_data):
+        """Handle one captured command and send the answer back in order"""
+        loop = asyncio.get_running_loop()
+        async with session.reply_lock:
+            command, reply, song_info, speech = await loop.run_in_executor(
+                self.command_pool, handle_command, audio_data, session.conversation, session.browser)
+            await self.send_json(websocket, {
+                "type": "reply", "session": session.session_id,
+                "command": command, "text": reply, "song": song_info
+            })
+            if speech:
+                await websocket.send(speech)
+            if command and any(word in command for word in EXIT_WORDS):
+                await websocket.close()
+
+    async def handle_connection(self, websocket, path=None):
+        loop = asyncio.get_running_loop()
+        porcupine = await loop.run_in_executor(self.wake_pool, self.porcupines.acquire)
+        session = AssistantSession(next(SESSION_IDS), porcupine)
+        with SERVER_STATS_LOCK:
+            SERVER_STATS["active_sessions"] += 1
+            SERVER_STATS["total_sessions"] += 1
+        print(f"Session {session.session_id} connected.")
+
+        replies = set()
+        try:
+            async for message in websocket:
+                if isinstance(message, str):
+                    try:
+                        control = json.loads(message)
+                    except ValueError:
+                        control = None
+                    if not isinstance(control, dict):
+                        await self.send_json(websocket, {"type": "error", "session": session.session_id,
+                                                         "error": "control messages must be JSON objects"})
+                        continue
+                    if control.get("type") == "ping":
+                        await self.send_json(websocket, {"type": "pong", "id": control.get("id")})
+                    elif control.get("type") == "stats":
+                        await self.send_json(websocket, {"type": "stats", **server_stats()})
+                    elif control.get("type") == "end":
+                        break
+                    continue
+
+                events = await loop.run_in_executor(self.wake_pool, session.feed, message)
+                for event, payload in events:
+                    if event == "wake":
+                        await self.send_json(websocket, {"type": "wake", "session": session.session_id})
+                        try:
+                            ack = await loop.run_in_executor(self.command_pool, assistant.synthesize_speech,
+                                                             assistant.WAKE_ACK_TEXT)
+                        except Exception as e:
+                            print(f"TTS Error: {e}")
+                            continue
+                        await websocket.send(ack)
+                    elif event == "command":
+                        task = asyncio.ensure_future(self.reply(websocket, session, payload))
+                        replies.add(task)
+                        task.add_done_callback(replies.discard)
+                    elif event == "no_command":
+                        await self.send_json(websocket, {"type": "reply", "session": session.session_id,
+                                                         "command": "", "text": "", "song": None})
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if replies:
+                await asyncio.gather(*replies, return_exceptions=True)
+            self.porcupines.release(porcupine)
+            CONVERSATIONS.discard(session.session_id)
+            with SERVER_STATS_LOCK:
+                SERVER_STATS["active_sessions"] -= 1
+            print(f"Session {session.session_id} closed.")
+
+    async def serve(self, host, port, ready=None):
+        async with websockets.serve(self.handle_connection, host, port, max_size=2 ** 22):
+            print(f"Assistant server listening on ws://{host}:{port}")
+            if ready is not None:
+                ready.set()
+            await asyncio.Future()
+
+    def close(self):
+        self.wake_pool.shutdown(wait=False)
+        self.command_pool.shutdown(wait=False)
+        self.porcupines.close()
+
+def server_stats():
+    """Return session counters, shared-resource stats and per-stage latency"""
+    with SERVER_STATS_LOCK:
+        stats = dict(SERVER_STATS)
+    with assistant.TTS_CACHE_LOCK:
+        stats["tts_cache"] = {"entries": len(assistant.TTS_CACHE), **assistant.TTS_CACHE_STATS}
+    stats["llm_dispatcher"] = assistant.get_llm_dispatcher().snapshot()
+    stats["conversations"] = assistant.conversation_stats()
+    stats["speculation"] = assistant.speculation_stats()
+    stats["stt"] = assistant.get_stt_dispatcher().snapshot()
+    stats["ollama"] = assistant.get_ollama_pool().snapshot()
+    stats["metrics"] = assistant.metrics_summary()
+    return stats
+
+def warm_up():
+    """Load the shared catalog, pre-synthesize the common phrases and start the resource monitor"""
+    assistant.get_resource_monitor()
+    print(f"Catalog: {len(assistant.get_music_database())} songs.")
+    assistant.start_music_analysis()
+    try:
+        assistant.warm_up_tts()
+    except Exception as e:
+        print(f"TTS warm-up failed: {e}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-session Bloom assistant server")
+    parser.add_argument("--host", default="0.0.0.0", help="interface to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="WebSocket port")
+    parser.add_argument("--wake-workers", type=int, default=4, help="threads for wake-word detection")
+    parser.add_argument("--command-workers", type=int, default=16,
+                        help="threads for recognition, LLM and TTS")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    warm_up()
+    server = AssistantServer(args.wake_workers, args.command_workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.close()
+        assistant.stop_music_analysis()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+"""
+Audio features, loudness and "sounds like" search for the music catalog
+
+A background job decodes each track in a worker process and summarizes it
+as a small feature vector (tempo, loudness, brightness, chroma and MFCC
+statistics) plus a ReplayGain-style playback gain, all computed with
+vectorized NumPy over blocks of frames in a single pass. The results are
+stored next to the catalog (music_database.features.npz) with each file's
+mtime, so only new or changed tracks are analyzed again. The store is
+saved every SAVE_EVERY_TRACKS tracks and when the job is stopped, so an
+interrupted pass keeps most of its work.
+
+FeatureIndex standardizes and normalizes every stored vector into one
+matrix; a similarity query is then a single matrix-vector product over the
+whole library.
+
+NumPy is needed for analysis and search, and ffmpeg for decoding anything
+other than WAV files.
+
+Usage:
+    python audio_features.py music_database.json
+"""
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+ANALYSIS_SAMPLE_RATE = 22050
+ANALYSIS_MAX_SECONDS = 600
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+BLOCK_FRAMES = 512
+MEL_BANDS = 40
+MFCC_COEFFICIENTS = 13
+PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+FEATURE_NAMES = (["tempo", "energy_mean", "energy_std", "centroid"]
+                 + [f"chroma_{name}" for name in PITCH_CLASSES]
+                 + [f"mfcc_mean_{number}" for number in range(MFCC_COEFFICIENTS)]
+                 + [f"mfcc_std_{number}" for number in range(MFCC_COEFFICIENTS)])
+
+# Loudness (ITU-R BS.1770 / ReplayGain 2.0): tracks are turned up or down
+# to this integrated loudness, but never so far that their peak clips.
+# The peak is the sample peak of the decoded channels; the headroom covers
+# peaks between samples (and lost by resampling when ffmpeg decodes).
+REFERENCE_LOUDNESS = -18.0
+PEAK_HEADROOM_DB = 1.0
+LOUDNESS_BLOCK_SECONDS = 0.4
+LOUDNESS_STEP_SECONDS = 0.1
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+SAVE_EVERY_TRACKS = 25
+# Bumped when stored results are computed differently, so they are redone
+STORE_VERSION = 2
+
+def features_path_for(database_file):
+    """Where the feature store for a JSON database lives"""
+    return os.path.splitext(database_file)[0] + ".features.npz"
+
+# ===== DECODING =====
+def decode_audio(path, sample_rate=ANALYSIS_SAMPLE_RATE, max_seconds=ANALYSIS_MAX_SECONDS):
+    """Decode a track to (mono float32 samples in [-1, 1] at sample_rate, peak)
+
+    The peak is the largest sample of any channel before the mixdown, at
+    the file's own rate for WAV files (ffmpeg resamples first).
+    """
+    import numpy as np
+
+    if path.lower().endswith(".wav"):
+        with wave.open(path, "rb") as wav_file:
+            if wav_file.getsampwidth() != 2:
+                raise ValueError(f"{path}: only 16-bit WAV files are supported")
+            channels = wav_file.getnchannels()
+            source_rate = wav_file.getframerate()
+            frames = wav_file.readframes(min(wav_file.getnframes(), int(max_seconds * source_rate)))
+    else:
+        # Stereo rather than mono, so the peak of each side is kept
+        command = ["ffmpeg", "-v", "error", "-nostdin", "-t", str(max_seconds), "-i", path,
+                   "-f", "s16le", "-ac", "2", "-ar", str(sample_rate), "-"]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+        if result.returncode != 0:
+            raise ValueError(f"{path}: ffmpeg could not decode it ({result.stderr.decode(errors='replace').strip()})")
+        frames, channels, source_rate = result.stdout, 2, sample_rate
+    samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    peak = float(np.abs(samples).max()) if len(samples) else 0.0
+    samples = samples.reshape(-1, channels).mean(axis=1)
+    if source_rate != sample_rate and len(samples):
+        positions = np.arange(0, len(samples), source_rate / sample_rate)
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+    return samples, peak
+
+# ===== FEATURES =====
+def mel_filterbank(sample_rate, frame_size, bands):
+    """Triangular mel filters as a (bands, frame_size // 2 + 1) matrix"""
+    import numpy as np
+
+    frequencies = np.linspace(0, sample_rate / 2, frame_size // 2 + 1)
+    top = 2595 * np.log10(1 + (sample_rate / 2) / 700)
+    edges = 700 * (10 ** (np.linspace(0, top, bands + 2) / 2595) - 1)
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (frequencies - lower) / (center - lower)
+    falling = (upper - frequencies) / (upper - center)
+    return np.maximum(0, np.minimum(rising, falling)).astype(np.float32)
+
+def chroma_matrix(sample_rate, frame_size):
+    """(frame_size // 2 + 1, 12) matrix folding spectrum bins into pitch classes"""
+    import numpy as np
+
+    frequencies = np.linspace(0, sample_rate / 2, frame_size // 2 + 1)
+    audible = (frequencies >= 30) & (frequencies <= 5000)
+    pitch = np.zeros(len(frequencies), dtype=int)
+    pitch[audible] = np.round(12 * np.log2(frequencies[audible] / 440) + 69).astype(int) % 12
+    matrix = np.zeros((len(frequencies), 12), dtype=np.float32)
+    matrix[np.nonzero(audible)[0], pitch[audible]] = 1
+    return matrix
+
+def k_weighting(sample_rate, frame_size):
+    """Power response of the BS.1770 K-weighting filter at each spectrum bin
+
+    The shelf and high-pass biquads are applied to the frame spectra
+    instead of filtering the samples one by one.
+    """
+    import numpy as np
+
+    omega = np.linspace(0, np.pi, frame_size // 2 + 1)
+    z = np.exp(-1j * omega)
+
+    def response(b, a):
+        return np.abs((b[0] + b[1] * z + b[2] * z ** 2) / (a[0] + a[1] * z + a[2] * z ** 2)) ** 2
+
+    # High shelf (+4 dB above ~1.7 kHz)
+    gain, quality, corner = 10 ** (3.99984385397 / 40), 0.7071752369554193, 1681.9744509555319
+    w0 = 2 * np.pi * corner / sample_rate
+    alpha = np.sin(w0) / (2 * quality)
+    shelf = response(
+        [gain * ((gain + 1) + (gain - 1) * np.cos(w0) + 2 * np.sqrt(gain) * alpha),
+         -2 * gain * ((gain - 1) + (gain + 1) * np.cos(w0)),
+         gain * ((gain + 1) + (gain - 1) * np.cos(w0) - 2 * np.sqrt(gain) * alpha)],
+        [(gain + 1) - (gain - 1) * np.cos(w0) + 2 * np.sqrt(gain) * alpha,
+         2 * ((gain - 1) - (gain + 1) * np.cos(w0)),
+         (gain + 1) - (gain - 1) * np.cos(w0) - 2 * np.sqrt(gain) * alpha])
+    # High pass (~38 Hz)
+    quality, corner = 0.5003270373253953, 38.13547087613982
+    w0 = 2 * np.pi * corner / sample_rate
+    alpha = np.sin(w0) / (2 * quality)
+    high_pass = response([(1 + np.cos(w0)) / 2, -(1 + np.cos(w0)), (1 + np.cos(w0)) / 2],
+                         [1 + alpha, -2 * np.cos(w0), 1 - alpha])
+    return (shelf * high_pass).astype(np.float32)
+
+def integrated_loudness(frame_power, sample_rate=ANALYSIS_SAMPLE_RATE):
+    """Gated integrated loudness (LUFS) from per-frame K-weighted mean squares"""
+    import numpy as np
+
+    frame_rate = sample_rate / HOP_SIZE
+    block = max(1, int(round(LOUDNESS_BLOCK_SECONDS * frame_rate)))
+    step = max(1, int(round(LOUDNESS_STEP_SECONDS * frame_rate)))
+    if len(frame_power) < block:
+        blocks = np.array([frame_power.mean()])
+    else:
+        sums = np.concatenate([[0], np.cumsum(frame_power, dtype=np.float64)])
+        starts = np.arange(0, len(frame_power) - block + 1, step)
+        blocks = (sums[starts + block] - sums[starts]) / block
+    loudness = -0.691 + 10 * np.log10(np.maximum(blocks, 1e-12))
+    gated = blocks[loudness > ABSOLUTE_GATE]
+    if not len(gated):
+        return ABSOLUTE_GATE
+    relative = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+    gated = gated[-0.691 + 10 * np.log10(gated) > relative]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+def replay_gain(loudness, peak):
+    """Playback gain (dB) towards REFERENCE_LOUDNESS, limited so the peak stays
+    PEAK_HEADROOM_DB below full scale"""
+    import numpy as np
+
+    gain = REFERENCE_LOUDNESS - loudness
+    if peak > 0:
+        gain = min(gain, -20 * np.log10(peak) - PEAK_HEADROOM_DB)
+    return float(gain)
+
+def analyze_samples(samples, sample_rate=ANALYSIS_SAMPLE_RATE, peak=None):
+    """Return (feature vector, playback gain in dB) for mono samples
+
+    The vector is laid out as FEATURE_NAMES. Both come from the same
+    blocks of frame spectra, so each track is transformed only once.
+    peak is the track's sample peak (see decode_audio); the peak of the
+    mono samples is used if it isn't given.
+    """
+    import numpy as np
+
+    if len(samples) < FRAME_SIZE:
+        samples = np.pad(samples, (0, FRAME_SIZE - len(samples)))
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+    # Weights turning a one-sided power spectrum back into the frame's
+    # mean square (Parseval), undoing the Hann window's power loss
+    parseval = np.full(FRAME_SIZE // 2 + 1, 2.0, dtype=np.float32)
+    parseval[[0, -1]] = 1.0
+    parseval /= FRAME_SIZE ** 2 * float((window ** 2).mean())
+    k_weights = k_weighting(sample_rate, FRAME_SIZE) * parseval
+    mel = mel_filterbank(sample_rate, FRAME_SIZE, MEL_BANDS)
+    chroma = chroma_matrix(sample_rate, FRAME_SIZE)
+    frequencies = np.linspace(0, sample_rate / 2, FRAME_SIZE // 2 + 1, dtype=np.float32)
+    dct = np.cos(np.pi / MEL_BANDS * (np.arange(MEL_BANDS) + 0.5)
+                 * np.arange(MFCC_COEFFICIENTS)[:, None]).astype(np.float32)
+
+    # Work through the frames in blocks to bound the size of the spectra
+    energy, centroid, log_mel, weighted = [], [], [], []
+    chroma_sum = np.zeros(12, dtype=np.float64)
+    for start in range(0, len(frames), BLOCK_FRAMES):
+        block = frames[start:start + BLOCK_FRAMES]
+        power = np.abs(np.fft.rfft(block * window, axis=1)).astype(np.float32) ** 2
+        total = power.sum(axis=1)
+        energy.append(np.sqrt((block ** 2).mean(axis=1)))
+        centroid.append((power @ frequencies) / np.maximum(total, 1e-10))
+        log_mel.append(np.log(power @ mel.T + 1e-10))
+        chroma_sum += (power @ chroma).sum(axis=0)
+        weighted.append(power @ k_weights)
+    energy = 20 * np.log10(np.concatenate(energy) + 1e-6)
+    centroid = np.concatenate(centroid)
+    log_mel = np.concatenate(log_mel)
+    mfcc = log_mel @ dct.T
+
+    # Tempo: strongest autocorrelation lag of the onset envelope in 60-200 BPM
+    onsets = np.maximum(np.diff(log_mel, axis=0), 0).sum(axis=1)
+    tempo = 0.0
+    frame_rate = sample_rate / HOP_SIZE
+    shortest, longest = int(60 * frame_rate / 200), int(60 * frame_rate / 60)
+    if len(onsets) > longest:
+        onsets = onsets - onsets.mean()
+        spectrum = np.fft.rfft(onsets, 2 * len(onsets))
+        autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum))[:len(onsets)]
+        lag = shortest + int(np.argmax(autocorrelation[shortest:longest + 1]))
+        tempo = 60 * frame_rate / lag
+
+    chroma_profile = chroma_sum / max(chroma_sum.sum(), 1e-10)
+    vector = np.concatenate([[tempo, energy.mean(), energy.std(), centroid.mean()], chroma_profile,
+                             mfcc.mean(axis=0), mfcc.std(axis=0)]).astype(np.float32)
+    loudness = integrated_loudness(np.concatenate(weighted), sample_rate)
+    if peak is None:
+        peak = float(np.abs(samples).max())
+    return vector, replay_gain(loudness, peak)
+
+def compute_features(samples, sample_rate=ANALYSIS_SAMPLE_RATE):
+    """Summarize mono samples as a feature vector (see FEATURE_NAMES)"""
+    return analyze_samples(samples, sample_rate)[0]
+
+def analyze_file(path):
+    """Worker-process entry point: (path, mtime_ns, vector, gain_db, error)"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        samples, peak = decode_audio(path)
+        vector, gain = analyze_samples(samples, peak=peak)
+        return path, mtime, vector, gain, None
+    except Exception as e:
+        return path, None, None, None, str(e)
+
+def lower_priority(niceness):
+    """Worker-process initializer: yield the CPU to the rest of the system"""
+    if niceness and hasattr(os, "nice"):
+        try:
+            os.nice(niceness)
+        except OSError:
+            pass
+
+# ===== FEATURE STORE =====
+def load_feature_store(path):
+    """Load stored results as {file_path: (key, mtime_ns, vector, gain_db)}"""
+    import numpy as np
+
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if "version" not in data or int(data["version"]) != STORE_VERSION:
+                return {}
+            return {str(file_path): (str(key), int(mtime), vector, float(gain))
+                    for key, file_path, mtime, vector, gain in
+                    zip(data["keys"], data["paths"], data["mtimes"], data["vectors"], data["gains"])}
+    except (OSError, KeyError, ValueError):
+        return {}
+
+def save_feature_store(path, store):
+    """Write the feature store atomically"""
+    import numpy as np
+
+    paths = list(store)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        np.savez(file, version=np.array(STORE_VERSION),
+                 keys=np.array([store[file_path][0] for file_path in paths], dtype=str),
+                 paths=np.array(paths, dtype=str),
+                 mtimes=np.array([store[file_path][1] for file_path in paths], dtype=np.int64),
+                 vectors=np.array([store[file_path][2] for file_path in paths], dtype=np.float32)
+                 .reshape(len(paths), len(FEATURE_NAMES)),
+                 gains=np.array([store[file_path][3] for file_path in paths], dtype=np.float32))
+    os.replace(temp_path, path)
+
+def analyze_catalog(database, features_file, workers=None, on_progress=None, stop_event=None, niceness=0,
+                    on_save=None):
+    """Bring the feature and gain store up to date with the catalog
+
+    Tracks whose file is new or has a different mtime are decoded and
+    analyzed on a process pool of workers processes (one per CPU if None),
+    run at the given niceness; entries for songs no longer in the catalog
+    are dropped. Progress is saved every SAVE_EVERY_TRACKS tracks. Setting
+    stop_event cancels the tracks not yet started and saves what is done.
+    on_save(store), if given, is called after each save.
+    Returns (analyzed, failed) counts.
+    """
+    store = load_feature_store(features_file)
+    wanted = {}
+    for key, song_info in database.items():
+        wanted.setdefault(song_info["file_path"], key)
+
+    stale = []
+    for file_path, key in wanted.items():
+        try:
+            mtime = os.stat(file_path).st_mtime_ns
+        except OSError:
+            continue
+        entry = store.get(file_path)
+        if entry is None or entry[1] != mtime:
+            stale.append(file_path)
+        elif entry[0] != key:
+            store[file_path] = (key,) + entry[1:]
+    removed = [file_path for file_path in store if file_path not in wanted]
+    for file_path in removed:
+        del store[file_path]
+
+    def save():
+        save_feature_store(features_file, store)
+        if on_save:
+            on_save(store)
+
+    analyzed = failed = unsaved = 0
+    if removed:
+        unsaved += 1
+    try:
+        if stale:
+            # spawn: the assistant process has threads running, which fork() would copy badly
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=lower_priority, initargs=(niceness,)) as pool:
+                for file_path, mtime, vector, gain, error in pool.map(analyze_file, stale):
+                    if error:
+                        failed += 1
+                        print(f"Could not analyze {file_path}: {error}")
+                    else:
+                        store[file_path] = (wanted[file_path], mtime, vector, gain)
+                        analyzed += 1
+                        unsaved += 1
+                        if on_progress:
+                            on_progress(analyzed, len(stale))
+                    if unsaved >= SAVE_EVERY_TRACKS:
+                        save()
+                        unsaved = 0
+                    if stop_event is not None and stop_event.is_set():
+                        pool.shutdown(wait=True, cancel_futures=True)
+                        break
+    finally:
+        if unsaved:
+            save()
+    return analyzed, failed
+
+# ===== SIMILARITY SEARCH =====
+class FeatureIndex:
+    """Nearest-neighbour search over the stored feature vectors
+
+    Each feature is standardized across the library (so tempo in BPM and
+    MFCCs in log units weigh the same) and every vector is scaled to unit
+    length; cosine similarity against the whole library is one product.
+    """
+
+    def __init__(self, store):
+        import numpy as np
+
+        self.paths = list(store)
+        self.keys = [store[file_path][0] for file_path in self.paths]
+        self.rows = {file_path: row for row, file_path in enumerate(self.paths)}
+        self.gains = {file_path: (store[file_path][1], store[file_path][3]) for file_path in self.paths}
+        vectors = np.array([store[file_path][2] for file_path in self.paths],
+                           dtype=np.float32).reshape(len(self.paths), len(FEATURE_NAMES))
+        self.mean = vectors.mean(axis=0) if len(vectors) else np.zeros(len(FEATURE_NAMES), np.float32)
+        self.scale = vectors.std(axis=0) if len(vectors) else np.ones(len(FEATURE_NAMES), np.float32)
+        self.scale[self.scale == 0] = 1
+        self.matrix = self._normalize(vectors)
+
+    def _normalize(self, vectors):
+        import numpy as np
+
+        standardized = (vectors - self.mean) / self.scale
+        lengths = np.linalg.norm(standardized, axis=-1, keepdims=True)
+        return standardized / np.maximum(lengths, 1e-10)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def gain_for(self, file_path, mtime):
+        """Stored playback gain (dB) for a file, or None if unknown or out of date"""
+        stored = self.gains.get(file_path)
+        if stored is None or stored[0] != mtime:
+            return None
+        return stored[1]
+
+    def similar_to(self, file_path, count=5):
+        """[(key, file_path, similarity)] for the tracks most like file_path"""
+        import numpy as np
+
+        row = self.rows.get(file_path)
+        if row is None:
+            return []
+        scores = self.matrix @ self.matrix[row]
+        scores[row] = -np.inf
+        count = min(count, len(scores) - 1)
+        if count <= 0:
+            return []
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.argsort(-scores[best])]
+        return [(self.keys[number], self.paths[number], float(scores[number])) for number in best]
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    database_file = argv[0] if argv else "music_database.json"
+    with open(database_file, "r") as file:
+        database = json.load(file)
+    features_file = features_path_for(database_file)
+    start = time.perf_counter()
+    analyzed, failed = analyze_catalog(database, features_file)
+    print(f"Analyzed {analyzed} tracks ({failed} failed) in {time.perf_counter() - start:.1f}s -> {features_file}")
+
+if __name__ == "__main__":
+    main()
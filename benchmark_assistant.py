@@ -0,0 +1,587 @@
+"""
+Offline benchmark for bloom_music_voice_assistant.py
+
+Runs the real main() / process_command pipeline without a microphone,
+Porcupine key, Google or Ollama:
+
+- fake Ollama HTTP servers (default one, on port 11434) with configurable
+  latency and token rate; --ollama-servers runs several on consecutive
+  ports to exercise the endpoint pool
+- a fake speech recognizer fed from a transcript fixture
+- a fake Porcupine that fires the wake word on demand
+- a null TTS (gTTS stand-in) and a null audio player
+
+Usage:
+    python benchmark_assistant.py --turns 200 --llm-latency 0.05 --token-rate 200
+"""
+import argparse
+import collections
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TRANSCRIPTS_FILE = "benchmark_transcripts.json"
+
+# ===== FAKE OLLAMA SERVER =====
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Answers /api/generate like Ollama, after a simulated generation delay"""
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one segment; keep-alive clients would
+    # otherwise hit Nagle/delayed-ACK stalls.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": self.server.model}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        if not request.get("prompt"):
+            # Model load / warm-up request: nothing to generate
+            self._send_json(200, {"model": request.get("model", server.model), "response": "", "done": True})
+            return
+        # Like Ollama, a context this server just returned is still in its
+        # KV cache, so only the new prompt tokens need processing.
+        context = request.get("context") or []
+        prompt_tokens = [hash(word) % 32000 for word in request["prompt"].split()]
+        with server.lock:
+            server.requests_served += 1
+            reused = bool(context) and tuple(context) in server.cached_contexts
+        processed = len(prompt_tokens) + (0 if reused else len(context))
+        prompt_seconds = processed / server.prompt_rate
+
+        words = [f"word{i}" for i in range(server.response_tokens)]
+        time.sleep(server.latency + prompt_seconds + server.response_tokens / server.token_rate)
+        new_context = context + prompt_tokens + list(range(server.response_tokens))
+        with server.lock:
+            server.cached_contexts.append(tuple(new_context))
+        self._send_json(200, {
+            "model": request.get("model", server.model),
+            "response": " ".join(words),
+            "done": True,
+            "context": new_context,
+            "prompt_eval_count": processed,
+            "prompt_eval_duration": int(prompt_seconds * 1e9),
+            "eval_count": server.response_tokens
+        })
+
+def start_fake_ollama(port=11434, latency=0.2, token_rate=50.0, response_tokens=30, model="llama3",
+                      prompt_rate=500.0):
+    """Start a fake Ollama server in a daemon thread and return it
+
+    prompt_rate is the simulated prompt-processing speed (tokens/s).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.token_rate = token_rate
+    server.response_tokens = response_tokens
+    server.model = model
+    server.requests_served = 0
+    server.prompt_rate = prompt_rate
+    server.cached_contexts = collections.deque(maxlen=64)
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+# ===== STAND-IN BACKEND MODULES =====
+class NullPlayer:
+    """Stands in for an afplay/mpg123 process; 'plays' for a fixed duration"""
+    _pids = itertools.count(1_000_000)
+
+    def __init__(self, cmd, stdout=None, stderr=None, duration=0.0):
+        self.args = cmd
+        self.pid = next(self._pids)
+        self.returncode = None
+        self._ends_at = time.perf_counter() + duration
+
+    def poll(self):
+        if self.returncode is None and time.perf_counter() >= self._ends_at:
+            self.returncode = 0
+        return self.returncode
+
+    def wait(self, timeout=None):
+        remaining = self._ends_at - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        return self.poll()
+
+SPOKEN_MARKER = b"\x01SPOKEN"
+SPOKEN_PAD = b"\x7f"
+WORD_SECONDS = 0.3
+
+def make_fake_speech_recognition(transcripts, stt_latency=0.0, speech_pause=0.0,
+                                 stt_fail_rate=0.0, stt_hang_rate=0.0):
+    """Build a speech_recognition stand-in that 'hears' the given transcripts
+
+    Only listens on the main thread consume transcripts; background listeners
+    (the interrupt watcher) read silence from the microphone stream in real
+    time and time out, as if nobody said anything (or end early if a read
+    comes back empty), and keep timing out once module.finished is set.
+    A transcript of None simulates speech that could not be understood.
+    Audio recorded elsewhere (replays, server sessions) is "recognized" as
+    the next transcript, cycling through the fixture, from any thread.
+    listen(stream=True) yields one loud chunk per word (the word is carried
+    in the audio, so partial recordings are recognized as the words so far)
+    and then the trailing pause, which takes speech_pause seconds.
+    recognize_google fails (stt_fail_rate) or hangs (stt_hang_rate) at
+    random, as over a bad network; recognize_sphinx is an always-available
+    local stand-in without the latency.
+    """
+    module = types.ModuleType("speech_recognition")
+    pending = list(transcripts)
+    fixture = itertools.cycle(list(transcripts) or ["exit"])
+    lock = threading.Lock()
+    finished = threading.Event()
+    unheard = object()
+    outages = random.Random(1)
+
+    class WaitTimeoutError(Exception):
+        pass
+
+    class UnknownValueError(Exception):
+        pass
+
+    class RequestError(Exception):
+        pass
+
+    class AudioData:
+        def __init__(self, frame_data, sample_rate, sample_width, transcript=unheard):
+            self.frame_data = frame_data
+            self.sample_rate = sample_rate
+            self.sample_width = sample_width
+            self.transcript = transcript
+
+    class SilentStream:
+        def __init__(self, sample_rate):
+            self.sample_rate = sample_rate
+
+        def read(self, size):
+            time.sleep(size / self.sample_rate)
+            return b"\x00\x00" * size
+
+        def close(self):
+            pass
+
+    class Microphone:
+        def __init__(self, device_index=None, sample_rate=16000, chunk_size=1024):
+            self.SAMPLE_RATE = sample_rate
+            self.SAMPLE_WIDTH = 2
+            self.CHUNK = chunk_size
+            self.stream = None
+
+        def __enter__(self):
+            self.stream = SilentStream(self.SAMPLE_RATE)
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            self.stream.close()
+            self.stream = None
+            return False
+
+    class Recognizer:
+        def __init__(self):
+            self.energy_threshold = 300
+            self.dynamic_energy_threshold = True
+            self.pause_threshold = 0.8
+
+        def adjust_for_ambient_noise(self, source, duration=1):
+            pass
+
+        def listen(self, source, timeout=None, phrase_time_limit=None, stream=False):
+            if threading.current_thread() is not threading.main_thread():
+                heard = self.listen_to_silence(source, timeout or 1)
+                return heard if stream else next(heard, AudioData(b"", 16000, 2, None))
+            with lock:
+                transcript = pending.pop(0) if pending else "exit"
+            if stream:
+                return self.stream_words(transcript)
+            if speech_pause:
+                time.sleep(speech_pause)
+            return AudioData(b"", 16000, 2, transcript)
+
+        def listen_to_silence(self, source, timeout):
+            """Nobody speaks: time out, or stop where the stream runs dry"""
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline and not finished.is_set():
+                if not source.stream.read(source.CHUNK):
+                    return
+            if finished.is_set():
+                time.sleep(timeout)
+            raise WaitTimeoutError("listening timed out")
+            yield
+
+        def stream_words(self, transcript):
+            word_bytes = int(16000 * WORD_SECONDS) * 2
+            words = (transcript or "").split()
+            yield AudioData(SPOKEN_MARKER.ljust(word_bytes, SPOKEN_PAD), 16000, 2)
+            for word in words:
+                yield AudioData(f" {word}".encode().ljust(word_bytes, SPOKEN_PAD), 16000, 2)
+            pause_bytes = int(16000 * self.pause_threshold) * 2
+            yield AudioData(b"\x00" * word_bytes, 16000, 2)
+            if speech_pause:
+                time.sleep(speech_pause)
+            yield AudioData(b"\x00" * (pause_bytes - word_bytes), 16000, 2)
+
+        def recognize_google(self, audio_data, **kwargs):
+            with lock:
+                roll = outages.random()
+            if roll < stt_fail_rate:
+                raise RequestError("recognition connection failed")
+            if roll < stt_fail_rate + stt_hang_rate:
+                finished.wait(30)
+            if stt_latency:
+                time.sleep(stt_latency)
+            return self.recognize_sphinx(audio_data)
+
+        def recognize_sphinx(self, audio_data, **kwargs):
+            transcript = audio_data.transcript
+            if transcript is unheard and audio_data.frame_data.startswith(SPOKEN_MARKER):
+                spoken = audio_data.frame_data[len(SPOKEN_MARKER):]
+                transcript = spoken.replace(SPOKEN_PAD, b"").replace(b"\x00", b"").decode().strip() or None
+            if transcript is unheard:
+                with lock:
+                    transcript = next(fixture)
+            if transcript is None:
+                raise UnknownValueError()
+            return transcript
+
+    module.WaitTimeoutError = WaitTimeoutError
+    module.UnknownValueError = UnknownValueError
+    module.RequestError = RequestError
+    module.AudioData = AudioData
+    module.Microphone = Microphone
+    module.Recognizer = Recognizer
+    module.pending = pending
+    module.finished = finished
+    return module
+
+# Sample value that the fake Porcupine treats as "Hi Bloom" when a load
+# test streams synthetic audio.
+WAKE_MARKER_SAMPLE = 12345
+
+def make_fake_porcupine(wake_every_frames=1, wake_marker=None):
+    """Build a pvporcupine stand-in that detects the wake word every N frames
+
+    With wake_marker set it instead fires on frames containing that sample
+    value.
+    """
+    module = types.ModuleType("pvporcupine")
+
+    class FakePorcupine:
+        frame_length = 512
+        sample_rate = 16000
+
+        def __init__(self):
+            self.frames = 0
+
+        def process(self, pcm):
+            self.frames += 1
+            if wake_marker is not None:
+                return 0 if wake_marker in pcm else -1
+            return 0 if self.frames % wake_every_frames == 0 else -1
+
+        def delete(self):
+            pass
+
+    module.create = lambda access_key=None, keyword_paths=None, **kwargs: FakePorcupine()
+    return module
+
+def make_fake_pyaudio():
+    """Build a pyaudio stand-in with one silent 16 kHz input device
+
+    In callback mode the fake device delivers buffers at real-time pace
+    from its own thread, like PortAudio does.
+    """
+    module = types.ModuleType("pyaudio")
+    module.paInt16 = 8
+    module.paContinue = 0
+    module.paInputOverflow = 2
+
+    class FakeStream:
+        def __init__(self, frames_per_buffer=1024, stream_callback=None, rate=16000, **kwargs):
+            self.frames_per_buffer = frames_per_buffer
+            self.stream_callback = stream_callback
+            self.rate = rate
+            self.stopped = threading.Event()
+            if stream_callback is not None:
+                threading.Thread(target=self._deliver, daemon=True).start()
+
+        def _deliver(self):
+            silence = b"\x00\x00" * self.frames_per_buffer
+            interval = self.frames_per_buffer / self.rate
+            next_time = time.perf_counter()
+            while not self.stopped.is_set():
+                next_time += interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    self.stopped.wait(delay)
+                self.stream_callback(silence, self.frames_per_buffer, {}, 0)
+
+        def read(self, num_frames, exception_on_overflow=True):
+            return b"\x00\x00" * num_frames
+
+        def stop_stream(self):
+            self.stopped.set()
+
+        def close(self):
+            self.stopped.set()
+
+    class PyAudio:
+        def get_device_count(self):
+            return 1
+
+        def get_device_info_by_index(self, index):
+            return {"index": index, "name": "Benchmark Input", "maxInputChannels": 1,
+                    "defaultSampleRate": 16000.0}
+
+        def open(self, **kwargs):
+            return FakeStream(**kwargs)
+
+        def terminate(self):
+            pass
+
+    module.PyAudio = PyAudio
+    return module
+
+def make_null_gtts(tts_latency=0.0):
+    """Build a gtts stand-in that writes an empty MP3 after a simulated delay"""
+    module = types.ModuleType("gtts")
+
+    class gTTS:
+        def __init__(self, text, lang="en", **kwargs):
+            self.text = text
+
+        def write_to_fp(self, fp):
+            if tts_latency:
+                time.sleep(tts_latency)
+            fp.write(b"")
+
+        def save(self, filename):
+            with open(filename, "wb") as file:
+                self.write_to_fp(file)
+
+    module.gTTS = gTTS
+    return module
+
+# ===== BENCHMARK =====
+def load_transcripts(path):
+    """Load the transcript fixture (a JSON list of spoken commands)"""
+    with open(path, "r") as file:
+        return json.load(file)
+
+def build_benchmark_catalog(directory):
+    """Copy music_database.json with every file_path pointed at a dummy track"""
+    track = os.path.join(directory, "benchmark_track.mp3")
+    with open(track, "wb") as file:
+        file.write(b"")
+    with open("music_database.json", "r") as file:
+        database = json.load(file)
+    for song_info in database.values():
+        song_info["file_path"] = track
+    catalog = os.path.join(directory, "music_database.json")
+    with open(catalog, "w") as file:
+        json.dump(database, file, indent=4)
+    return catalog
+
+def install_stand_ins(transcripts, args):
+    """Register the stand-in backends before the assistant is imported"""
+    sys.modules["speech_recognition"] = make_fake_speech_recognition(
+        transcripts, args.stt_latency, args.speech_pause,
+        getattr(args, "stt_fail_rate", 0.0), getattr(args, "stt_hang_rate", 0.0))
+    sys.modules["pvporcupine"] = make_fake_porcupine()
+    sys.modules["pyaudio"] = make_fake_pyaudio()
+    sys.modules["gtts"] = make_null_gtts(args.tts_latency)
+
+def run_benchmark(args, configure=None):
+    """Drive main() through the requested number of turns and return the metrics
+
+    configure(assistant), if given, can adjust the assistant module after
+    the benchmark settings are applied and before main() runs.
+    """
+    fixture = load_transcripts(args.transcripts)
+    transcripts = list(itertools.islice(itertools.cycle(fixture), args.turns)) + ["exit"]
+    install_stand_ins(transcripts, args)
+
+    import bloom_music_voice_assistant as assistant
+
+    servers = []
+    for number in range(max(1, args.ollama_servers)):
+        # The first server can be made slower to show least-outstanding routing
+        latency = args.llm_latency + (args.slow_server_latency if number == 0 else 0.0)
+        servers.append(start_fake_ollama(args.port + number, latency, args.token_rate, args.response_tokens,
+                                         prompt_rate=args.prompt_rate))
+    workdir = tempfile.mkdtemp(prefix="bloom_bench_")
+    try:
+        assistant.OLLAMA_URL = f"http://127.0.0.1:{args.port}/api/generate"
+        if len(servers) > 1 or args.dead_server:
+            assistant.OLLAMA_ENDPOINTS = [(f"http://127.0.0.1:{server.server_address[1]}", "llama3")
+                                          for server in servers]
+            if args.dead_server:
+                # Nothing listens on the port after the last server
+                assistant.OLLAMA_ENDPOINTS.insert(0, (f"http://127.0.0.1:{args.port + len(servers)}", "llama3"))
+        assistant.MUSIC_DATABASE_FILE = build_benchmark_catalog(workdir)
+        assistant.AUDIO_PROFILE_FILE = os.path.join(workdir, "audio_device_profile.json")
+        assistant.CUSTOM_WAKEWORD_PATH = "add_custom_ppn_file.ppn"
+        assistant.WAKE_ACK_PAUSE = 0
+        assistant.PLAYER_START_CHECK_DELAY = 0
+        assistant.SPECULATIVE_PREFETCH = args.speculative
+        assistant.STT_BACKENDS = [("google", args.stt_timeout), ("sphinx", args.stt_timeout)]
+        assistant.FEATURE_ANALYSIS_ENABLED = False  # the benchmark track is not real audio
+        assistant.subprocess = types.SimpleNamespace(
+            Popen=lambda cmd, **kwargs: NullPlayer(cmd, duration=args.playback_time),
+            DEVNULL=-3,
+            TimeoutExpired=subprocess.TimeoutExpired
+        )
+        if configure:
+            configure(assistant)
+
+        output = sys.stdout if args.verbose else io.StringIO()
+        with contextlib.redirect_stdout(output):
+            assistant.reset_metrics()
+            try:
+                assistant.main()
+            finally:
+                sys.modules["speech_recognition"].finished.set()
+        assistant.get_resource_monitor().sample()
+        summary = assistant.metrics_summary()
+        summary["llm_requests"] = sum(server.requests_served for server in servers)
+        summary["llm_dispatcher"] = assistant.get_llm_dispatcher().snapshot()
+        summary["startup"] = dict(assistant.STARTUP_REPORT)
+        summary["conversations"] = assistant.conversation_stats()
+        summary["speculation"] = assistant.speculation_stats()
+        summary["stt"] = assistant.get_stt_dispatcher().snapshot()
+        summary["ollama"] = assistant.get_ollama_pool().snapshot()
+        return summary
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+def print_report(summary):
+    """Print turn throughput and the per-stage latency table"""
+    print(f"Turns: {summary['turns']} in {summary['elapsed_seconds']:.2f}s "
+          f"({summary['turns_per_second']:.2f} turns/s), LLM requests: {summary['llm_requests']} "
+          f"({summary['llm_dispatcher']['coalesced']} coalesced)")
+    startup = summary.get("startup")
+    if startup:
+        print(f"Wake-word loop live after {1000 * startup['wake_loop_live_seconds']:.1f} ms")
+    conversations = summary.get("conversations")
+    if conversations:
+        print(f"Conversation turns: {conversations['turns']}, context reused: {conversations['context_reused']}, "
+              f"recaps: {conversations['recaps']}, contexts trimmed: {conversations['context_trimmed']}, "
+              f"sessions evicted: {conversations['sessions_evicted']}, "
+              f"prompt tokens processed: {conversations['prompt_tokens']}")
+    speculation = summary.get("speculation")
+    if speculation and speculation["started"]:
+        print(f"Speculation: {speculation['started']} started from {speculation['partials']} partials "
+              f"({speculation['partials_failed']} failed), "
+              f"hit rate {100 * speculation['hit_rate']:.0f}% ({speculation['hits']} hits, "
+              f"{speculation['misses']} misses), {speculation['cancelled']} cancelled, "
+              f"{speculation['wasted']} wasted, {1000 * speculation['saved_seconds']:.0f} ms saved")
+    stt = summary.get("stt")
+    if stt and (stt["failovers"] or stt["unavailable"]):
+        backends = ", ".join(f"{name} {backend['state']} ({backend['trips']} trips, {backend['failures']} failures, "
+                             f"{backend['skipped']} skipped)" for name, backend in stt["backends"].items())
+        print(f"Speech recognition: {stt['failovers']} failovers (p50 {stt['failover_p50_ms']:.0f} ms), "
+              f"{stt['unavailable']} unavailable, {stt['speculative']} speculative "
+              f"({stt['speculative_failed']} failed); {backends}")
+    ollama = summary.get("ollama")
+    if ollama and len(ollama) > 1:
+        for name, endpoint in ollama.items():
+            print(f"Ollama {name}: {endpoint['requests']} requests, {endpoint['failures']} failures, "
+                  f"{endpoint['latency_ms']:.0f} ms, {'healthy' if endpoint['healthy'] else 'down'}")
+    resources = summary.get("resources")
+    if resources:
+        current, growth = resources["current"], resources["growth"]
+        print(f"Resources: RSS {current['rss_bytes'] / 2 ** 20:.1f} MB ({growth['rss_bytes'] / 2 ** 20:+.1f}), "
+              f"threads {current['threads']} ({growth['threads']:+d}), FDs {current['open_fds']} "
+              f"({growth['open_fds']:+d}), children {current['children']}, temp files {current['temp_files']}")
+    capture = summary.get("capture")
+    if capture:
+        print(f"Capture: {capture['frames_captured']} frames, {capture['overflows']} overflows, "
+              f"{capture['dropped_frames']} dropped, {capture.get('flushed_frames', 0)} flushed after turns, "
+              f"queue depth {capture['queue_depth']} "
+              f"(max {capture['max_queue_depth']}/{capture['queue_capacity']})")
+    print(f"{'stage':<26}{'count':>7}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for stage, stats in sorted(summary["stages"].items()):
+        print(f"{stage:<26}{stats['count']:>7}{stats['mean_ms']:>10.1f}{stats['p50_ms']:>10.1f}"
+              f"{stats['p95_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the Bloom voice assistant")
+    parser.add_argument("--turns", type=int, default=50, help="number of wake-word turns to run")
+    parser.add_argument("--transcripts", default=DEFAULT_TRANSCRIPTS_FILE, help="transcript fixture (JSON list)")
+    parser.add_argument("--port", type=int, default=11434, help="port for the fake Ollama server")
+    parser.add_argument("--ollama-servers", type=int, default=1,
+                        help="number of fake Ollama servers (on consecutive ports from --port)")
+    parser.add_argument("--slow-server-latency", type=float, default=0.0,
+                        help="extra time to first token on the first fake Ollama server (s)")
+    parser.add_argument("--dead-server", action="store_true",
+                        help="also configure an Ollama endpoint that nothing listens on")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake Ollama time to first token (s)")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="fake Ollama tokens per second")
+    parser.add_argument("--response-tokens", type=int, default=30, help="tokens per fake Ollama answer")
+    parser.add_argument("--prompt-rate", type=float, default=500.0,
+                        help="fake Ollama prompt processing speed (tokens/s)")
+    parser.add_argument("--stt-latency", type=float, default=0.0, help="fake recognizer delay (s)")
+    parser.add_argument("--stt-fail-rate", type=float, default=0.0,
+                        help="fraction of fake Google recognitions that fail")
+    parser.add_argument("--stt-hang-rate", type=float, default=0.0,
+                        help="fraction of fake Google recognitions that never answer")
+    parser.add_argument("--stt-timeout", type=float, default=3.0,
+                        help="recognition timeout per backend (s)")
+    parser.add_argument("--speech-pause", type=float, default=0.0,
+                        help="time the speaker's closing pause takes (s)")
+    parser.add_argument("--speculative", action="store_true",
+                        help="start LLM requests from partial transcripts")
+    parser.add_argument("--tts-latency", type=float, default=0.0, help="null TTS synthesis delay (s)")
+    parser.add_argument("--playback-time", type=float, default=0.0, help="null player playback time (s)")
+    parser.add_argument("--json", dest="json_path", help="also write the metrics to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="show the assistant's own output")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    summary = run_benchmark(args)
+    print_report(summary)
+    if args.json_path:
+        with open(args.json_path, "w") as file:
+            json.dump(summary, file, indent=4)
+    return summary
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,3 @@
-import pvporcupine
-import pyaudio
-import struct
-import speech_recognition as sr
-import requests
-from gtts import gTTS
 import subprocess
 import threading
 import time
@@ -12,12 +6,193 @@ import signal
 import tempfile
 import json
 import urllib.parse
+import contextlib
+import collections
+import argparse
+import array
+import wave
+import io
+import importlib
+import itertools
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from llm_dispatcher import LLMDispatcher, normalize_prompt
+from stt_dispatcher import CircuitBreaker, RecognizerBackend, RecognizerDispatcher
+from ollama_pool import NoHealthyEndpoint, OllamaEndpoint, OllamaPool
+import music_catalog
+import catalog_store
+from resource_monitor import ResourceMonitor
+import audio_features
+
+# ===== LAZY BACKEND IMPORTS =====
+class LazyModule:
+    """Stands in for a module and imports it the first time it is used
+
+    The audio, speech and HTTP backends take a noticeable time to import,
+    so they are loaded on first use (or by a background startup step)
+    instead of when this script starts.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    record_stage(f"import_{self._name}", time.perf_counter() - start)
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+pvporcupine = LazyModule("pvporcupine")
+pyaudio = LazyModule("pyaudio")
+sr = LazyModule("speech_recognition")
+requests = LazyModule("requests")
+gtts = LazyModule("gtts")
 
 # ===== CONFIGURATION =====
 # Replace with your Porcupine AccessKey
 ACCESS_KEY = ""
 CUSTOM_WAKEWORD_PATH = ""
 MUSIC_DATABASE_FILE = "music_database.json"
+OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_MODEL = "llama3"
+# To spread questions over several Ollama instances or models, list them
+# here as (url, model) or (url, model, timeout) entries, e.g.
+# [("http://gpu-box:11434", "llama3"), ("http://localhost:11434", "llama3", 60)].
+# Entries without a timeout use OLLAMA_TIMEOUT. Empty means just OLLAMA_URL.
+OLLAMA_ENDPOINTS = []
+OLLAMA_TIMEOUT = 30
+OLLAMA_HEALTH_INTERVAL = 10
+
+# Fixed pauses in the turn loop (seconds). The benchmark sets these to 0.
+WAKE_ACK_PAUSE = 1
+PLAYER_START_CHECK_DELAY = 0.5
+
+# Audio format shared by the wake-word stream and recorded replays
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+# When False, speech and music are synthesized/looked up but not played
+# (used by the headless replay mode).
+PLAYBACK_ENABLED = True
+
+# Speculative mode: start asking Llama 3 from partial transcripts while the
+# user is still finishing the command (costs extra recognition requests).
+SPECULATIVE_PREFETCH = False
+SPECULATIVE_PARTIAL_SECONDS = 1.5
+
+# Shared clients and caches (one per process, shared by every session)
+LLM_POOL_SIZE = 8
+# Concurrent generations allowed per Ollama endpoint (match its
+# OLLAMA_NUM_PARALLEL); prompts of up to LLM_SHORT_PROMPT_WORDS words jump
+# the queue.
+LLM_MAX_CONCURRENCY = 2
+LLM_SHORT_PROMPT_WORDS = 6
+TTS_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Speech recognition backends as (name, timeout), tried in order. One that
+# fails or runs over its timeout STT_FAILURE_THRESHOLD times in a row is
+# skipped, first for STT_BACKOFF_SECONDS and then twice as long each time
+# it still fails. "sphinx" works offline (pip install pocketsphinx).
+STT_BACKENDS = [("google", 3.0), ("sphinx", 5.0)]
+STT_FAILURE_THRESHOLD = 3
+STT_BACKOFF_SECONDS = 5.0
+STT_MAX_BACKOFF_SECONDS = 120.0
+
+# ===== METRICS =====
+# Per-stage latency samples are kept in bounded windows so long-running
+# instances don't grow without limit.
+METRICS_WINDOW = 1000
+METRICS_LOCK = threading.Lock()
+TURN_METRICS = {"turns": 0, "started": time.time(), "stages": {}}
+# Memory, threads, file descriptors, child processes and speech temp files
+# are sampled this often (seconds) and reported with the turn metrics.
+RESOURCE_MONITOR_INTERVAL = 5.0
+RESOURCE_MONITOR_LOCK = threading.Lock()
+RESOURCE_MONITOR = None
+
+def reset_metrics():
+    """Clear all turn and stage metrics"""
+    with METRICS_LOCK:
+        TURN_METRICS["turns"] = 0
+        TURN_METRICS["started"] = time.time()
+        TURN_METRICS["stages"] = {}
+
+def record_stage(stage, seconds):
+    """Record one latency sample (in seconds) for a pipeline stage"""
+    with METRICS_LOCK:
+        stats = TURN_METRICS["stages"].get(stage)
+        if stats is None:
+            stats = {"count": 0, "total": 0.0, "max": 0.0,
+                     "recent": collections.deque(maxlen=METRICS_WINDOW)}
+            TURN_METRICS["stages"][stage] = stats
+        stats["count"] += 1
+        stats["total"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+        stats["recent"].append(seconds)
+
+def record_turn():
+    """Count one completed turn (a wake word, or a follow-up command)"""
+    with METRICS_LOCK:
+        TURN_METRICS["turns"] += 1
+
+@contextlib.contextmanager
+def timed_stage(stage):
+    """Context manager that records how long the enclosed block took"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def _percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+def metrics_summary():
+    """Return a snapshot of turn throughput, per-stage latency (in ms) and capture counters"""
+    with METRICS_LOCK:
+        elapsed = max(time.time() - TURN_METRICS["started"], 1e-9)
+        summary = {
+            "turns": TURN_METRICS["turns"],
+            "elapsed_seconds": elapsed,
+            "turns_per_second": TURN_METRICS["turns"] / elapsed,
+            "stages": {}
+        }
+        for stage, stats in TURN_METRICS["stages"].items():
+            recent = sorted(stats["recent"])
+            summary["stages"][stage] = {
+                "count": stats["count"],
+                "mean_ms": 1000 * stats["total"] / stats["count"],
+                "p50_ms": 1000 * _percentile(recent, 0.50),
+                "p95_ms": 1000 * _percentile(recent, 0.95),
+                "max_ms": 1000 * stats["max"]
+            }
+    if AUDIO_INPUT is not None and hasattr(AUDIO_INPUT, "capture_stats"):
+        summary["capture"] = AUDIO_INPUT.capture_stats()
+    if RESOURCE_MONITOR is not None:
+        summary["resources"] = RESOURCE_MONITOR.snapshot()
+    return summary
+
+def get_resource_monitor():
+    """Return the process resource monitor, starting it on first use"""
+    global RESOURCE_MONITOR
+    with RESOURCE_MONITOR_LOCK:
+        if RESOURCE_MONITOR is None:
+            RESOURCE_MONITOR = ResourceMonitor(RESOURCE_MONITOR_INTERVAL, TTS_TEMP_PREFIX,
+                                               before_sample=reap_players).start()
+        return RESOURCE_MONITOR
 
 # ===== FUNCTIONS =====
 def load_music_database():
@@ -35,75 +210,213 @@ def load_music_database():
         print(f"Error loading music database: {e}")
         return {}
 
-def save_music_database(database):
-    """Save music database to JSON file"""
+def edit_music_database(edit):
+    """Apply a catalog_store.CatalogEdit (any number of adds, updates and removes) in one write
+
+    Other assistant processes sharing the file pick the change up on their
+    next lookup. Returns the result counts, or None if the write failed.
+    """
     try:
-        with open(MUSIC_DATABASE_FILE, 'w') as file:
-            json.dump(database, file, indent=4)
-        print("Music database saved successfully.")
+        result = catalog_store.apply_edit(MUSIC_DATABASE_FILE, edit)
     except Exception as e:
         print(f"Error saving music database: {e}")
+        return None
+    if result["added"] or result["updated"] or result["removed"]:
+        print(f"Music database saved: {result['added']} added, {result['updated']} updated, "
+              f"{result['removed']} removed.")
+    return result
 
 def add_song_to_database(song_name, title, artist, file_path):
-    """Add a new song to the database"""
-    database = load_music_database()
-    database[song_name.lower()] = {
+    """Add a new song to the database; returns False if it couldn't be saved"""
+    edit = catalog_store.CatalogEdit().add(song_name.lower(), {
         "title": title,
         "artist": artist,
         "file_path": file_path
-    }
-    save_music_database(database)
+    })
+    if edit_music_database(edit) is None:
+        return False
     print(f"Added '{title}' to database.")
+    return True
 
 def remove_song_from_database(song_name):
-    """Remove a song from the database"""
-    database = load_music_database()
-    if song_name.lower() in database:
-        removed_song = database.pop(song_name.lower())
-        save_music_database(database)
-        print(f"Removed '{removed_song['title']}' from database.")
+    """Remove a song from the database
+
+    Returns True if it was removed, False if it wasn't in the database, or
+    None if the database couldn't be saved.
+    """
+    result = edit_music_database(catalog_store.CatalogEdit().remove(song_name.lower()))
+    if result is None:
+        return None
+    if result["removed"]:
+        print(f"Removed '{result['removed_songs'][0]['title']}' from database.")
         return True
-    else:
-        print(f"Song '{song_name}' not found in database.")
+    print(f"Song '{song_name}' not found in database.")
+    return False
+
+# The catalog is shared by every caller and reloaded only when the
+# database file changes on disk (edits from any process replace the file,
+# which changes its version). The JSON file is compiled into a binary
+# catalog next to it, which is memory-mapped instead of parsed; editors
+# compile it while holding the edit lock, so reloading is just a remap.
+CATALOG_LOCK = threading.Lock()
+CATALOG_CACHE = {"version": None, "database": {}}
+
+def open_music_catalog(version):
+    """Map the compiled catalog, compiling it only if no editor did"""
+    if version is None:
+        return load_music_database()
+    catalog_file = music_catalog.catalog_path_for(MUSIC_DATABASE_FILE)
+    catalog = music_catalog.open_catalog(catalog_file, version)
+    if catalog is None:
+        # An editor may still be compiling it (it holds the lock until it
+        # is done), or the JSON file was changed by hand: then the first
+        # process to get the lock compiles it and the others just map it.
+        with catalog_store.database_lock(MUSIC_DATABASE_FILE):
+            version = catalog_store.file_version(MUSIC_DATABASE_FILE)
+            catalog = music_catalog.open_catalog(catalog_file, version)
+            if catalog is None:
+                database = load_music_database()
+                if not catalog_store.compile_catalog(database, MUSIC_DATABASE_FILE):
+                    return database
+                catalog = music_catalog.open_catalog(catalog_file, version)
+                if catalog is None:
+                    return database
+    print(f"Opened catalog with {len(catalog)} songs.")
+    return catalog
+
+def get_music_database():
+    """Return the shared in-memory catalog, reloading it if the file changed"""
+    try:
+        stat = os.stat(MUSIC_DATABASE_FILE)
+        version = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        version = None
+    with CATALOG_LOCK:
+        if version is None or CATALOG_CACHE["version"] != version:
+            CATALOG_CACHE["database"] = open_music_catalog(version)
+            CATALOG_CACHE["version"] = version
+        return CATALOG_CACHE["database"]
+
+class SilentPlayer:
+    """Stands in for a player process when playback is disabled"""
+    pid = None
+    returncode = 0
+
+    def poll(self):
+        return 0
+
+    def wait(self, timeout=None):
+        return 0
+
+# Player processes that may still need waiting for. Finished ones are
+# reaped (their exit status collected) so they don't linger as zombies, and
+# any still playing are stopped when the assistant exits.
+PLAYER_STOP_TIMEOUT = 2.0
+PLAYERS_LOCK = threading.Lock()
+PLAYERS = set()
+
+def start_player(player_cmd, **kwargs):
+    """Start an audio player process, or a SilentPlayer if playback is disabled"""
+    if not PLAYBACK_ENABLED:
+        return SilentPlayer()
+    reap_players()
+    player = subprocess.Popen(player_cmd, **kwargs)
+    with PLAYERS_LOCK:
+        PLAYERS.add(player)
+    return player
+
+def reap_players():
+    """Forget players that have finished; returns how many are still running"""
+    with PLAYERS_LOCK:
+        finished = [player for player in PLAYERS if player.poll() is not None]
+        PLAYERS.difference_update(finished)
+        return len(PLAYERS)
+
+def terminate_player(player):
+    """SIGTERM a running player and wait for it to exit (SIGKILL if it won't)"""
+    if player is None or player.poll() is not None:
         return False
+    os.kill(player.pid, signal.SIGTERM)
+    try:
+        player.wait(timeout=PLAYER_STOP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        player.kill()
+        player.wait()
+    return True
 
-def list_available_songs():
-    """List all available songs in the database"""
-    database = load_music_database()
-    if not database:
-        return "No songs in database."
-    
-    song_list = []
-    for key, song_info in database.items():
-        song_list.append(f"{song_info['title']} by {song_info['artist']}")
-    
-    return "Available songs: " + ", ".join(song_list)
+def stop_all_players():
+    """Stop every player that is still running"""
+    with PLAYERS_LOCK:
+        players = list(PLAYERS)
+        PLAYERS.clear()
+    for player in players:
+        try:
+            terminate_player(player)
+        except Exception as e:
+            print(f"Error stopping player: {e}")
+
+# Synthesized speech is cached by text (least recently used first out), so
+# repeated phrases like the wake acknowledgement are only synthesized once.
+TTS_CACHE_LOCK = threading.Lock()
+TTS_CACHE = collections.OrderedDict()
+TTS_CACHE_STATS = {"bytes": 0, "hits": 0, "misses": 0}
+# Speech is played from temp files named with this prefix (per process, so
+# exit cleanup and the resource monitor only see this process's files).
+TTS_TEMP_PREFIX = f"bloom_tts_{os.getpid()}_"
+
+def synthesize_speech(text):
+    """Return MP3 bytes for text, using the shared TTS cache"""
+    with TTS_CACHE_LOCK:
+        audio = TTS_CACHE.get(text)
+        if audio is not None:
+            TTS_CACHE.move_to_end(text)
+            TTS_CACHE_STATS["hits"] += 1
+            return audio
+        TTS_CACHE_STATS["misses"] += 1
+
+    buffer = io.BytesIO()
+    gtts.gTTS(text=text, lang='en').write_to_fp(buffer)
+    audio = buffer.getvalue()
+
+    with TTS_CACHE_LOCK:
+        if text not in TTS_CACHE and len(audio) <= TTS_CACHE_MAX_BYTES:
+            TTS_CACHE[text] = audio
+            TTS_CACHE_STATS["bytes"] += len(audio)
+            while TTS_CACHE_STATS["bytes"] > TTS_CACHE_MAX_BYTES:
+                _, evicted = TTS_CACHE.popitem(last=False)
+                TTS_CACHE_STATS["bytes"] -= len(evicted)
+    return audio
 
 def speak(text):
     """Speak text using gTTS and afplay (interruptible) - no file saving"""
     try:
+        # Generate speech (or reuse a cached copy)
+        audio = synthesize_speech(text)
+        
         # Create a temporary file that will be automatically deleted
-        with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
+        with tempfile.NamedTemporaryFile(prefix=TTS_TEMP_PREFIX, suffix='.mp3', delete=False) as temp_file:
             temp_filename = temp_file.name
-            
-        # Generate speech file
-        tts = gTTS(text=text, lang='en')
-        tts.save(temp_filename)
-        
+            temp_file.write(audio)
+    except Exception as e:
+        print(f"TTS Error: {e}")
+        return None, None
+    
+    try:
         # Play with afplay (macOS)
-        player = subprocess.Popen(["afplay", temp_filename])
+        player = start_player(["afplay", temp_filename])
         
         # Return both player and filename for cleanup
         return player, temp_filename
     except Exception as e:
         print(f"TTS Error: {e}")
+        stop_speaking(None, temp_filename)
         return None, None
 
 def stop_speaking(player, temp_filename=None):
     """Stop the speech playback and clean up temporary file"""
     if player and player.poll() is None:
         try:
-            os.kill(player.pid, signal.SIGTERM)
+            terminate_player(player)
             print("Speech stopped.")
         except Exception as e:
             print(f"Error stopping speech: {e}")
@@ -115,31 +428,44 @@ def stop_speaking(player, temp_filename=None):
         except Exception as e:
             print(f"Error removing temporary file: {e}")
 
+def remove_speech_temp_files():
+    """Delete any of this process's speech temp files that are left over"""
+    directory = tempfile.gettempdir()
+    for name in os.listdir(directory):
+        if name.startswith(TTS_TEMP_PREFIX):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError as e:
+                print(f"Error removing temporary file: {e}")
+
 def search_song(song_name):
     """Search for a song in the database"""
-    database = load_music_database()
+    database = get_music_database()
     song_name_lower = song_name.lower().strip()
-    
-    # Direct match
-    if song_name_lower in database:
-        return database[song_name_lower]
-    
-    # Partial match
-    for key, song_info in database.items():
-        if song_name_lower in key or key in song_name_lower:
-            return song_info
-    
-    # Search in title and artist
-    for key, song_info in database.items():
-        if (song_name_lower in song_info["title"].lower() or 
-            song_name_lower in song_info["artist"].lower()):
-            return song_info
-    
-    return None
+    if isinstance(database, music_catalog.Catalog):
+        return database.search(song_name_lower)
+    # Direct match, then partial key match, then title and artist
+    return music_catalog.search_database(database, song_name_lower)
+
+def player_commands(file_path, gain_db=None):
+    """Player command lines to try, applying a loudness gain (dB) if given"""
+    if gain_db is None:
+        return [
+            ["afplay", file_path],
+            ["mpg123", file_path],
+            ["ffplay", "-nodisp", "-autoexit", file_path]
+        ]
+    scale = 10 ** (gain_db / 20)
+    return [
+        ["afplay", "-v", f"{scale:.3f}", file_path],
+        ["mpg123", "-f", str(int(32768 * scale)), file_path],
+        ["ffplay", "-nodisp", "-autoexit", "-af", f"volume={gain_db:.2f}dB", file_path]
+    ]
 
-def play_song(song_name):
+def play_song(song_name, song_info=None):
     """Play a song from the database with better error handling"""
-    song_info = search_song(song_name)
+    if song_info is None:
+        song_info = search_song(song_name)
     
     if song_info is None:
         return False, "Song is not available in the database."
@@ -150,22 +476,18 @@ def play_song(song_name):
     
     try:
         # Try different audio players in order of preference
-        players_to_try = [
-            ["afplay", song_info["file_path"]],
-            ["mpg123", song_info["file_path"]],
-            ["ffplay", "-nodisp", "-autoexit", song_info["file_path"]]
-        ]
+        players_to_try = player_commands(song_info["file_path"], track_gain(song_info["file_path"]))
         
         player = None
         for player_cmd in players_to_try:
             try:
                 print(f"Trying player: {player_cmd[0]}")
-                player = subprocess.Popen(player_cmd, 
-                                        stdout=subprocess.DEVNULL, 
-                                        stderr=subprocess.DEVNULL)
+                player = start_player(player_cmd,
+                                      stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL)
                 
                 # Wait a moment to see if it starts successfully
-                time.sleep(0.5)
+                time.sleep(PLAYER_START_CHECK_DELAY)
                 
                 if player.poll() is None:
                     print(f"Successfully started with {player_cmd[0]}")
@@ -192,7 +514,7 @@ def stop_music(player=None):
     """Stop music playback"""
     if player and player.poll() is None:
         try:
-            os.kill(player.pid, signal.SIGTERM)
+            terminate_player(player)
             print("Music stopped.")
             return True
         except Exception as e:
@@ -200,39 +522,755 @@ def stop_music(player=None):
             return False
     return False
 
-def ask_llama3(prompt):
-    url = "http://localhost:11434/api/generate"
+# One pooled HTTP session is shared by all LLM calls so connections to
+# Ollama are reused instead of opened per request.
+HTTP_SESSION_LOCK = threading.Lock()
+HTTP_SESSION = None
+
+def get_http_session():
+    """Return the shared, connection-pooled requests session"""
+    global HTTP_SESSION
+    with HTTP_SESSION_LOCK:
+        if HTTP_SESSION is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=max(4, len(OLLAMA_ENDPOINTS)),
+                                                    pool_maxsize=LLM_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            HTTP_SESSION = session
+        return HTTP_SESSION
+
+LLM_DISPATCHER_LOCK = threading.Lock()
+LLM_DISPATCHER = None
+
+def get_llm_dispatcher():
+    """Return the shared dispatcher that coalesces and queues LLM requests"""
+    global LLM_DISPATCHER
+    with LLM_DISPATCHER_LOCK:
+        if LLM_DISPATCHER is None:
+            LLM_DISPATCHER = LLMDispatcher(
+                generate_llama3,
+                max_concurrency=LLM_MAX_CONCURRENCY * len(get_ollama_pool().endpoints),
+                short_prompt_words=LLM_SHORT_PROMPT_WORDS,
+                on_queue_wait=lambda seconds: record_stage("llm_queue_wait", seconds),
+                on_generate=lambda seconds: record_stage("llm_generate", seconds)
+            )
+        return LLM_DISPATCHER
+
+OLLAMA_POOL_LOCK = threading.Lock()
+OLLAMA_POOL = None
+
+def get_ollama_pool():
+    """Return the shared pool of Ollama endpoints (health-checked in the background)"""
+    global OLLAMA_POOL
+    with OLLAMA_POOL_LOCK:
+        if OLLAMA_POOL is None:
+            endpoints = [OllamaEndpoint(url, model, timeout[0] if timeout else OLLAMA_TIMEOUT)
+                         for url, model, *timeout in (OLLAMA_ENDPOINTS or [(OLLAMA_URL, OLLAMA_MODEL)])]
+            OLLAMA_POOL = OllamaPool(endpoints, get_http_session, OLLAMA_HEALTH_INTERVAL)
+            OLLAMA_POOL.start_health_checks()
+        return OLLAMA_POOL
+
+STT_DISPATCHER_LOCK = threading.Lock()
+STT_DISPATCHER = None
+
+def get_stt_dispatcher():
+    """Return the shared dispatcher that fails speech recognition over between backends"""
+    global STT_DISPATCHER
+    with STT_DISPATCHER_LOCK:
+        if STT_DISPATCHER is None:
+            backends = [
+                RecognizerBackend(
+                    name,
+                    lambda recognizer, audio_data, method=f"recognize_{name}": getattr(recognizer, method)(audio_data),
+                    timeout,
+                    CircuitBreaker(STT_FAILURE_THRESHOLD, STT_BACKOFF_SECONDS, STT_MAX_BACKOFF_SECONDS)
+                )
+                for name, timeout in STT_BACKENDS
+            ]
+            STT_DISPATCHER = RecognizerDispatcher(
+                backends,
+                not_understood=sr.UnknownValueError,
+                on_call=lambda name, seconds: record_stage(f"stt_{name}", seconds),
+                on_failover=lambda seconds: record_stage("stt_failover", seconds)
+            )
+        return STT_DISPATCHER
+
+def recognize_speech(recognizer, audio_data, speculative=False):
+    """Transcribe audio with the first healthy recognition backend
+
+    Speculative requests (partial transcripts) don't affect the backends'
+    circuit breakers.
+    """
+    return get_stt_dispatcher().recognize(recognizer, audio_data, speculative=speculative)
+
+# ===== CATALOG BROWSING =====
+# Spoken song lists are read out a page at a time; the next page is
+# synthesized in the background while the current one plays.
+CATALOG_PAGE_SIZE = 5
+MORE_WORDS = ["more", "more songs", "next", "next page", "continue", "keep going"]
+LISTING_PATTERN = re.compile(r"(?:list|show) songs(?: by (?P<artist>.+?))?"
+                             r"(?: (?:starting|beginning|that start) with (?:the letter )?(?P<letter>\w)\b.*)?$")
+TTS_PREFETCH_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-prefetch")
+
+def parse_listing_command(command):
+    """Return (artist, letter) filters for a "list songs" command, or None"""
+    command = command.lower().strip(" .!?")
+    match = LISTING_PATTERN.search(command)
+    if match is not None:
+        return match.group("artist"), match.group("letter")
+    if "list songs" in command or "show songs" in command:
+        return None, None
+    return None
+
+def is_more_request(command):
+    """True if the command asks for the next page of a song list"""
+    return command.lower().strip(" .!") in MORE_WORDS
+
+def iter_songs(artist=None, letter=None):
+    """Lazily yield catalog entries matching the artist and first-letter filters"""
+    artist = artist.lower().strip() if artist else None
+    letter = letter.lower() if letter else None
+    for song_info in get_music_database().values():
+        if artist and artist not in song_info["artist"].lower():
+            continue
+        if letter and not song_info["title"].lower().startswith(letter):
+            continue
+        yield song_info
+
+class CatalogBrowser:
+    """Pages through the catalog for one listener
+
+    start() opens a lazy cursor over the matching songs and returns the
+    first page as text; more() returns the following page. Only about two
+    pages are read ahead, and the next page's speech is synthesized in the
+    background so it is ready when the listener asks for it.
+    """
+
+    def __init__(self, page_size=CATALOG_PAGE_SIZE):
+        self.page_size = page_size
+        self.cursor = None
+        self.buffered = []
+        self.position = 0
+
+    @property
+    def active(self):
+        return self.cursor is not None
+
+    def start(self, artist=None, letter=None):
+        """Start a new listing and return its first page"""
+        self.cursor = iter_songs(artist, letter)
+        self.buffered = []
+        self.position = 0
+        self._fill()
+        if not self.buffered:
+            self.stop()
+            return "No songs found." if artist or letter else "No songs in database."
+        return self.more()
+
+    def more(self):
+        """Return the next page of the listing (and prefetch the one after)"""
+        if not self.active:
+            return "There is no song list to continue. Say list songs to start one."
+        self._fill()
+        text = self._page_text()
+        self.position += len(self.buffered[:self.page_size])
+        del self.buffered[:self.page_size]
+        self._fill()
+        if not self.buffered:
+            self.stop()
+        else:
+            TTS_PREFETCH_POOL.submit(prefetch_speech, self._page_text())
+        return text
+
+    def stop(self):
+        self.cursor = None
+        self.buffered = []
+
+    def _fill(self):
+        # One song past the page tells us whether another page follows
+        wanted = self.page_size + 1 - len(self.buffered)
+        if wanted > 0:
+            self.buffered.extend(itertools.islice(self.cursor, wanted))
+
+    def _page_text(self):
+        page = self.buffered[:self.page_size]
+        songs = ", ".join(f"{song_info['title']} by {song_info['artist']}" for song_info in page)
+        text = f"Songs {self.position + 1} to {self.position + len(page)}: {songs}."
+        if len(self.buffered) > self.page_size:
+            return text + " Say more for the next page."
+        return text + " That's all the songs."
+
+LOCAL_BROWSER = CatalogBrowser()
+
+def prefetch_speech(text):
+    """Synthesize text into the TTS cache ahead of time"""
+    try:
+        synthesize_speech(text)
+    except Exception as e:
+        print(f"TTS prefetch failed: {e}")
+
+# Replies to "more or stop?" that just end the listing
+LISTING_STOP_WORDS = {"stop", "no", "enough", "done", "exit", "quit", "no thanks", "that's enough"}
+# Any other reply is a new command: main() runs it as the next turn once
+# the current one is over, with the prefetcher that heard it
+FOLLOW_UP = {"command": None, "prefetcher": None}
+
+def take_follow_up():
+    """Return (and clear) the pending follow-up command and its prefetcher"""
+    command, prefetcher = FOLLOW_UP["command"], FOLLOW_UP["prefetcher"]
+    FOLLOW_UP.update(command=None, prefetcher=None)
+    return command, prefetcher
+
+def speak_song_pages(browser, text):
+    """Read out a listing page by page, asking for "more" between pages
+
+    Any other reply ends the listing and is queued as the next command.
+    """
+    while True:
+        if speak_with_interrupt(text):
+            browser.stop()
+            return
+        if not browser.active or not get_audio_input().supports_interrupts:
+            # Headless: the listener can still say "more songs" next turn
+            return
+        prefetcher = SpeculativePrefetcher(LOCAL_CONVERSATION) if SPECULATIVE_PREFETCH else None
+        reply = listen_with_retry("Say 'more' for the next page or 'stop'...", max_retries=1,
+                                  on_partial=prefetcher.offer_audio if prefetcher else None)
+        if not reply or not is_more_request(reply):
+            browser.stop()
+            if reply and reply.strip(" .!?").lower() not in LISTING_STOP_WORDS:
+                FOLLOW_UP.update(command=reply, prefetcher=prefetcher)
+                if prefetcher and is_local_command(reply):
+                    prefetcher.discard()
+            elif prefetcher:
+                prefetcher.discard()
+            return
+        if prefetcher:
+            prefetcher.discard()
+        text = browser.more()
+
+# ===== MUSIC ANALYSIS =====
+# Tracks are analyzed in the background (audio_features.py) so "play
+# something like ..." can pick the closest-sounding song in the catalog,
+# and every song plays at about the same loudness.
+FEATURE_ANALYSIS_ENABLED = True
+REPLAY_GAIN_ENABLED = True
+# A couple of low-priority workers, so analysis never competes with
+# recognition and speech for the CPU (the command-line tool uses them all)
+FEATURE_WORKERS = 2
+FEATURE_NICENESS = 10
+FEATURE_SHUTDOWN_SECONDS = 5.0  # how long shutdown waits for the in-progress tracks
+# The similarity index is only ever rebuilt on the analysis thread: after
+# each save, and when the store changes on disk (checked this often)
+FEATURE_REFRESH_SECONDS = 30.0
+FEATURE_ANALYSIS = {"thread": None, "stop": threading.Event()}
+SIMILAR_PATTERN = re.compile(r"play (?:something|anything|songs?|music|a song) (?:like|similar to) (?P<name>.+)")
+FEATURE_INDEX_LOCK = threading.Lock()
+FEATURE_INDEX_CACHE = {"version": None, "index": None}
+
+def parse_similar_command(command):
+    """Return the song named in "play something like ...", or None"""
+    match = SIMILAR_PATTERN.search(command.lower().strip(" .!?"))
+    return match.group("name").strip() if match else None
+
+def get_feature_index():
+    """Return the current similarity index (None until one is loaded)
+
+    Only reads the cached reference; the analysis thread swaps in new ones.
+    """
+    return FEATURE_INDEX_CACHE["index"]
+
+def refresh_feature_index(store=None):
+    """Rebuild the similarity index if the stored features changed
+
+    store, if given, is the feature store that was just saved, so it
+    doesn't have to be read back from disk.
+    """
+    features_file = audio_features.features_path_for(MUSIC_DATABASE_FILE)
+    try:
+        version = os.stat(features_file).st_mtime_ns
+    except OSError:
+        return
+    with FEATURE_INDEX_LOCK:
+        if FEATURE_INDEX_CACHE["version"] == version:
+            return
+        try:
+            if store is None:
+                store = audio_features.load_feature_store(features_file)
+            index = audio_features.FeatureIndex(store)
+        except ImportError:
+            index = None
+        FEATURE_INDEX_CACHE["version"] = version
+        FEATURE_INDEX_CACHE["index"] = index
+
+def track_gain(file_path):
+    """Loudness gain (dB) to play file_path with, if it has been analyzed
+
+    Only reads the in-memory index, so it adds nothing to playback start.
+    """
+    if not REPLAY_GAIN_ENABLED:
+        return None
+    index = get_feature_index()
+    if index is None:
+        return None
+    try:
+        return index.gain_for(file_path, os.stat(file_path).st_mtime_ns)
+    except OSError:
+        return None
+
+def analyze_music_library():
+    """Bring the stored audio features and gains up to date with the catalog"""
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        print("Install numpy to enable 'play something like ...' and volume levelling.")
+        return
+    start = time.perf_counter()
+    try:
+        analyzed, failed = audio_features.analyze_catalog(
+            get_music_database(), audio_features.features_path_for(MUSIC_DATABASE_FILE), FEATURE_WORKERS,
+            stop_event=FEATURE_ANALYSIS["stop"], niceness=FEATURE_NICENESS, on_save=refresh_feature_index)
+    except Exception as e:
+        print(f"Music analysis failed: {e}")
+        return
+    if analyzed or failed:
+        print(f"Analyzed {analyzed} songs ({failed} failed) in {time.perf_counter() - start:.1f}s.")
+
+def run_music_analysis():
+    """Analysis thread: load the index, analyze new songs, then pick up outside changes"""
+    stop_event = FEATURE_ANALYSIS["stop"]
+    try:
+        refresh_feature_index()
+        if FEATURE_ANALYSIS_ENABLED:
+            analyze_music_library()
+        while not stop_event.wait(FEATURE_REFRESH_SECONDS):
+            refresh_feature_index()
+    except Exception as e:
+        print(f"Music analysis thread failed: {e}")
+
+def start_music_analysis():
+    """Run run_music_analysis() in a background thread"""
+    thread = threading.Thread(target=run_music_analysis, name="music-analysis", daemon=True)
+    FEATURE_ANALYSIS["stop"].clear()
+    FEATURE_ANALYSIS["thread"] = thread
+    thread.start()
+    return thread
+
+def stop_music_analysis():
+    """Cancel the remaining analysis and let it save what it has done"""
+    thread = FEATURE_ANALYSIS["thread"]
+    if thread is None:
+        return
+    FEATURE_ANALYSIS["stop"].set()
+    thread.join(FEATURE_SHUTDOWN_SECONDS)
+    if thread.is_alive():
+        print("Music analysis did not stop in time; unsaved songs will be analyzed again next time.")
+    FEATURE_ANALYSIS["thread"] = None
+
+def find_similar_song(song_name):
+    """Return (song_info, message) for the song that sounds most like song_name"""
+    seed = search_song(song_name)
+    if seed is None:
+        return None, "Song is not available in the database."
+    index = get_feature_index()
+    if index is None or seed["file_path"] not in index.rows:
+        return None, f"I haven't listened to {seed['title']} yet. Try again in a little while."
+    database = get_music_database()
+    for key, file_path, similarity in index.similar_to(seed["file_path"], count=10):
+        song_info = database.get(key)
+        if song_info is not None and song_info["file_path"] == file_path:
+            print(f"{song_info['title']} is {similarity:.2f} similar to {seed['title']}")
+            return song_info, f"Here is something like {seed['title']}: {song_info['title']} by {song_info['artist']}"
+    return None, f"I don't know any other songs like {seed['title']} yet."
+
+# ===== CONVERSATIONS =====
+# Follow-up questions reuse Ollama's returned context tokens, so only the
+# new question has to be processed. A conversation is dropped after
+# CONVERSATION_IDLE_SECONDS of silence; when its context grows past
+# CONVERSATION_TOKEN_BUDGET it restarts from a short text recap of the
+# last CONVERSATION_RECAP_TURNS exchanges.
+CONVERSATION_TOKEN_BUDGET = 2048
+CONVERSATION_IDLE_SECONDS = 120
+CONVERSATION_RECAP_TURNS = 2
+CONVERSATION_STATS_LOCK = threading.Lock()
+# context_trimmed: a context outgrew the budget and was replaced by a
+# recap; sessions_evicted: a whole conversation was dropped from the store
+CONVERSATION_STATS = {"turns": 0, "context_reused": 0, "recaps": 0, "context_trimmed": 0,
+                      "sessions_evicted": 0, "expired": 0, "prompt_tokens": 0}
+
+def count_conversation(**counts):
+    with CONVERSATION_STATS_LOCK:
+        for name, value in counts.items():
+            CONVERSATION_STATS[name] += value
+
+class ConversationSession:
+    """Conversation state carried between turns: Ollama context plus a short recap"""
+
+    def __init__(self, session_id="local"):
+        self.session_id = session_id
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget the conversation and start over"""
+        self.context = None
+        self.endpoint = None
+        self.history = collections.deque(maxlen=CONVERSATION_RECAP_TURNS)
+        self.last_used = time.time()
+
+    def build_prompt(self, question):
+        """Prompt text for the next turn (with a recap if the context was evicted)"""
+        if self.context is None and self.history:
+            recap = "\n".join(f"User: {asked}\nAssistant: {answered}" for asked, answered in self.history)
+            return f"Please answer briefly. Conversation so far:\n{recap}\nUser: {question}"
+        return f"Please answer briefly: {question}"
+
+    def prepare(self, question):
+        """Start a turn: return the prompt and context to send for question"""
+        with self.lock:
+            if time.time() - self.last_used > CONVERSATION_IDLE_SECONDS and (self.context or self.history):
+                count_conversation(expired=1)
+                self.reset()
+            return {"question": question, "prompt": self.build_prompt(question),
+                    "context": self.context, "endpoint": self.endpoint,
+                    "recap": self.context is None and bool(self.history)}
+
+    def commit(self, turn, result):
+        """Finish a turn with Ollama's result; return the answer text"""
+        with self.lock:
+            self.last_used = time.time()
+            count_conversation(turns=1, prompt_tokens=result.get("prompt_eval_count") or 0,
+                               context_reused=1 if turn["context"] else 0, recaps=1 if turn["recap"] else 0)
+            if not result["ok"]:
+                return result["response"]
+
+            self.history.append((turn["question"], result["response"]))
+            context = result.get("context")
+            if context and len(context) <= CONVERSATION_TOKEN_BUDGET:
+                self.context = context
+                self.endpoint = result.get("endpoint")
+            else:
+                if context:
+                    count_conversation(context_trimmed=1)
+                self.context = None
+                self.endpoint = None
+            return result["response"]
+
+    def ask(self, question, priority=None):
+        """Ask a question in this conversation and return the answer"""
+        turn = self.prepare(question)
+        return self.commit(turn, request_llama3(turn["prompt"], turn["context"], priority, turn["endpoint"]))
+
+class ConversationStore:
+    """Conversations by session id; least recently used ones are evicted"""
+
+    def __init__(self, max_sessions=1000):
+        self.max_sessions = max_sessions
+        self.lock = threading.Lock()
+        self.sessions = collections.OrderedDict()
+
+    def get(self, session_id):
+        with self.lock:
+            conversation = self.sessions.get(session_id)
+            if conversation is None:
+                conversation = ConversationSession(session_id)
+                self.sessions[session_id] = conversation
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+                    count_conversation(sessions_evicted=1)
+            self.sessions.move_to_end(session_id)
+            return conversation
+
+    def discard(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+LOCAL_CONVERSATION = ConversationSession()
+
+def conversation_stats():
+    with CONVERSATION_STATS_LOCK:
+        return dict(CONVERSATION_STATS)
+
+def llama3_request_key(prompt, context=None):
+    """Dispatcher key: requests coalesce only if prompt and context both match"""
+    key = normalize_prompt(prompt)
+    if context:
+        key += f"|{len(context)}:{hash(tuple(context))}"
+    return key
+
+def request_llama3(prompt, context=None, priority=None, endpoint=None):
+    """Send a prompt (continuing context, if given) through the shared dispatcher
+
+    endpoint names the Ollama endpoint that produced the context, if known.
+    """
+    return get_llm_dispatcher().request(prompt, priority, key=llama3_request_key(prompt, context),
+                                        args=(context, endpoint))
+
+def ask_llama3(prompt, priority=None, conversation=None):
+    """Ask Llama 3 through the shared dispatcher
+
+    Identical questions already in flight share one request, and at most
+    LLM_MAX_CONCURRENCY requests per Ollama endpoint run at once. With a
+    conversation, follow-up questions continue from the previous answer.
+    """
+    if priority is None:
+        priority = get_llm_dispatcher().priority_for(prompt)
+    if conversation is not None:
+        return conversation.ask(prompt, priority)
+    return request_llama3(f"Please answer briefly: {prompt}", None, priority)["response"]
+
+def generate_llama3(prompt, context=None, endpoint=None):
+    """Send one request to Ollama (the least busy healthy endpoint)
+
+    Returns a dict with the answer (or an error message) as "response",
+    "ok", Ollama's returned "context" tokens and prompt token count, and
+    the "endpoint" that answered.
+    """
     data = {
-        "model": "llama3",
-        "prompt": f"Please answer briefly: {prompt}",
+        "prompt": prompt,
         "stream": False,
         "options": {
             "temperature": 0.7,
             "max_tokens": 150
         }
     }
+    if context:
+        data["context"] = context
     try:
         print(f"Sending to Llama 3: {prompt}")
-        response = requests.post(url, json=data, timeout=30)
-        print(f"Response status: {response.status_code}")
+        chosen, response = get_ollama_pool().generate(data, prefer=endpoint)
+        print(f"Response status: {response.status_code} from {chosen.name}")
         
         if response.status_code == 200:
             json_data = response.json()
             result = json_data.get("response") or json_data.get("message") or "No valid response from Llama 3."
             print(f"Llama 3 result: {result}")
-            return result
+            if json_data.get("prompt_eval_duration"):
+                record_stage("llm_prompt_eval", json_data["prompt_eval_duration"] / 1e9)
+            return {"ok": True, "response": result, "context": json_data.get("context"),
+                    "prompt_eval_count": json_data.get("prompt_eval_count"), "endpoint": chosen.name}
         else:
-            return f"Sorry, I couldn't get a response from Llama 3. Status code: {response.status_code}"
+            return {"ok": False, "response": f"Sorry, I couldn't get a response from Llama 3. Status code: {response.status_code}"}
     except requests.exceptions.ConnectionError:
-        return "Error: Could not connect to Ollama. Make sure it's running with 'ollama serve' or 'ollama run llama3'."
+        return {"ok": False, "response": "Error: Could not connect to Ollama. Make sure it's running with 'ollama serve' or 'ollama run llama3'."}
     except requests.exceptions.Timeout:
-        return "Error: Request to Ollama timed out. The model might be loading."
+        return {"ok": False, "response": "Error: Request to Ollama timed out. The model might be loading."}
+    except NoHealthyEndpoint as e:
+        return {"ok": False, "response": f"Sorry, I couldn't get a response from Llama 3. {e}"}
     except Exception as e:
         print(f"Llama 3 communication error: {e}")
-        return f"Error communicating with Llama 3: {e}"
+        return {"ok": False, "response": f"Error communicating with Llama 3: {e}"}
+
+# ===== SPECULATIVE PREFETCH =====
+SPECULATION_STATS_LOCK = threading.Lock()
+SPECULATION_STATS = {"partials": 0, "partials_failed": 0, "started": 0, "hits": 0, "misses": 0,
+                     "cancelled": 0, "wasted": 0, "saved_seconds": 0.0}
+PARTIAL_RECOGNITION_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="partial-stt")
+
+def count_speculation(**counts):
+    with SPECULATION_STATS_LOCK:
+        for name, value in counts.items():
+            SPECULATION_STATS[name] += value
+
+def speculation_stats():
+    """Speculation counters plus hit rate"""
+    with SPECULATION_STATS_LOCK:
+        stats = dict(SPECULATION_STATS)
+    resolved = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / resolved if resolved else 0.0
+    return stats
+
+def is_local_command(command):
+    """True for commands answered without Llama 3 (music, database, exit...)"""
+    return (command.startswith(("play ", "add song ", "remove song "))
+            or any(phrase in command for phrase in ["list songs", "show songs", "stop music", "stop song",
+                                                    "pause music", "new conversation", "start over",
+                                                    "forget that", "stop", "exit", "quit"])
+            or (LOCAL_BROWSER.active and is_more_request(command)))
+
+class PartialTrigger:
+    """Decides when the audio captured so far is worth a partial recognition
+
+    A partial is taken every SPECULATIVE_PARTIAL_SECONDS, and as soon as the
+    speaker pauses (the final transcript usually matches that one).
+    """
+
+    def __init__(self, recognizer, on_partial):
+        self.recognizer = recognizer
+        self.on_partial = on_partial
+        self.next_offer = SPECULATIVE_PARTIAL_SECONDS
+        self.offered_pause = False
+
+    def update(self, audio_seconds, quiet_after_speech, make_audio):
+        offer = False
+        if quiet_after_speech and not self.offered_pause:
+            self.offered_pause = True
+            offer = True
+        elif not quiet_after_speech:
+            self.offered_pause = False
+        if audio_seconds >= self.next_offer:
+            self.next_offer = audio_seconds + SPECULATIVE_PARTIAL_SECONDS
+            offer = True
+        if offer:
+            self.on_partial(make_audio(), self.recognizer)
+
+def chunk_rms(frame_data):
+    samples = array.array("h", frame_data[:len(frame_data) - len(frame_data) % SAMPLE_WIDTH])
+    if not samples:
+        return 0.0
+    return (sum(sample * sample for sample in samples) / len(samples)) ** 0.5
+
+class SpeculativePrefetcher:
+    """Starts the Llama 3 request from partial transcripts of the command
+
+    If the final transcript matches the last speculation, its answer (or
+    the request already in progress) is used; otherwise the speculation is
+    cancelled if still queued, or its result discarded if already running.
+    """
+
+    def __init__(self, conversation=None):
+        self.conversation = conversation
+        self.lock = threading.Lock()
+        self.sequence = itertools.count()
+        self.latest = -1
+        self.current = None
+        self.closed = False
+
+    def offer_audio(self, audio_data, recognizer):
+        """Recognize partial audio in the background and speculate on the result"""
+        sequence = next(self.sequence)
+        count_speculation(partials=1)
+        
+        def recognize():
+            try:
+                hypothesis = recognize_speech(recognizer, audio_data, speculative=True)
+            except sr.UnknownValueError:
+                # Normal for a few words cut off mid-sentence
+                return
+            except Exception as e:
+                count_speculation(partials_failed=1)
+                print(f"Partial recognition failed: {e}")
+                return
+            self.offer(hypothesis, sequence)
+        PARTIAL_RECOGNITION_POOL.submit(recognize)
+
+    def offer(self, hypothesis, sequence=None):
+        """Speculatively start the LLM request for a partial transcript"""
+        text = normalize_prompt(hypothesis)
+        if not text or is_local_command(text):
+            return
+        with self.lock:
+            if self.closed or (sequence is not None and sequence < self.latest):
+                return
+            if sequence is not None:
+                self.latest = sequence
+            if self.current is not None and self.current["text"] == text:
+                return
+            self._cancel_current()
+            if self.conversation is not None:
+                turn = self.conversation.prepare(text)
+            else:
+                turn = {"question": text, "prompt": f"Please answer briefly: {text}", "context": None}
+            dispatcher = get_llm_dispatcher()
+            key = llama3_request_key(turn["prompt"], turn["context"])
+            future = dispatcher.submit(turn["prompt"], dispatcher.priority_for(text), key=key,
+                                       args=(turn["context"], turn.get("endpoint")))
+            speculation = {"text": text, "turn": turn, "key": key, "future": future,
+                           "submitted": time.perf_counter(), "done": None}
+            future.add_done_callback(lambda _: speculation.__setitem__("done", time.perf_counter()))
+            self.current = speculation
+        count_speculation(started=1)
+        print(f"Speculating on: {text}")
+
+    def _cancel_current(self):
+        if self.current is None:
+            return
+        if get_llm_dispatcher().cancel(self.current["key"], self.current["future"]):
+            count_speculation(cancelled=1)
+        else:
+            count_speculation(wasted=1)
+        self.current = None
+
+    def answer(self, command, priority=None):
+        """Answer the final command, reusing the speculation if it matches"""
+        final_at = time.perf_counter()
+        text = normalize_prompt(command)
+        with self.lock:
+            self.closed = True
+            speculation = self.current
+            if speculation is not None and speculation["text"] != text:
+                self._cancel_current()
+                speculation = None
+            self.current = None
+        
+        if speculation is None:
+            count_speculation(misses=1)
+            return ask_llama3(command, priority, self.conversation)
+        
+        try:
+            result = speculation["future"].result()
+        except CancelledError:
+            count_speculation(misses=1)
+            return ask_llama3(command, priority, self.conversation)
+        done = speculation["done"] or time.perf_counter()
+        saved = max(0.0, min(final_at, done) - speculation["submitted"])
+        count_speculation(hits=1, saved_seconds=saved)
+        record_stage("speculation_saved", saved)
+        if self.conversation is not None:
+            return self.conversation.commit(speculation["turn"], result)
+        return result["response"]
 
-def listen_with_retry(prompt="Listening...", max_retries=3):
-    """Listen for command with retry mechanism"""
+    def discard(self):
+        """The command didn't need Llama 3: drop any speculation"""
+        with self.lock:
+            self.closed = True
+            self._cancel_current()
+
+def collect_streamed_phrase(recognizer, chunks, sample_rate, sample_width, on_partial):
+    """Join sr.Recognizer.listen(stream=True) chunks, taking partials along the way"""
+    trigger = PartialTrigger(recognizer, on_partial)
+    frames = bytearray()
+    heard_speech = False
+    for chunk in chunks:
+        frames.extend(chunk.frame_data)
+        quiet = chunk_rms(chunk.frame_data) <= recognizer.energy_threshold
+        heard_speech = heard_speech or not quiet
+        trigger.update(len(frames) / (sample_rate * sample_width), heard_speech and quiet,
+                       lambda: sr.AudioData(bytes(frames), sample_rate, sample_width))
+    return sr.AudioData(bytes(frames), sample_rate, sample_width)
+
+def answer_command(command, prefetcher=None):
+    """Run one command: music and database commands first, then Llama 3
+
+    The prefetcher, if any, is the one that listened to the command.
+    """
+    with timed_stage("process_command"):
+        command_handled = process_command(command)
+    if command_handled:
+        return
+    print(f"Processing command with Llama 3: {command}")
+    with timed_stage("llm"):
+        if prefetcher:
+            response = prefetcher.answer(command)
+        else:
+            response = ask_llama3(command, conversation=LOCAL_CONVERSATION)
+    
+    # Speak with interrupt capability
+    with timed_stage("speak"):
+        was_interrupted = speak_with_interrupt(response)
+    
+    if was_interrupted:
+        print("Response was interrupted.")
+    else:
+        print("Response completed.")
+
+def listen_with_retry(prompt="Listening...", max_retries=3, on_partial=None):
+    """Listen for command with retry mechanism
+
+    on_partial(audio_data, recognizer), if given, receives the audio heard
+    so far while the command is still being spoken.
+    """
     r = sr.Recognizer()
     
     # Optimize microphone settings
@@ -240,23 +1278,17 @@ def listen_with_retry(prompt="Listening...", max_retries=3):
     r.dynamic_energy_threshold = True
     r.pause_threshold = 0.8
     
+    audio_input = get_audio_input()
     for attempt in range(max_retries):
         try:
-            with sr.Microphone() as source:
-                print(f"{prompt} (Attempt {attempt + 1}/{max_retries})")
-                
-                # Adjust for ambient noise
-                print("Adjusting for ambient noise...")
-                r.adjust_for_ambient_noise(source, duration=0.5)
-                print("Ready to listen!")
-                
-                audio = r.listen(source, timeout=8, phrase_time_limit=8)
-                print("Audio captured, processing...")
-                
-                command = r.recognize_google(audio)
-                print(f"You said: {command}")
-                return command.lower()
-                
+            print(f"{prompt} (Attempt {attempt + 1}/{max_retries})")
+            audio = audio_input.listen_for_command(r, timeout=8, phrase_time_limit=8, on_partial=on_partial)
+            print("Audio captured, processing...")
+            
+            command = recognize_speech(r, audio)
+            print(f"You said: {command}")
+            return command.lower()
+            
         except sr.WaitTimeoutError:
             print(f"Attempt {attempt + 1}: No speech detected, trying again...")
             continue
@@ -270,17 +1302,63 @@ def listen_with_retry(prompt="Listening...", max_retries=3):
     print("Failed to capture command after all attempts.")
     return ""
 
-def listen_for_interrupt():
-    """Listen for interrupt command while speech is playing"""
+# The interrupt listener's microphone reads come back empty once it is
+# told to stop, which ends its listen within one buffer. Anything that
+# opens a microphone waits for it first, so two streams are never open.
+INTERRUPT_LISTEN_TIMEOUT = 2
+INTERRUPT_PHRASE_SECONDS = 2
+INTERRUPT_LISTENER = {"thread": None, "stop": None}
+
+class StoppableStream:
+    """Wraps an sr.Microphone stream so reads end (come back empty) once stop_event is set"""
+
+    def __init__(self, stream, stop_event):
+        self.stream = stream
+        self.stop_event = stop_event
+
+    def read(self, size):
+        if self.stop_event.is_set():
+            return b""
+        return self.stream.read(size)
+
+    def close(self):
+        self.stream.close()
+
+def wait_for_interrupt_listener():
+    """Stop the last interrupt listener and wait until it has closed its microphone"""
+    thread, stop_event = INTERRUPT_LISTENER["thread"], INTERRUPT_LISTENER["stop"]
+    if thread is None:
+        return
+    stop_event.set()
+    if thread.is_alive():
+        thread.join()
+    INTERRUPT_LISTENER["thread"] = INTERRUPT_LISTENER["stop"] = None
+
+def listen_for_interrupt(stop_event=None):
+    """Listen for interrupt command while speech is playing (until stop_event is set)"""
     r = sr.Recognizer()
     r.energy_threshold = 3000
+    stop_event = stop_event or threading.Event()
     
-    with sr.Microphone() as source:
-        while True:
+    def stopped():
+        return stop_event.is_set()
+    
+    print("Say 'stop' to interrupt...")
+    with get_audio_input().microphone() as source:
+        source.stream = StoppableStream(source.stream, stop_event)
+        while not stopped():
             try:
-                print("Say 'stop' to interrupt...")
-                audio = r.listen(source, timeout=2, phrase_time_limit=2)
-                command = r.recognize_google(audio).lower()
+                frames = bytearray()
+                for chunk in r.listen(source, timeout=INTERRUPT_LISTEN_TIMEOUT,
+                                      phrase_time_limit=INTERRUPT_PHRASE_SECONDS, stream=True):
+                    frames.extend(chunk.frame_data)
+                    if stopped():
+                        break
+                if stopped():
+                    # The speech is over; there is nothing left to interrupt
+                    break
+                audio = sr.AudioData(bytes(frames), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+                command = recognize_speech(r, audio).lower()
                 print(f"Interrupt heard: {command}")
                 if any(word in command for word in ["stop", "exit", "quit"]):
                     return True
@@ -291,6 +1369,7 @@ def listen_for_interrupt():
             except Exception as e:
                 print(f"Interrupt listening error: {e}")
                 continue
+    return False
 
 def speak_with_interrupt(text):
     """Speak text and allow interruption - no file saving"""
@@ -301,15 +1380,28 @@ def speak_with_interrupt(text):
     if player is None:
         return False
     
+    # Without a live microphone there is nobody to interrupt us
+    if not get_audio_input().supports_interrupts:
+        player.wait()
+        stop_speaking(player, temp_filename)
+        return False
+    
     # Start listening for interrupt in a separate thread
+    wait_for_interrupt_listener()
     interrupt_event = threading.Event()
-    interrupt_thread = threading.Thread(target=lambda: interrupt_event.set() if listen_for_interrupt() else None)
+    speech_done = threading.Event()
+    interrupt_thread = threading.Thread(
+        target=lambda: interrupt_event.set() if listen_for_interrupt(speech_done) else None,
+        name="interrupt-listener")
     interrupt_thread.daemon = True
     interrupt_thread.start()
+    INTERRUPT_LISTENER.update(thread=interrupt_thread, stop=speech_done)
     
     # Wait for speech to finish or interrupt
     while player.poll() is None and not interrupt_event.is_set():
         time.sleep(0.1)
+    # The listener's next microphone read ends its listen
+    speech_done.set()
     
     # If interrupted, stop the speech
     if interrupt_event.is_set():
@@ -320,159 +1412,574 @@ def speak_with_interrupt(text):
         stop_speaking(player, temp_filename)
         return False
 
+# ===== AUDIO DEVICES =====
+# The chosen input device is remembered (by name) so the next start can
+# open it directly instead of probing every device.
+AUDIO_PROFILE_FILE = "audio_device_profile.json"
+AUDIO_FRAMES_PER_BUFFER = 1024
+# A dead device can hang inside PortAudio; give up on it after this long.
+AUDIO_OPEN_TIMEOUT = 2.0
+# Consecutive read errors after which the device is treated as unplugged
+# and another one is selected (retried at most every AUDIO_RESELECT_SECONDS)
+AUDIO_MAX_READ_FAILURES = 3
+AUDIO_RESELECT_SECONDS = 5.0
+# Captured audio waiting for the wake-word engine; when full, the oldest
+# audio is dropped (and counted) so detection never falls far behind. It
+# is flushed after every turn, so the assistant never hears its own replies.
+CAPTURE_QUEUE_SECONDS = 30
+# How long read_frame waits for captured audio before reporting a stall
+CAPTURE_STALL_TIMEOUT = 1.0
+
+def load_audio_profile():
+    """Load the saved device profile (empty if there is none yet)"""
+    try:
+        with open(AUDIO_PROFILE_FILE, 'r') as file:
+            profile = json.load(file)
+        if isinstance(profile.get("devices"), dict):
+            return profile
+    except (OSError, ValueError):
+        pass
+    return {"devices": {}, "last_device": None}
+
+def save_audio_profile(profile):
+    """Save the device profile, replacing the old file in one step"""
+    try:
+        temp_path = AUDIO_PROFILE_FILE + ".tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(profile, file, indent=4)
+        os.replace(temp_path, AUDIO_PROFILE_FILE)
+    except Exception as e:
+        print(f"Error saving audio device profile: {e}")
+
+def remember_audio_device(device_name):
+    """Record the device that worked so the next start can use it directly
+
+    Only the device is remembered: the stream always runs at Porcupine's
+    SAMPLE_RATE with AUDIO_FRAMES_PER_BUFFER, which PortAudio either
+    accepts as-is or refuses.
+    """
+    profile = load_audio_profile()
+    profile["devices"][device_name] = {"last_used": time.time()}
+    profile["last_device"] = device_name
+    save_audio_profile(profile)
+
+def preferred_device_names(profile):
+    """Profiled device names, most recently used first"""
+    devices = profile["devices"]
+    return sorted(devices, key=lambda name: devices[name].get("last_used", 0), reverse=True)
+
+def list_input_devices(pa, verbose=True):
+    """Return [(index, device_info)] for every device with input channels"""
+    device_count = pa.get_device_count()
+    if verbose:
+        print(f"Found {device_count} audio devices:")
+    
+    input_devices = []
+    for i in range(device_count):
+        try:
+            device_info = pa.get_device_info_by_index(i)
+            if device_info['maxInputChannels'] > 0:
+                input_devices.append((i, device_info))
+                if verbose:
+                    print(f"  {i}: {device_info['name']} (Input channels: {device_info['maxInputChannels']})")
+        except Exception as e:
+            if verbose:
+                print(f"  {i}: Error getting device info: {e}")
+    return input_devices
+
+def open_input_stream(pa, device_id, sample_rate=SAMPLE_RATE, frames_per_buffer=AUDIO_FRAMES_PER_BUFFER,
+                      timeout=None, stream_callback=None):
+    """Open an input stream, raising TimeoutError if the device hangs"""
+    timeout = AUDIO_OPEN_TIMEOUT if timeout is None else timeout
+    result = {}
+    finished = threading.Event()
+    
+    def open_stream():
+        try:
+            result["stream"] = pa.open(
+                rate=sample_rate,
+                channels=1,
+                format=pyaudio.paInt16,
+                input=True,
+                input_device_index=device_id,
+                frames_per_buffer=frames_per_buffer,
+                stream_callback=stream_callback
+            )
+        except Exception as e:
+            result["error"] = e
+        finished.set()
+        # If we already gave up on this device, don't leak its stream
+        if result.get("abandoned") and "stream" in result:
+            result["stream"].close()
+    
+    threading.Thread(target=open_stream, daemon=True).start()
+    if not finished.wait(timeout):
+        result["abandoned"] = True
+        raise TimeoutError(f"device did not open within {timeout:g}s")
+    if "error" in result:
+        raise result["error"]
+    return result["stream"]
+
+def open_profiled_device(pa, input_devices, profile, stream_callback=None):
+    """Fast path: open the most recently used profiled device that is present"""
+    devices_by_name = {device_info['name']: (device_id, device_info) for device_id, device_info in input_devices}
+    for name in preferred_device_names(profile):
+        if name not in devices_by_name:
+            continue
+        device_id, device_info = devices_by_name[name]
+        try:
+            stream = open_input_stream(pa, device_id, stream_callback=stream_callback)
+            print(f"Selected device from profile: {name}")
+            return stream, device_id, device_info
+        except Exception as e:
+            print(f"Profiled device {name} failed: {e}")
+    return None, None, None
+
+def probe_input_devices(pa, input_devices, stream_callback=None):
+    """Slow path: test devices one by one (non-iPhone first) and return the first that works"""
+    # First, try to find a device that's not iPhone Microphone; then any device
+    candidates = [device for device in input_devices if 'iphone' not in device[1]['name'].lower()]
+    candidates += [device for device in input_devices if device not in candidates]
+    for device_id, device_info in candidates:
+        try:
+            stream = open_input_stream(pa, device_id, stream_callback=stream_callback)
+            print(f"Selected device: {device_info['name']}")
+            return stream, device_id, device_info
+        except Exception as e:
+            print(f"Device {device_info['name']} failed: {e}")
+            continue
+    return None, None, None
+
+def open_audio_device(pa, verbose=True, stream_callback=None):
+    """Open the wake-word stream, preferring the saved profile over a full probe
+
+    With stream_callback the stream runs in PyAudio callback mode.
+
+    Returns (stream, device_id, device_name); stream is None if nothing works.
+    """
+    input_devices = list_input_devices(pa, verbose)
+    if not input_devices:
+        print("No input devices found!")
+        return None, None, None
+    
+    stream, device_id, device_info = open_profiled_device(pa, input_devices, load_audio_profile(),
+                                                          stream_callback)
+    if stream is None:
+        stream, device_id, device_info = probe_input_devices(pa, input_devices, stream_callback)
+    if stream is None:
+        print("No working input device found!")
+        return None, None, None
+    
+    remember_audio_device(device_info['name'])
+    return stream, device_id, device_info['name']
+
 def initialize_audio():
     """Initialize audio with error handling and device selection"""
     try:
         pa = pyaudio.PyAudio()
+        audio_stream, _, _ = open_audio_device(pa)
+        if audio_stream is None:
+            pa.terminate()
+            return None, None
         
-        # List all available devices
-        device_count = pa.get_device_count()
-        print(f"Found {device_count} audio devices:")
+        print("Audio stream initialized successfully!")
+        return pa, audio_stream
         
-        input_devices = []
-        for i in range(device_count):
+    except Exception as e:
+        print(f"Audio initialization error: {e}")
+        return None, None
+
+# ===== AUDIO INPUT SOURCES =====
+class MicrophoneInput:
+    """Live input: PyAudio stream for the wake word, sr.Microphone for commands
+
+    The wake-word stream runs in PyAudio callback mode: PortAudio's own
+    capture thread (real-time priority on most platforms) hands every
+    buffer to a bounded queue, so audio keeps being captured while the
+    main thread is busy speaking, asking Llama 3 or playing music.
+    """
+    supports_interrupts = True
+    exits_on_command = True
+
+    def __init__(self):
+        self.pa = None
+        self.audio_stream = None
+        self.device_index = None
+        self.device_name = None
+        self.read_failures = 0
+        self.last_reselect = 0.0
+        self.stream_lock = threading.Lock()
+        max_blocks = max(1, int(CAPTURE_QUEUE_SECONDS * SAMPLE_RATE / AUDIO_FRAMES_PER_BUFFER))
+        self.capture_queue = queue.Queue(maxsize=max_blocks)
+        self.pending = array.array("h")
+        self.stats_lock = threading.Lock()
+        self.stats = {"frames_captured": 0, "overflows": 0, "dropped_frames": 0,
+                      "flushed_frames": 0, "max_queue_depth": 0, "stalls": 0}
+
+    def _capture_callback(self, in_data, frame_count, time_info, status_flags):
+        """Runs on PortAudio's capture thread: queue the buffer, never block"""
+        dropped = 0
+        try:
+            self.capture_queue.put_nowait(in_data)
+        except queue.Full:
+            # Drop the oldest buffer so the wake-word engine stays current
             try:
-                device_info = pa.get_device_info_by_index(i)
-                if device_info['maxInputChannels'] > 0:
-                    input_devices.append((i, device_info))
-                    print(f"  {i}: {device_info['name']} (Input channels: {device_info['maxInputChannels']})")
-            except Exception as e:
-                print(f"  {i}: Error getting device info: {e}")
+                dropped = len(self.capture_queue.get_nowait()) // SAMPLE_WIDTH
+            except queue.Empty:
+                pass
+            try:
+                self.capture_queue.put_nowait(in_data)
+            except queue.Full:
+                dropped += frame_count
+        with self.stats_lock:
+            self.stats["frames_captured"] += frame_count
+            self.stats["dropped_frames"] += dropped
+            if status_flags & pyaudio.paInputOverflow:
+                self.stats["overflows"] += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.capture_queue.qsize())
+        return (None, pyaudio.paContinue)
+
+    def capture_stats(self):
+        """Return capture counters: frames, overflows, drops and queue depth"""
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats["queue_depth"] = self.capture_queue.qsize()
+        stats["queue_capacity"] = self.capture_queue.maxsize
+        stats["device"] = self.device_name
+        return stats
+
+    def open(self):
+        try:
+            self.pa = pyaudio.PyAudio()
+            self.audio_stream, self.device_index, self.device_name = open_audio_device(
+                self.pa, stream_callback=self._capture_callback)
+        except Exception as e:
+            print(f"Audio initialization error: {e}")
+            return False
+        if self.audio_stream is None:
+            return False
+        print("Audio stream initialized successfully!")
+        return True
+
+    def reselect_device(self):
+        """Re-open the wake-word stream on the best available device
+
+        Called from read_frame, on the thread that owns the audio: PortAudio
+        initialization isn't thread-safe, and only a fresh one sees new devices.
+        """
+        self.last_reselect = time.monotonic()
+        with self.stream_lock:
+            self._close_stream()
+            # A fresh PortAudio instance is needed to see new devices
+            self.pa = pyaudio.PyAudio()
+            self.audio_stream, self.device_index, self.device_name = open_audio_device(
+                self.pa, verbose=False, stream_callback=self._capture_callback)
+            self.read_failures = 0
+        if self.audio_stream is None:
+            print("No working input device after re-selection; will retry.")
+        else:
+            print(f"Now listening on: {self.device_name}")
+
+    def read_frame(self, frame_length):
+        """Return the next frame of 16-bit samples for the wake-word engine"""
+        while len(self.pending) < frame_length:
+            try:
+                block = self.capture_queue.get(timeout=CAPTURE_STALL_TIMEOUT)
+            except queue.Empty:
+                self.read_failures += 1
+                with self.stats_lock:
+                    self.stats["stalls"] += 1
+                if (self.read_failures >= AUDIO_MAX_READ_FAILURES
+                        and time.monotonic() - self.last_reselect >= AUDIO_RESELECT_SECONDS):
+                    print("Re-selecting input device (device stopped responding)...")
+                    self.reselect_device()
+                raise IOError("No audio captured (device stalled or unplugged)")
+            self.pending.frombytes(block)
+        self.read_failures = 0
+        frame = tuple(self.pending[:frame_length])
+        del self.pending[:frame_length]
+        return frame
+
+    def flush(self):
+        """Discard audio captured during a turn (our own speech, music) before listening for the wake word again"""
+        flushed = len(self.pending)
+        del self.pending[:]
+        while True:
+            try:
+                flushed += len(self.capture_queue.get_nowait()) // SAMPLE_WIDTH
+            except queue.Empty:
+                break
+        with self.stats_lock:
+            self.stats["flushed_frames"] += flushed
+        return flushed
+
+    def microphone(self):
+        """Return an sr.Microphone on the selected input device"""
+        return sr.Microphone(device_index=self.device_index)
+
+    def listen_for_command(self, recognizer, timeout, phrase_time_limit, on_partial=None):
+        """Record one spoken command and return it as sr.AudioData"""
+        wait_for_interrupt_listener()
+        with self.microphone() as source:
+            # Adjust for ambient noise
+            print("Adjusting for ambient noise...")
+            recognizer.adjust_for_ambient_noise(source, duration=0.5)
+            print("Ready to listen!")
+            if on_partial is None:
+                return recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+            chunks = recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit, stream=True)
+            return collect_streamed_phrase(recognizer, chunks, source.SAMPLE_RATE, source.SAMPLE_WIDTH, on_partial)
+
+    def _close_stream(self):
+        try:
+            if self.audio_stream:
+                self.audio_stream.stop_stream()
+                self.audio_stream.close()
+        except Exception as e:
+            print(f"Error closing audio stream: {e}")
+        if self.pa:
+            self.pa.terminate()
+        self.audio_stream = None
+        self.pa = None
+
+    def close(self):
+        with self.stream_lock:
+            self._close_stream()
+
+class CommandEndpointer:
+    """Collects command audio until a pause after speech or the phrase time limit
+
+    Used wherever command audio arrives as raw samples instead of through
+    sr.Microphone (replayed recordings, server sessions).
+    """
+    chunk_samples = int(SAMPLE_RATE * 0.03)
+
+    def __init__(self, energy_threshold, pause_threshold, phrase_time_limit):
+        self.energy_threshold = energy_threshold
+        self.silence_limit = int(SAMPLE_RATE * pause_threshold)
+        self.max_samples = int(SAMPLE_RATE * phrase_time_limit)
+        self.captured = array.array("h")
+        self.heard_speech = False
+        self.silent_samples = 0
+        self.done = False
+
+    def feed(self, samples):
+        """Add samples; return True once the command is complete"""
+        for start in range(0, len(samples), self.chunk_samples):
+            if self.done:
+                break
+            chunk = samples[start:start + self.chunk_samples]
+            self.captured.extend(chunk)
+            rms = (sum(sample * sample for sample in chunk) / len(chunk)) ** 0.5
+            if rms > self.energy_threshold:
+                self.heard_speech = True
+                self.silent_samples = 0
+            elif self.heard_speech:
+                self.silent_samples += len(chunk)
+                if self.silent_samples >= self.silence_limit:
+                    self.done = True
+            if len(self.captured) >= self.max_samples:
+                self.done = True
+        return self.done
+
+    def audio_data(self):
+        """Return the captured command as sr.AudioData"""
+        return sr.AudioData(self.captured.tobytes(), SAMPLE_RATE, SAMPLE_WIDTH)
+
+class WavReplayInput:
+    """Headless input that replays recorded sessions from WAV files
+
+    Each file is one session (wake word followed by a command) recorded as
+    16 kHz mono 16-bit PCM, like the live stream. Frames are served as fast
+    as the pipeline asks for them unless realtime=True.
+    """
+    supports_interrupts = False
+    # "stop"/"exit" in a recording only ends that session, not the replay run
+    exits_on_command = False
+
+    def __init__(self, wav_paths, realtime=False):
+        self.wav_paths = list(wav_paths)
+        self.realtime = realtime
+        self.samples = array.array("h")
+        self.position = 0
+        self.next_file = 0
+        self.files_replayed = 0
+        self.samples_replayed = 0
+        self.started = None
+
+    def open(self):
+        self.started = time.perf_counter()
+        return bool(self.wav_paths)
+
+    def _load_next_file(self):
+        """Load the next valid WAV file; raise EOFError when none are left"""
+        while self.next_file < len(self.wav_paths):
+            path = self.wav_paths[self.next_file]
+            self.next_file += 1
+            try:
+                with wave.open(path, "rb") as wav_file:
+                    if (wav_file.getframerate() != SAMPLE_RATE or wav_file.getnchannels() != 1
+                            or wav_file.getsampwidth() != SAMPLE_WIDTH):
+                        print(f"Skipping {path}: expected 16 kHz mono 16-bit WAV")
+                        continue
+                    self.samples = array.array("h", wav_file.readframes(wav_file.getnframes()))
+            except (OSError, wave.Error) as e:
+                print(f"Skipping {path}: {e}")
+                continue
+            self.position = 0
+            self.files_replayed += 1
+            print(f"Replaying session {self.files_replayed}: {path}")
+            return
+        raise EOFError("No more recordings to replay")
+
+    def _take(self, count):
+        """Take up to count samples from the current recording"""
+        chunk = self.samples[self.position:self.position + count]
+        self.position += len(chunk)
+        self.samples_replayed += len(chunk)
+        if self.realtime:
+            time.sleep(len(chunk) / SAMPLE_RATE)
+        return chunk
+
+    def read_frame(self, frame_length):
+        """Return the next wake-word frame, moving on to the next file when needed"""
+        while len(self.samples) - self.position < frame_length:
+            self._load_next_file()
+        return tuple(self._take(frame_length))
+
+    def flush(self):
+        """Nothing to discard: recordings don't contain the assistant's own speech"""
+        return 0
+
+    def end_session(self):
+        """Skip the rest of the current recording"""
+        self.position = len(self.samples)
+
+    def listen_for_command(self, recognizer, timeout, phrase_time_limit, on_partial=None):
+        """Return the rest of the current session as the command, ending on silence
+
+        Like sr.Recognizer.listen, gives up if no speech starts within
+        timeout seconds of recorded audio.
+        """
+        endpointer = CommandEndpointer(recognizer.energy_threshold, recognizer.pause_threshold,
+                                       phrase_time_limit)
+        trigger = PartialTrigger(recognizer, on_partial) if on_partial else None
+        while self.position < len(self.samples):
+            if endpointer.feed(self._take(endpointer.chunk_samples)):
+                break
+            if (timeout is not None and not endpointer.heard_speech
+                    and len(endpointer.captured) >= timeout * SAMPLE_RATE):
+                break
+            if trigger:
+                trigger.update(len(endpointer.captured) / SAMPLE_RATE,
+                               endpointer.heard_speech and endpointer.silent_samples > 0,
+                               endpointer.audio_data)
+        if not endpointer.heard_speech:
+            raise sr.WaitTimeoutError("No speech in the replayed recording")
+        return endpointer.audio_data()
+
+    def close(self):
+        elapsed = time.perf_counter() - (self.started or time.perf_counter())
+        audio_seconds = self.samples_replayed / SAMPLE_RATE
+        speedup = audio_seconds / elapsed if elapsed > 0 else 0.0
+        print(f"Replayed {self.files_replayed} sessions, {audio_seconds:.1f}s of audio "
+              f"in {elapsed:.1f}s ({speedup:.1f}x real time).")
+
+AUDIO_INPUT = None
+
+def get_audio_input():
+    """Return the active audio input source (the live microphone by default)"""
+    global AUDIO_INPUT
+    if AUDIO_INPUT is None:
+        AUDIO_INPUT = MicrophoneInput()
+    return AUDIO_INPUT
+
+def play_and_listen(song_name, song_info=None):
+    """Play a song, then listen for "stop music" until it ends"""
+    result = play_song(song_name, song_info)
+    
+    # Handle the return value properly
+    if isinstance(result, tuple) and len(result) == 3:
+        # Success case: (True, player, message)
+        success, player, message = result
+        print(message)
         
-        if not input_devices:
-            print("No input devices found!")
-            return None, None
+        # Speak the confirmation
+        speak_with_interrupt(message)
         
-        # Try to find a working device
-        working_device = None
+        # Without a live microphone, just let the song finish
+        if not get_audio_input().supports_interrupts:
+            player.wait()
+            return True
         
-        # First, try to find a device that's not iPhone Microphone
-        for device_id, device_info in input_devices:
-            if 'iphone' not in device_info['name'].lower():
-                try:
-                    # Test this device
-                    test_stream = pa.open(
-                        rate=16000,
-                        channels=1,
-                        format=pyaudio.paInt16,
-                        input=True,
-                        input_device_index=device_id,
-                        frames_per_buffer=1024
-                    )
-                    test_stream.close()
-                    working_device = device_id
-                    print(f"Selected device: {device_info['name']}")
-                    break
-                except Exception as e:
-                    print(f"Device {device_info['name']} failed: {e}")
-                    continue
+        # Listen for stop command while music is playing - IMPROVED VERSION
+        print("Say 'stop music' to stop the song...")
+        r = sr.Recognizer()
+        r.energy_threshold = 3000  # Lower threshold for better detection
         
-        # If no non-iPhone device works, try iPhone device
-        if working_device is None:
-            for device_id, device_info in input_devices:
+        wait_for_interrupt_listener()
+        stopped = False
+        with get_audio_input().microphone() as source:
+            # Adjust for ambient noise
+            r.adjust_for_ambient_noise(source, duration=0.5)
+            
+            while player.poll() is None:  # While music is playing
                 try:
-                    test_stream = pa.open(
-                        rate=16000,
-                        channels=1,
-                        format=pyaudio.paInt16,
-                        input=True,
-                        input_device_index=device_id,
-                        frames_per_buffer=1024
-                    )
-                    test_stream.close()
-                    working_device = device_id
-                    print(f"Selected device: {device_info['name']}")
-                    break
+                    print("Listening for stop command...")
+                    audio = r.listen(source, timeout=3, phrase_time_limit=3)
+                    stop_command = recognize_speech(r, audio).lower()
+                    print(f"Heard: {stop_command}")
+                    
+                    if any(phrase in stop_command for phrase in ["stop music", "stop song", "pause music", "stop"]):
+                        print("Stop command detected!")
+                        stop_music(player)
+                        stopped = True
+                        break
+                        
+                except sr.WaitTimeoutError:
+                    # No speech detected, continue listening
+                    continue
+                except sr.UnknownValueError:
+                    # Could not understand speech, continue listening
+                    continue
                 except Exception as e:
-                    print(f"Device {device_info['name']} failed: {e}")
+                    print(f"Error listening for stop command: {e}")
                     continue
         
-        if working_device is None:
-            print("No working input device found!")
-            return None, None
-        
-        # Create the actual audio stream
-        audio_stream = pa.open(
-            rate=16000,
-            channels=1,
-            format=pyaudio.paInt16,
-            input=True,
-            input_device_index=working_device,
-            frames_per_buffer=1024
-        )
-        
-        print("Audio stream initialized successfully!")
-        return pa, audio_stream
-        
-    except Exception as e:
-        print(f"Audio initialization error: {e}")
-        return None, None
+        # Only once our microphone is closed: this starts an interrupt listener
+        if stopped:
+            speak_with_interrupt("Music stopped.")
+        return True  # Command was handled
+    
+    elif isinstance(result, tuple) and len(result) == 2:
+        # Error case: (False, error_message)
+        success, error_message = result
+        print(error_message)
+        speak_with_interrupt(error_message)
+        return True  # Command was handled
+    
+    else:
+        # Unexpected return format
+        print("Unexpected return format from play_song")
+        return True  # Command was handled
 
 def process_command(command):
     """Process user commands including music requests - FIXED VERSION with better music control"""
     command_lower = command.lower()
     
     # Check for music commands
-    if command_lower.startswith("play "):
+    if parse_similar_command(command_lower) is not None:
+        song_info, message = find_similar_song(parse_similar_command(command_lower))
+        print(message)
+        if song_info is None:
+            speak_with_interrupt(message)
+            return True
+        return play_and_listen(song_info["title"], song_info)
+    
+    elif command_lower.startswith("play "):
         song_name = command_lower[5:].strip()  # Remove "play " from the beginning
         print(f"Searching for song: {song_name}")
-        
-        result = play_song(song_name)
-        
-        # Handle the return value properly
-        if isinstance(result, tuple) and len(result) == 3:
-            # Success case: (True, player, message)
-            success, player, message = result
-            print(message)
-            
-            # Speak the confirmation
-            speak_with_interrupt(message)
-            
-            # Listen for stop command while music is playing - IMPROVED VERSION
-            print("Say 'stop music' to stop the song...")
-            r = sr.Recognizer()
-            r.energy_threshold = 3000  # Lower threshold for better detection
-            
-            with sr.Microphone() as source:
-                # Adjust for ambient noise
-                r.adjust_for_ambient_noise(source, duration=0.5)
-                
-                while player.poll() is None:  # While music is playing
-                    try:
-                        print("Listening for stop command...")
-                        audio = r.listen(source, timeout=3, phrase_time_limit=3)
-                        stop_command = r.recognize_google(audio).lower()
-                        print(f"Heard: {stop_command}")
-                        
-                        if any(phrase in stop_command for phrase in ["stop music", "stop song", "pause music", "stop"]):
-                            print("Stop command detected!")
-                            stop_music(player)
-                            speak_with_interrupt("Music stopped.")
-                            return True
-                            
-                    except sr.WaitTimeoutError:
-                        # No speech detected, continue listening
-                        continue
-                    except sr.UnknownValueError:
-                        # Could not understand speech, continue listening
-                        continue
-                    except Exception as e:
-                        print(f"Error listening for stop command: {e}")
-                        continue
-            
-            return True  # Command was handled
-        
-        elif isinstance(result, tuple) and len(result) == 2:
-            # Error case: (False, error_message)
-            success, error_message = result
-            print(error_message)
-            speak_with_interrupt(error_message)
-            return True  # Command was handled
-        
-        else:
-            # Unexpected return format
-            print("Unexpected return format from play_song")
-            return True  # Command was handled
+        return play_and_listen(song_name)
     
     # Check for music management commands
     elif command_lower.startswith("add song "):
@@ -480,23 +1987,37 @@ def process_command(command):
         parts = command_lower[9:].split("|")
         if len(parts) == 4:
             song_name, title, artist, file_path = parts
-            add_song_to_database(song_name.strip(), title.strip(), artist.strip(), file_path.strip())
-            speak_with_interrupt(f"Added {title} to database.")
+            if add_song_to_database(song_name.strip(), title.strip(), artist.strip(), file_path.strip()):
+                speak_with_interrupt(f"Added {title} to database.")
+            else:
+                speak_with_interrupt("Sorry, I couldn't save the music database.")
         else:
             speak_with_interrupt("Please use format: add song song_name|title|artist|file_path")
         return True
     
     elif command_lower.startswith("remove song "):
         song_name = command_lower[12:].strip()
-        if remove_song_from_database(song_name):
+        removed = remove_song_from_database(song_name)
+        if removed is None:
+            speak_with_interrupt("Sorry, I couldn't save the music database.")
+        elif removed:
             speak_with_interrupt(f"Removed {song_name} from database.")
         else:
             speak_with_interrupt(f"Song {song_name} not found in database.")
         return True
     
-    elif "list songs" in command_lower or "show songs" in command_lower:
-        song_list = list_available_songs()
-        speak_with_interrupt(song_list)
+    elif parse_listing_command(command_lower) is not None:
+        artist, letter = parse_listing_command(command_lower)
+        speak_song_pages(LOCAL_BROWSER, LOCAL_BROWSER.start(artist, letter))
+        return True
+    
+    elif LOCAL_BROWSER.active and is_more_request(command_lower):
+        speak_song_pages(LOCAL_BROWSER, LOCAL_BROWSER.more())
+        return True
+    
+    elif any(phrase in command_lower for phrase in ["new conversation", "start over", "forget that"]):
+        LOCAL_CONVERSATION.reset()
+        speak_with_interrupt("Okay, starting a new conversation.")
         return True
     
     # Check for stop music commands
@@ -508,78 +2029,248 @@ def process_command(command):
     # For all other commands, use Llama 3
     return False
 
-def main():
+# ===== STARTUP =====
+GREETING_TEXT = "Hello, I am your voice assistant. Say Hi Bloom to activate me."
+WAKE_ACK_TEXT = "Hi Bloom detected! What can I help you with?"
+# Phrases synthesized in the background at startup so they play instantly
+COMMON_PHRASES = [GREETING_TEXT, WAKE_ACK_TEXT, "Goodbye!", "Music stopped.",
+                  "No music is currently playing."]
+STARTUP_REPORT = {}
+
+class StartupTask:
+    """Runs one independent startup step in a background thread and times it"""
+
+    def __init__(self, name, func, startup_started):
+        self.name = name
+        self.func = func
+        self.startup_started = startup_started
+        self.result = None
+        self.error = None
+        self.seconds = None
+        self.finished_at = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"startup-{name}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self.result = self.func()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.seconds = time.perf_counter() - start
+            self.finished_at = time.perf_counter() - self.startup_started
+            record_stage(f"startup_{self.name}", self.seconds)
+            self.done.set()
+
+    def wait(self, timeout=None):
+        """Wait for the step; return its result or raise its error"""
+        self.done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+def create_porcupine():
+    """Create the Porcupine wake-word engine for the custom wake word"""
+    if not os.path.exists(CUSTOM_WAKEWORD_PATH):
+        raise FileNotFoundError(f"Wake word file '{CUSTOM_WAKEWORD_PATH}' not found!")
+    return pvporcupine.create(
+        access_key=ACCESS_KEY,
+        keyword_paths=[CUSTOM_WAKEWORD_PATH]
+    )
+
+def warm_up_llm():
+    """Ask every Ollama endpoint to load its model now so the first question doesn't wait for it"""
+    return get_ollama_pool().warm_up()
+
+def warm_up_tts():
+    """Synthesize the common phrases into the TTS cache"""
+    for phrase in COMMON_PHRASES:
+        synthesize_speech(phrase)
+    return len(COMMON_PHRASES)
+
+def preload_backends():
+    """Import the speech recognition backend before the first command needs it"""
+    return sr.Recognizer is not None
+
+class Greeting:
+    """The startup greeting, played in the background
+
+    Only the greeting itself is synthesized first, not the whole TTS
+    warm-up. A wake word heard before it starts playing cancels it; while
+    it plays the wake-word loop ignores detections, since the greeting
+    says "Hi Bloom" itself.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.playing = False
+        self.thread = threading.Thread(target=self._run, name="greeting", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        try:
+            synthesize_speech(GREETING_TEXT)
+        except Exception as e:
+            print(f"TTS Error: {e}")
+            return
+        with self.lock:
+            if self.cancelled:
+                return
+            self.playing = True
+        try:
+            player, temp_filename = speak(GREETING_TEXT)
+            if player is not None:
+                player.wait()
+                stop_speaking(player, temp_filename)
+        finally:
+            with self.lock:
+                self.playing = False
+
+    def claim_wake(self):
+        """On a wake word: False while the greeting plays, else cancel it if it hasn't started"""
+        with self.lock:
+            if self.playing:
+                return False
+            self.cancelled = True
+            return True
+
+def report_startup(tasks, live_at):
+    """Wait for every startup step, then print the startup-time breakdown"""
+    for task in tasks.values():
+        task.done.wait()
+    STARTUP_REPORT.clear()
+    STARTUP_REPORT["wake_loop_live_seconds"] = live_at
+    STARTUP_REPORT["steps"] = {}
+    print("=== Startup time breakdown ===")
+    print(f"  {'step':<12}{'took':>8}{'done at':>10}  status")
+    for task in sorted(tasks.values(), key=lambda task: task.finished_at):
+        status = "ok" if task.error is None else f"failed: {task.error}"
+        STARTUP_REPORT["steps"][task.name] = {"seconds": task.seconds, "finished_at": task.finished_at,
+                                              "ok": task.error is None}
+        print(f"  {task.name:<12}{task.seconds:>7.2f}s{task.finished_at:>9.2f}s  {status}")
+    print(f"  Wake-word loop was live after {live_at:.2f}s")
+
+def main(audio_input=None):
+    global AUDIO_INPUT
+    if audio_input is not None:
+        AUDIO_INPUT = audio_input
+    audio_input = get_audio_input()
+    
     print("=== Voice Assistant with Custom 'Hi Bloom' Wake Word ===")
     print("Make sure Ollama is running with: ollama run llama3")
     print("No response files will be saved - using temporary files only")
     print("Music feature: Say 'play [song name]' to play music")
     print("Database management: 'add song', 'remove song', 'list songs'")
     
-    # Load music database
-    music_db = load_music_database()
-    print(f"Loaded {len(music_db)} songs from database.")
-    
-    # Check if wake word file exists
-    if not os.path.exists(CUSTOM_WAKEWORD_PATH):
-        print(f"Error: Wake word file '{CUSTOM_WAKEWORD_PATH}' not found!")
-        print("Please make sure the .ppn file is in the same directory as this script.")
-        return
+    # Independent startup steps run concurrently; only Porcupine and the
+    # audio input are needed before the wake-word loop can start.
+    startup_started = time.perf_counter()
+    tasks = {}
+    for name, func in [("porcupine", create_porcupine), ("audio", audio_input.open),
+                       ("catalog", get_music_database), ("llm_warmup", warm_up_llm),
+                       ("tts_warmup", warm_up_tts), ("imports", preload_backends)]:
+        tasks[name] = StartupTask(name, func, startup_started).start()
     
     # Initialize Porcupine with custom wake word
     try:
-        porcupine = pvporcupine.create(
-            access_key=ACCESS_KEY,
-            keyword_paths=[CUSTOM_WAKEWORD_PATH]
-        )
+        porcupine = tasks["porcupine"].wait()
         print("Porcupine initialized successfully!")
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        print("Please make sure the .ppn file is in the same directory as this script.")
+        tasks["audio"].done.wait()
+        if tasks["audio"].result:
+            audio_input.close()
+        return
     except Exception as e:
         print(f"Error initializing Porcupine: {e}")
         print("Please check your AccessKey and wake word file.")
+        tasks["audio"].done.wait()
+        if tasks["audio"].result:
+            audio_input.close()
         return
     
     # Initialize audio with better error handling
-    pa, audio_stream = initialize_audio()
-    if pa is None or audio_stream is None:
+    try:
+        audio_ready = tasks["audio"].wait()
+    except Exception as e:
+        print(f"Audio initialization error: {e}")
+        audio_ready = False
+    if not audio_ready:
         print("Failed to initialize audio. Exiting.")
+        porcupine.delete()
         return
     
-    # Test TTS
-    print("Testing speech synthesis...")
-    test_player, test_filename = speak("Hello, I am your voice assistant. Say Hi Bloom to activate me.")
-    if test_player:
-        test_player.wait()
-        stop_speaking(test_player, test_filename)
+    live_at = time.perf_counter() - startup_started
+    threading.Thread(target=report_startup, args=(tasks, live_at), daemon=True).start()
     
+    # Greet in the background once the speech is ready
+    greeting = Greeting().start()
+    heard_greeting = False
+    start_music_analysis()
+    
+    get_resource_monitor()
     print("Say 'Hi Bloom' to activate the assistant...")
     
     try:
         while True:
             # Read audio with error handling
             try:
-                pcm = audio_stream.read(porcupine.frame_length, exception_on_overflow=False)
-                pcm = struct.unpack_from("h" * porcupine.frame_length, pcm)
+                pcm = audio_input.read_frame(porcupine.frame_length)
+            except EOFError:
+                print("Replay finished.")
+                break
             except Exception as e:
                 print(f"Audio read error: {e}")
                 continue
             
+            # Don't let the greeting ("Say Hi Bloom ...") wake us up
+            if greeting.playing:
+                heard_greeting = True
+                continue
+            if heard_greeting:
+                heard_greeting = False
+                audio_input.flush()
+                continue
+            
             # Process with Porcupine
             keyword_index = porcupine.process(pcm)
             
-            if keyword_index >= 0:
+            if keyword_index >= 0 and greeting.claim_wake():
+                turn_start = time.perf_counter()
                 print("Wake word detected! Listening for your command...")
-                wake_player, wake_filename = speak("Hi Bloom detected! What can I help you with?")
-                if wake_player:
-                    wake_player.wait()
-                    stop_speaking(wake_player, wake_filename)
+                with timed_stage("wake_ack"):
+                    wake_player, wake_filename = speak(WAKE_ACK_TEXT)
+                    if wake_player:
+                        wake_player.wait()
+                        stop_speaking(wake_player, wake_filename)
                 
                 # Wait a moment
-                time.sleep(1)
+                time.sleep(WAKE_ACK_PAUSE)
                 
                 # Listen for command with retry mechanism
-                command = listen_with_retry("What would you like to know?")
+                prefetcher = SpeculativePrefetcher(LOCAL_CONVERSATION) if SPECULATIVE_PREFETCH else None
+                with timed_stage("listen"):
+                    command = listen_with_retry("What would you like to know?",
+                                                on_partial=prefetcher.offer_audio if prefetcher else None)
+                
+                if prefetcher and (not command or is_local_command(command)):
+                    prefetcher.discard()
                 
                 if not command:
                     print("No command heard, going back to wake word...")
+                    record_stage("turn", time.perf_counter() - turn_start)
+                    record_turn()
+                    audio_input.flush()
                     continue
                     
                 if any(word in command for word in ["stop", "exit", "quit"]):
@@ -587,38 +2278,68 @@ def main():
                     if goodbye_player:
                         goodbye_player.wait()
                         stop_speaking(goodbye_player, goodbye_filename)
-                    break
-                
-                # Process command (check for music first, then Llama 3)
-                command_handled = process_command(command)
-                
-                if not command_handled:
-                    # If not a music command, use Llama 3
-                    print(f"Processing command with Llama 3: {command}")
-                    response = ask_llama3(command)
-                    
-                    # Speak with interrupt capability
-                    was_interrupted = speak_with_interrupt(response)
-                    
-                    if was_interrupted:
-                        print("Response was interrupted.")
-                    else:
-                        print("Response completed.")
+                    if audio_input.exits_on_command:
+                        break
+                    # A replayed session said goodbye: go on with the next one
+                    audio_input.end_session()
+                    record_stage("turn", time.perf_counter() - turn_start)
+                    record_turn()
+                    continue
                 
+                # Process command (check for music first, then Llama 3); a
+                # reply to a prompt during the turn is the next turn
+                while command:
+                    answer_command(command, prefetcher)
+                    record_stage("turn", time.perf_counter() - turn_start)
+                    record_turn()
+                    command, prefetcher = take_follow_up()
+                    turn_start = time.perf_counter()
+                # What the microphone picked up during the turn includes our
+                # own replies; don't let the wake-word engine hear them.
+                audio_input.flush()
                 print("Say 'Hi Bloom' to activate again.")
                 
     except KeyboardInterrupt:
         print("\nShutting down...")
     finally:
         try:
-            if audio_stream:
-                audio_stream.stop_stream()
-                audio_stream.close()
-            if pa:
-                pa.terminate()
+            audio_input.close()
             porcupine.delete()
         except Exception as e:
             print(f"Cleanup error: {e}")
+        stop_music_analysis()
+        stop_all_players()
+        remove_speech_temp_files()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bloom music voice assistant")
+    parser.add_argument("--replay", nargs="+", metavar="WAV",
+                        help="headless mode: replay recorded sessions (WAV files or folders) instead of the microphone")
+    parser.add_argument("--realtime", action="store_true",
+                        help="pace the replay at real-time speed")
+    parser.add_argument("--playback", action="store_true",
+                        help="play speech and music during a replay (off by default)")
+    parser.add_argument("--speculative", action="store_true",
+                        help="start asking Llama 3 from partial transcripts (more recognition requests)")
+    return parser.parse_args(argv)
+
+def collect_wav_files(paths):
+    """Expand folders into their .wav files (sorted), keeping file arguments as-is"""
+    wav_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            wav_files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                    if name.lower().endswith(".wav")))
+        else:
+            wav_files.append(path)
+    return wav_files
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    SPECULATIVE_PREFETCH = args.speculative
+    if args.replay:
+        PLAYBACK_ENABLED = args.playback
+        WAKE_ACK_PAUSE = 0
+        main(WavReplayInput(collect_wav_files(args.replay), realtime=args.realtime))
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""
+Locked, batched edits to the JSON music database
+
+Several assistant processes can share one music_database.json:
+
+- every edit runs under an exclusive OS lock (flock on a ".lock" file next
+  to the database), so concurrent load-modify-save cycles can't lose each
+  other's writes
+- a CatalogEdit collects any number of adds, updates and removes and
+  applies them with a single rewrite, so a bulk import is one write
+  instead of one per song
+- the new database is written to a temp file and renamed over the old
+  one, so readers never see a half-written file
+- every write changes the file's (mtime, size) version; other processes
+  compare it on each lookup and remap the binary catalog as soon as it
+  differs
+- the binary catalog (music_catalog.py) is compiled once per edit, by the
+  editor while it still holds the lock, so readers never parse the JSON
+
+Usage:
+    python catalog_store.py music_database.json --import-folder Music --artist "Various"
+    python catalog_store.py music_database.json --remove "song key" "other key"
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+import music_catalog
+
+try:
+    import fcntl
+except ImportError:  # Windows: edits are still serialized within one process
+    fcntl = None
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".flac", ".ogg")
+# flock is per process, so threads of one process also need a lock
+THREAD_LOCK = threading.RLock()
+
+def lock_path_for(database_file):
+    return f"{database_file}.lock"
+
+@contextlib.contextmanager
+def database_lock(database_file):
+    """Hold the exclusive edit lock for database_file"""
+    with THREAD_LOCK:
+        if fcntl is None:
+            yield
+            return
+        with open(lock_path_for(database_file), "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def read_database(database_file):
+    """The database as a dict ({} if the file doesn't exist yet)"""
+    try:
+        with open(database_file, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+def file_version(path):
+    """(mtime_ns, size) of path, or None if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def write_database(database, database_file):
+    """Replace database_file atomically; call with the edit lock held"""
+    previous = file_version(database_file)
+    temp_path = f"{database_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "w") as file:
+            json.dump(database, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, database_file)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+    if previous is not None and file_version(database_file) == previous:
+        # Same size written within the filesystem's timestamp resolution:
+        # nudge the mtime so readers still see a new version
+        os.utime(database_file, ns=(time.time_ns(), previous[0] + 1))
+
+def compile_catalog(database, database_file):
+    """Compile the binary catalog for the database just written; call with the edit lock held
+
+    Returns False if it couldn't be written (readers then compile it themselves).
+    """
+    try:
+        music_catalog.build_catalog(database, music_catalog.catalog_path_for(database_file),
+                                    file_version(database_file))
+    except OSError as e:
+        print(f"Could not compile the music catalog: {e}")
+        return False
+    return True
+
+class CatalogEdit:
+    """A batch of changes to the database, applied in one locked rewrite"""
+
+    def __init__(self):
+        self.changes = []
+
+    def add(self, key, song_info):
+        """Add a song (or replace the song with the same key)"""
+        self.changes.append(("add", key, dict(song_info)))
+        return self
+
+    def update(self, key, **fields):
+        """Change some fields of an existing song"""
+        self.changes.append(("update", key, fields))
+        return self
+
+    def remove(self, key):
+        self.changes.append(("remove", key, None))
+        return self
+
+    def __len__(self):
+        return len(self.changes)
+
+    def apply_to(self, database):
+        """Apply the changes to a dict in order; returns the result counts"""
+        result = {"added": 0, "updated": 0, "removed": 0, "missing": [], "removed_songs": []}
+        for action, key, fields in self.changes:
+            if action == "add":
+                database[key] = fields
+                result["added"] += 1
+            elif key not in database:
+                result["missing"].append(key)
+            elif action == "update":
+                database[key] = {**database[key], **fields}
+                result["updated"] += 1
+            else:
+                result["removed"] += 1
+                result["removed_songs"].append(database.pop(key))
+        return result
+
+def apply_edit(database_file, edit):
+    """Apply a CatalogEdit to database_file under the edit lock
+
+    Re-reads the file after taking the lock, so changes made by other
+    processes in the meantime are kept. The file (and the binary catalog
+    compiled from it) is only rewritten if something changed. Returns the
+    counts from CatalogEdit.apply_to.
+    """
+    with database_lock(database_file):
+        database = read_database(database_file)
+        result = edit.apply_to(database)
+        if result["added"] or result["updated"] or result["removed"]:
+            write_database(database, database_file)
+            compile_catalog(database, database_file)
+    return result
+
+def edit_for_folder(folder, artist="Unknown Artist"):
+    """A CatalogEdit adding every audio file in folder, keyed by file name"""
+    edit = CatalogEdit()
+    for name in sorted(os.listdir(folder)):
+        stem, extension = os.path.splitext(name)
+        if extension.lower() in AUDIO_EXTENSIONS:
+            edit.add(stem.lower(), {"title": stem, "artist": artist, "file_path": os.path.join(folder, name)})
+    return edit
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Edit the music database safely while assistants are running")
+    parser.add_argument("database", nargs="?", default="music_database.json", help="JSON music database")
+    parser.add_argument("--import-folder", help="add every audio file in this folder")
+    parser.add_argument("--artist", default="Unknown Artist", help="artist for imported songs")
+    parser.add_argument("--remove", nargs="+", default=[], metavar="KEY", help="song keys to remove")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    edit = edit_for_folder(args.import_folder, args.artist) if args.import_folder else CatalogEdit()
+    for key in args.remove:
+        edit.remove(key)
+    start = time.perf_counter()
+    result = apply_edit(args.database, edit)
+    print(f"{result['added']} added, {result['updated']} updated, {result['removed']} removed, "
+          f"{len(result['missing'])} not found, in {1000 * (time.perf_counter() - start):.1f} ms")
+
+if __name__ == "__main__":
+    main()
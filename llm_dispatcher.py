@@ -0,0 +1,155 @@
+"""
+Request dispatcher for LLM calls
+
+Sits between callers and the Ollama backend:
+
+- single-flight: identical prompts that are already queued or running share
+  one request instead of each starting a new generation
+- bounded concurrency: at most max_concurrency requests run at once; the
+  rest wait in a priority queue
+- priorities: short, acknowledgement-style prompts run before long ones
+- queue wait time is reported through an optional callback
+"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+HIGH_PRIORITY = 0
+NORMAL_PRIORITY = 1
+
+def normalize_prompt(prompt):
+    """Collapse case and whitespace so trivially different prompts coalesce"""
+    return " ".join(prompt.lower().split())
+
+class LLMDispatcher:
+    """Coalesces, prioritizes and bounds concurrent calls to an LLM backend
+
+    call(prompt, *args) does the actual (blocking) request. on_queue_wait(seconds)
+    and on_generate(seconds), if given, receive timing for every request.
+    """
+
+    def __init__(self, call, max_concurrency=2, short_prompt_words=6,
+                 on_queue_wait=None, on_generate=None):
+        self.call = call
+        self.max_concurrency = max_concurrency
+        self.short_prompt_words = short_prompt_words
+        self.on_queue_wait = on_queue_wait
+        self.on_generate = on_generate
+        self.condition = threading.Condition()
+        self.queue = []
+        self.in_flight = {}
+        self.waiters = {}
+        self.sequence = itertools.count()
+        self.workers = []
+        self.stats = {"submitted": 0, "coalesced": 0, "completed": 0,
+                      "failed": 0, "cancelled": 0, "running": 0, "max_queue_depth": 0}
+
+    def priority_for(self, prompt):
+        """Short prompts (acknowledgements, yes/no) go first"""
+        if len(prompt.split()) <= self.short_prompt_words:
+            return HIGH_PRIORITY
+        return NORMAL_PRIORITY
+
+    def submit(self, prompt, priority=None, key=None, args=()):
+        """Queue a request and return a Future for its result
+
+        Requests with the same key (the normalized prompt by default) that
+        are still queued or running get the same Future back. args are
+        passed on to call() after the prompt; requests whose args differ
+        must use different keys.
+        """
+        key = key if key is not None else normalize_prompt(prompt)
+        with self.condition:
+            self.stats["submitted"] += 1
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                self.waiters[key] += 1
+                return future
+
+            future = Future()
+            self.in_flight[key] = future
+            self.waiters[key] = 1
+            if priority is None:
+                priority = self.priority_for(prompt)
+            heapq.heappush(self.queue, (priority, next(self.sequence), time.perf_counter(),
+                                        key, prompt, args, future))
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self.queue))
+            self._start_workers()
+            self.condition.notify()
+            return future
+
+    def request(self, prompt, priority=None, key=None, args=(), timeout=None):
+        """Submit a request and wait for its result"""
+        return self.submit(prompt, priority, key, args).result(timeout)
+
+    def cancel(self, key, future):
+        """Withdraw one submitter's interest in a request
+
+        The request is only cancelled once nobody else is waiting for it and
+        it has not started yet. Returns True if it was cancelled.
+        """
+        with self.condition:
+            if self.in_flight.get(key) is not future:
+                return future.cancelled()
+            self.waiters[key] -= 1
+            if self.waiters[key] > 0 or not future.cancel():
+                return False
+            self.in_flight.pop(key, None)
+            self.waiters.pop(key, None)
+            self.queue = [job for job in self.queue if job[-1] is not future]
+            heapq.heapify(self.queue)
+            self.stats["cancelled"] += 1
+            return True
+
+    def queue_depth(self):
+        with self.condition:
+            return len(self.queue)
+
+    def snapshot(self):
+        """Return the dispatcher counters plus the current queue depth"""
+        with self.condition:
+            return {**self.stats, "queue_depth": len(self.queue), "in_flight": len(self.in_flight)}
+
+    def _start_workers(self):
+        while len(self.workers) < self.max_concurrency:
+            worker = threading.Thread(target=self._work, name=f"llm-{len(self.workers)}", daemon=True)
+            self.workers.append(worker)
+            worker.start()
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                priority, _, queued_at, key, prompt, args, future = heapq.heappop(self.queue)
+                if not future.set_running_or_notify_cancel():
+                    if self.in_flight.get(key) is future:
+                        self.in_flight.pop(key, None)
+                        self.waiters.pop(key, None)
+                    continue
+                self.stats["running"] += 1
+
+            started = time.perf_counter()
+            if self.on_queue_wait:
+                self.on_queue_wait(started - queued_at)
+            try:
+                result = self.call(prompt, *args)
+            except Exception as e:
+                with self.condition:
+                    self.in_flight.pop(key, None)
+                    self.waiters.pop(key, None)
+                    self.stats["running"] -= 1
+                    self.stats["failed"] += 1
+                future.set_exception(e)
+                continue
+            if self.on_generate:
+                self.on_generate(time.perf_counter() - started)
+            with self.condition:
+                self.in_flight.pop(key, None)
+                self.waiters.pop(key, None)
+                self.stats["running"] -= 1
+                self.stats["completed"] += 1
+            future.set_result(result)
@@ -0,0 +1,219 @@
+"""
+Load test for assistant_server.py
+
+Opens an increasing number of concurrent sessions, each streaming audio at
+real-time pace, and reports the largest number of sessions the server keeps
+up with. A level is "sustained" when the p95 ping lag (how far the server's
+audio processing trails the stream) stays under --max-lag and no session
+errors out.
+
+By default the server is started in a subprocess with the benchmark's local
+stand-ins (fake Porcupine, recognizer, Ollama and null TTS) and the clients
+stream synthetic sessions: silence, a wake marker, a loud "command", silence.
+Point --url at a real server and pass --wav with a recorded session
+(16 kHz mono 16-bit, wake word + command) to test the real backends.
+
+Usage:
+    python load_test_server.py --levels 1 2 4 8 16 32 64 --duration 10
+"""
+import argparse
+import array
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import wave
+
+import websockets
+
+import benchmark_assistant
+
+CHUNK_SECONDS = 0.1
+SAMPLE_RATE = 16000
+
+# ===== STAND-IN SERVER =====
+def serve_with_stand_ins(args):
+    """Run assistant_server.py against local stand-ins (used in a subprocess)"""
+    fixture = benchmark_assistant.load_transcripts(benchmark_assistant.DEFAULT_TRANSCRIPTS_FILE)
+    fixture = [text for text in fixture if text is None or not any(
+        word in text for word in ["stop", "exit", "quit"])]
+    stand_in_args = argparse.Namespace(stt_latency=args.stt_latency, speech_pause=0.0, tts_latency=0.0)
+    benchmark_assistant.install_stand_ins(fixture, stand_in_args)
+    sys.modules["pvporcupine"] = benchmark_assistant.make_fake_porcupine(
+        wake_marker=benchmark_assistant.WAKE_MARKER_SAMPLE)
+
+    import assistant_server
+    import bloom_music_voice_assistant as assistant
+
+    benchmark_assistant.start_fake_ollama(args.ollama_port, args.llm_latency, args.token_rate,
+                                          args.response_tokens)
+    assistant.OLLAMA_URL = f"http://127.0.0.1:{args.ollama_port}/api/generate"
+    assistant.CUSTOM_WAKEWORD_PATH = "add_custom_ppn_file.ppn"
+    assistant.FEATURE_ANALYSIS_ENABLED = False
+    assistant_server.main(["--host", "127.0.0.1", "--port", str(args.port),
+                           "--wake-workers", str(args.wake_workers),
+                           "--command-workers", str(args.command_workers)])
+
+def start_stand_in_server(args):
+    """Start the stand-in server subprocess and wait until it accepts connections"""
+    command = [sys.executable, os.path.abspath(__file__), "--serve-stand-ins",
+               "--port", str(args.port), "--ollama-port", str(args.ollama_port),
+               "--llm-latency", str(args.llm_latency), "--token-rate", str(args.token_rate),
+               "--response-tokens", str(args.response_tokens), "--stt-latency", str(args.stt_latency),
+               "--wake-workers", str(args.wake_workers), "--command-workers", str(args.command_workers)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            async def probe():
+                async with websockets.connect(f"ws://127.0.0.1:{args.port}"):
+                    pass
+            asyncio.run(probe())
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Stand-in server did not start")
+
+# ===== CLIENT AUDIO =====
+def synthetic_session():
+    """One synthetic session: silence, wake marker, 1.5 s 'command', silence"""
+    samples = array.array("h", [0] * SAMPLE_RATE)
+    samples.extend([benchmark_assistant.WAKE_MARKER_SAMPLE] * 1024)
+    samples.extend(int(8000 * math.sin(2 * math.pi * 220 * i / SAMPLE_RATE))
+                   for i in range(int(1.5 * SAMPLE_RATE)))
+    samples.extend([0] * SAMPLE_RATE)
+    return samples.tobytes()
+
+def load_session_audio(wav_path):
+    """Load a recorded session, checking it matches the server's audio format"""
+    with wave.open(wav_path, "rb") as wav_file:
+        if (wav_file.getframerate() != SAMPLE_RATE or wav_file.getnchannels() != 1
+                or wav_file.getsampwidth() != 2):
+            raise ValueError(f"{wav_path}: expected 16 kHz mono 16-bit WAV")
+        return wav_file.readframes(wav_file.getnframes())
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+async def run_client(url, audio, duration, results):
+    """Stream the session audio in a loop at real-time pace, pinging every second"""
+    chunk_bytes = int(SAMPLE_RATE * CHUNK_SECONDS) * 2
+    ping_sent = {}
+    try:
+        async with websockets.connect(url, max_size=2 ** 22) as websocket:
+            async def receive():
+                async for message in websocket:
+                    if isinstance(message, str):
+                        payload = json.loads(message)
+                        if payload["type"] == "pong" and payload["id"] in ping_sent:
+                            results["lags"].append(time.perf_counter() - ping_sent.pop(payload["id"]))
+                        elif payload["type"] == "reply":
+                            results["replies"] += 1
+
+            receiver = asyncio.ensure_future(receive())
+            start = time.perf_counter()
+            sent = 0
+            next_ping = 1.0
+            while time.perf_counter() - start < duration:
+                offset = sent % len(audio)
+                await websocket.send(audio[offset:offset + chunk_bytes])
+                sent += chunk_bytes
+                stream_time = sent / 2 / SAMPLE_RATE
+                if stream_time >= next_ping:
+                    ping_id = f"{id(results)}-{next_ping}"
+                    ping_sent[ping_id] = time.perf_counter()
+                    await websocket.send(json.dumps({"type": "ping", "id": ping_id}))
+                    next_ping += 1.0
+                delay = start + stream_time - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await asyncio.sleep(1.0)
+            results["lost_pings"] += len(ping_sent)
+            await websocket.send(json.dumps({"type": "end"}))
+            receiver.cancel()
+    except Exception as e:
+        results["errors"] += 1
+        print(f"Client error: {e}")
+
+async def run_level(url, audio, sessions, duration):
+    """Run one concurrency level and return its lag/reply statistics"""
+    results = {"lags": [], "replies": 0, "errors": 0, "lost_pings": 0}
+    await asyncio.gather(*(run_client(url, audio, duration, results) for _ in range(sessions)))
+    return {
+        "sessions": sessions,
+        "p50_lag_ms": 1000 * percentile(results["lags"], 0.50),
+        "p95_lag_ms": 1000 * percentile(results["lags"], 0.95),
+        "replies": results["replies"],
+        "errors": results["errors"],
+        "lost_pings": results["lost_pings"]
+    }
+
+def run_load_test(args):
+    """Ramp through the concurrency levels until the server stops keeping up"""
+    audio = load_session_audio(args.wav) if args.wav else synthetic_session()
+    server = None
+    url = args.url
+    if url is None:
+        server = start_stand_in_server(args)
+        url = f"ws://127.0.0.1:{args.port}"
+
+    print(f"CPUs: {os.cpu_count()}, level duration: {args.duration}s, max p95 lag: {args.max_lag * 1000:.0f} ms")
+    print(f"{'sessions':>9}{'p50 lag ms':>12}{'p95 lag ms':>12}{'replies':>9}{'errors':>8}{'lost pings':>12}")
+    sustained = 0
+    levels = []
+    try:
+        for sessions in args.levels:
+            level = asyncio.run(run_level(url, audio, sessions, args.duration))
+            levels.append(level)
+            print(f"{level['sessions']:>9}{level['p50_lag_ms']:>12.1f}{level['p95_lag_ms']:>12.1f}"
+                  f"{level['replies']:>9}{level['errors']:>8}{level['lost_pings']:>12}")
+            if level["errors"] or level["lost_pings"] or level["p95_lag_ms"] > args.max_lag * 1000:
+                break
+            sustained = sessions
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print(f"Max sustained concurrent sessions: {sustained}")
+    return {"max_sustained_sessions": sustained, "levels": levels}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test for the assistant server")
+    parser.add_argument("--url", help="test an already running server instead of a stand-in one")
+    parser.add_argument("--wav", help="recorded session to stream (default: synthetic audio)")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64, 128],
+                        help="concurrent session counts to try, in order")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    parser.add_argument("--max-lag", type=float, default=0.25, help="max p95 ping lag (s) to count as sustained")
+    parser.add_argument("--port", type=int, default=18765, help="port for the stand-in server")
+    parser.add_argument("--ollama-port", type=int, default=11434, help="port for the fake Ollama server")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake Ollama time to first token (s)")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="fake Ollama tokens per second")
+    parser.add_argument("--response-tokens", type=int, default=30, help="tokens per fake Ollama answer")
+    parser.add_argument("--stt-latency", type=float, default=0.3, help="fake recognizer delay (s)")
+    parser.add_argument("--wake-workers", type=int, default=4, help="server wake-word threads")
+    parser.add_argument("--command-workers", type=int, default=16, help="server command threads")
+    parser.add_argument("--serve-stand-ins", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--json", dest="json_path", help="also write the results to this JSON file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve_stand_ins:
+        serve_with_stand_ins(args)
+        return None
+    results = run_load_test(args)
+    if args.json_path:
+        with open(args.json_path, "w") as file:
+            json.dump(results, file, indent=4)
+    return results
+
+if __name__ == "__main__":
+    main()
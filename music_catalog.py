@@ -0,0 +1,301 @@
+"""
+Compact binary music catalog
+
+music_database.json is compiled into a binary file that is memory-mapped
+instead of parsed, so opening even a very large catalog takes milliseconds
+and every assistant process on the machine shares the same pages.
+
+File layout (all integers little-endian):
+
+- header: magic, song count, the (mtime_ns, size) of the JSON file it was
+  compiled from, and an (offset, length) entry for each section below
+- strings: UTF-8 string table holding every key, title, artist, file path
+  and extra-fields JSON
+- records: one fixed-width record per song, (offset, length) pairs into
+  the string table for key, title, artist, file_path and extra fields
+- key order: record numbers sorted by key, for exact lookups
+- keys / titles / artists: search blobs, NUL-separated in record order
+  (titles and artists lowercased), each with an array of start offsets,
+  so substring searches run as one bytes.find over the mapped blob
+
+Catalog is a read-only Mapping from song key to song info, so it can be
+used anywhere the JSON dict was. Catalog.search gives the same answer as
+search_database does on the dict.
+
+Usage:
+    python music_catalog.py music_database.json
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from collections.abc import ItemsView, Mapping, ValuesView
+
+MAGIC = b"BLMCAT01"
+SECTIONS = ["strings", "records", "key_order", "keys", "key_offsets",
+            "titles", "title_offsets", "artists", "artist_offsets"]
+HEADER = struct.Struct("<8sIIqq" + "QQ" * len(SECTIONS))
+RECORD = struct.Struct("<10I")
+STANDARD_FIELDS = ("title", "artist", "file_path")
+
+def catalog_path_for(database_file):
+    """Where the compiled catalog for a JSON database lives"""
+    return os.path.splitext(database_file)[0] + ".bin"
+
+def _u32_array(values):
+    packed = array("I", values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+def _search_blob(values):
+    """NUL-separated blob plus start offsets (one extra for the end)"""
+    blob = bytearray()
+    offsets = []
+    for value in values:
+        offsets.append(len(blob))
+        blob += value
+        blob += b"\0"
+    offsets.append(len(blob))
+    return bytes(blob), _u32_array(offsets)
+
+def search_database(database, song_name):
+    """Find a song in a song dict: the matching rules Catalog.search follows
+
+    1. exact key; 2. first key containing the name or contained in it;
+    3. first song whose title or artist (lowercased) contains the name.
+    """
+    if song_name in database:
+        return database[song_name]
+    for key, song_info in database.items():
+        if song_name in key or key in song_name:
+            return song_info
+    for song_info in database.values():
+        if song_name in song_info["title"].lower() or song_name in song_info["artist"].lower():
+            return song_info
+    return None
+
+def build_catalog(database, path, source_version=(0, 0)):
+    """Compile a song dict into a binary catalog at path (atomically)"""
+    strings = bytearray()
+    interned = {}
+
+    def add_string(text):
+        encoded = text.encode("utf-8")
+        if encoded not in interned:
+            interned[encoded] = len(strings)
+            strings.extend(encoded)
+        return interned[encoded], len(encoded)
+
+    records = bytearray()
+    keys = []
+    for key, song_info in database.items():
+        extra = {name: value for name, value in song_info.items() if name not in STANDARD_FIELDS}
+        fields = [key, song_info.get("title", ""), song_info.get("artist", ""),
+                  song_info.get("file_path", ""), json.dumps(extra) if extra else ""]
+        records += RECORD.pack(*(number for text in fields for number in add_string(text)))
+        keys.append(key.encode("utf-8"))
+
+    key_order = sorted(range(len(keys)), key=keys.__getitem__)
+    keys_blob, key_offsets = _search_blob(keys)
+    titles_blob, title_offsets = _search_blob(
+        song_info.get("title", "").lower().encode("utf-8") for song_info in database.values())
+    artists_blob, artist_offsets = _search_blob(
+        song_info.get("artist", "").lower().encode("utf-8") for song_info in database.values())
+
+    sections = [bytes(strings), bytes(records), _u32_array(key_order), keys_blob, key_offsets,
+                titles_blob, title_offsets, artists_blob, artist_offsets]
+    table = []
+    offset = HEADER.size
+    for section in sections:
+        table.extend([offset, len(section)])
+        offset += len(section)
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(keys), 0, source_version[0], source_version[1], *table))
+        for section in sections:
+            file.write(section)
+    os.replace(temp_path, path)
+
+def open_catalog(path, source_version=None):
+    """Memory-map a compiled catalog
+
+    Returns None if the file is missing, not a catalog, or (when
+    source_version is given) was compiled from a different JSON file.
+    """
+    try:
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size < HEADER.size:
+                return None
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    header = HEADER.unpack_from(mapped)
+    if header[0] != MAGIC or (source_version is not None and tuple(header[3:5]) != tuple(source_version)):
+        mapped.close()
+        return None
+    return Catalog(mapped, header)
+
+class CatalogValues(ValuesView):
+    def __iter__(self):
+        return self._mapping.iter_songs()
+
+class CatalogItems(ItemsView):
+    def __iter__(self):
+        catalog = self._mapping
+        for number in range(len(catalog)):
+            yield catalog.key_at(number), catalog.song_at(number)
+
+class Catalog(Mapping):
+    """Read-only, memory-mapped song catalog (key -> song info dict)"""
+
+    def __init__(self, mapped, header):
+        self.mapped = mapped
+        self.count = header[1]
+        self.source_version = tuple(header[3:5])
+        view = memoryview(mapped)
+        self.sections = {}
+        for number, name in enumerate(SECTIONS):
+            offset, length = header[5 + 2 * number], header[6 + 2 * number]
+            self.sections[name] = (offset, length)
+        self.records = view[self._bounds("records")]
+        self.key_order = self._u32_view("key_order")
+        self.key_offsets = self._u32_view("key_offsets")
+        self.title_offsets = self._u32_view("title_offsets")
+        self.artist_offsets = self._u32_view("artist_offsets")
+
+    def _bounds(self, name):
+        offset, length = self.sections[name]
+        return slice(offset, offset + length)
+
+    def _u32_view(self, name):
+        data = memoryview(self.mapped)[self._bounds(name)]
+        if sys.byteorder == "little":
+            return data.cast("I")
+        values = array("I", data)
+        values.byteswap()
+        return values
+
+    def _string(self, offset, length):
+        start = self.sections["strings"][0] + offset
+        return self.mapped[start:start + length].decode("utf-8")
+
+    def _record(self, number):
+        return RECORD.unpack_from(self.records, number * RECORD.size)
+
+    def key_at(self, number):
+        record = self._record(number)
+        return self._string(record[0], record[1])
+
+    def song_at(self, number):
+        """Song info dict for record number"""
+        record = self._record(number)
+        song_info = {"title": self._string(record[2], record[3]),
+                     "artist": self._string(record[4], record[5]),
+                     "file_path": self._string(record[6], record[7])}
+        if record[9]:
+            song_info.update(json.loads(self._string(record[8], record[9])))
+        return song_info
+
+    def iter_songs(self):
+        for number in range(self.count):
+            yield self.song_at(number)
+
+    def find_key(self, key):
+        """Record number for an exact key, or None (binary search)"""
+        encoded = key.encode("utf-8")
+        keys_start = self.sections["keys"][0]
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            number = self.key_order[middle]
+            start = keys_start + self.key_offsets[number]
+            end = keys_start + self.key_offsets[number + 1] - 1
+            candidate = self.mapped[start:end]
+            if candidate < encoded:
+                low = middle + 1
+            elif candidate > encoded:
+                high = middle
+            else:
+                return number
+        return None
+
+    def _first_containing(self, blob_name, offsets, needle):
+        """First record whose entry in a search blob contains needle"""
+        if not self.count:
+            return None
+        start, length = self.sections[blob_name]
+        position = self.mapped.find(needle.encode("utf-8"), start, start + length)
+        if position < 0:
+            return None
+        number = bisect.bisect_right(offsets, position - start) - 1
+        # An empty needle also "matches" at the very end of the blob
+        return number if number < self.count else None
+
+    def search(self, song_name):
+        """Same matching rules, in the same order, as search_database on a dict"""
+        number = self.find_key(song_name)
+        if number is not None:
+            return self.song_at(number)
+
+        candidates = [self._first_containing("keys", self.key_offsets, song_name)]
+        substrings = {song_name[start:end] for start in range(len(song_name))
+                      for end in range(start, len(song_name) + 1)}
+        candidates.extend(self.find_key(substring) for substring in substrings)
+        candidates = [number for number in candidates if number is not None]
+        if candidates:
+            return self.song_at(min(candidates))
+
+        candidates = [self._first_containing("titles", self.title_offsets, song_name),
+                      self._first_containing("artists", self.artist_offsets, song_name)]
+        candidates = [number for number in candidates if number is not None]
+        if candidates:
+            return self.song_at(min(candidates))
+        return None
+
+    def __getitem__(self, key):
+        number = self.find_key(key)
+        if number is None:
+            raise KeyError(key)
+        return self.song_at(number)
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self.find_key(key) is not None
+
+    def __iter__(self):
+        for number in range(self.count):
+            yield self.key_at(number)
+
+    def __len__(self):
+        return self.count
+
+    def values(self):
+        return CatalogValues(self)
+
+    def items(self):
+        return CatalogItems(self)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    database_file = argv[0] if argv else "music_database.json"
+    start = time.perf_counter()
+    with open(database_file, "r") as file:
+        database = json.load(file)
+    loaded = time.perf_counter()
+    stat = os.stat(database_file)
+    path = catalog_path_for(database_file)
+    build_catalog(database, path, (stat.st_mtime_ns, stat.st_size))
+    built = time.perf_counter()
+    catalog = open_catalog(path)
+    opened = time.perf_counter()
+    print(f"{len(catalog)} songs: JSON load {1000 * (loaded - start):.1f} ms, "
+          f"compile {1000 * (built - loaded):.1f} ms, open {1000 * (opened - built):.2f} ms, "
+          f"{os.path.getsize(path)} bytes -> {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Pool of Ollama endpoints
+
+Spreads generate requests over several Ollama instances (or models):
+
+- health checks: a background thread polls each endpoint's /api/tags and
+  takes it out of rotation while it is down or doesn't have its model
+- least-outstanding routing: a request goes to the healthy endpoint with
+  the fewest requests in progress, the fastest recently on a tie
+- affinity: a follow-up with conversation context prefers the endpoint
+  that produced it (its KV cache still holds the context) unless another
+  is much faster, and never goes to an endpoint running a different model
+- per-endpoint timeouts, and on a connection error, timeout or server
+  error the request is retried on another endpoint
+"""
+import threading
+import time
+
+HEALTH_TIMEOUT = 2.0
+LATENCY_SMOOTHING = 0.3
+# Affinity holds unless the preferred endpoint is this many times slower
+# than the best one (re-processing the context elsewhere costs something)
+AFFINITY_SLACK = 2.0
+
+class OllamaEndpoint:
+    """One Ollama instance and model, with its routing state"""
+
+    def __init__(self, url, model, timeout=30.0):
+        self.url = url.rstrip("/")
+        for suffix in ("/api/generate", "/api"):
+            if self.url.endswith(suffix):
+                self.url = self.url[:-len(suffix)]
+        self.model = model
+        self.timeout = timeout
+        self.name = f"{self.model}@{self.url}"
+        self.healthy = True
+        self.outstanding = 0
+        self.latency = 0.0
+        self.stats = {"requests": 0, "failures": 0, "retried_elsewhere": 0, "health_failures": 0}
+
+    def snapshot(self):
+        return {**self.stats, "healthy": self.healthy, "outstanding": self.outstanding,
+                "latency_ms": 1000 * self.latency}
+
+class NoHealthyEndpoint(Exception):
+    """Every endpoint failed the request"""
+
+class OllamaPool:
+    """Routes Ollama requests over several endpoints
+
+    session() returns the requests.Session to use. Health checks run every
+    health_interval seconds once start_health_checks() is called.
+    """
+
+    def __init__(self, endpoints, session, health_interval=10.0):
+        self.endpoints = endpoints
+        self.session = session
+        self.health_interval = health_interval
+        self.lock = threading.Lock()
+        self.health_thread = None
+        self.stop_event = threading.Event()
+
+    def by_name(self, name):
+        for endpoint in self.endpoints:
+            if endpoint.name == name:
+                return endpoint
+        return None
+
+    def _candidates(self, prefer=None, model=None, tried=()):
+        """Endpoints to try, best first"""
+        with self.lock:
+            endpoints = [endpoint for endpoint in self.endpoints
+                         if endpoint not in tried and (model is None or endpoint.model == model)]
+            healthy = [endpoint for endpoint in endpoints if endpoint.healthy]
+            # If everything looks down, trying anyway beats refusing outright
+            endpoints = healthy or endpoints
+            ranked = sorted(endpoints, key=lambda endpoint: (endpoint.outstanding, endpoint.latency))
+            best = ranked[0] if ranked else None
+            # A latency of 0 means not measured yet, not fast: no reason to move
+            if (prefer in ranked and prefer.outstanding <= best.outstanding
+                    and (not best.latency or prefer.latency <= AFFINITY_SLACK * best.latency)):
+                ranked.remove(prefer)
+                ranked.insert(0, prefer)
+            return ranked
+
+    def generate(self, payload, prefer=None):
+        """POST payload to /api/generate on the best endpoint, failing over
+
+        payload gets the endpoint's model filled in. prefer is the name of
+        the endpoint that produced payload["context"], if any. Returns
+        (endpoint, response); HTTP errors other than 5xx/404 are returned,
+        not retried. Raises the last error if every endpoint failed.
+        """
+        preferred = self.by_name(prefer) if prefer else None
+        model = preferred.model if preferred is not None and payload.get("context") else None
+        tried = []
+        last_error = None
+        while True:
+            candidates = self._candidates(preferred, model, tried)
+            if not candidates:
+                break
+            endpoint = candidates[0]
+            with self.lock:
+                if tried:
+                    tried[-1].stats["retried_elsewhere"] += 1
+                endpoint.outstanding += 1
+                endpoint.stats["requests"] += 1
+            tried.append(endpoint)
+            start = time.perf_counter()
+            try:
+                response = self.session().post(f"{endpoint.url}/api/generate",
+                                               json={**payload, "model": endpoint.model},
+                                               timeout=endpoint.timeout)
+            except Exception as e:
+                self._failed(endpoint, start)
+                last_error = e
+                print(f"Ollama endpoint {endpoint.name} failed: {e}")
+                continue
+            finally:
+                with self.lock:
+                    endpoint.outstanding -= 1
+            if response.status_code >= 500 or response.status_code == 404:
+                self._failed(endpoint, start)
+                last_error = NoHealthyEndpoint(f"{endpoint.name} answered {response.status_code}")
+                print(f"Ollama endpoint {endpoint.name} answered {response.status_code}")
+                continue
+            self._observe(endpoint, time.perf_counter() - start)
+            return endpoint, response
+        raise last_error or NoHealthyEndpoint("no Ollama endpoints configured")
+
+    def _observe(self, endpoint, seconds):
+        with self.lock:
+            if endpoint.latency:
+                endpoint.latency += LATENCY_SMOOTHING * (seconds - endpoint.latency)
+            else:
+                endpoint.latency = seconds
+
+    def _failed(self, endpoint, start):
+        self._observe(endpoint, time.perf_counter() - start)
+        with self.lock:
+            endpoint.stats["failures"] += 1
+            # Out of rotation until the next health check passes
+            endpoint.healthy = False
+
+    def check_health(self, endpoint):
+        """GET /api/tags and mark the endpoint (un)healthy; returns the result"""
+        try:
+            response = self.session().get(f"{endpoint.url}/api/tags", timeout=HEALTH_TIMEOUT)
+            names = [model.get("name", "") for model in response.json().get("models", [])]
+            healthy = response.status_code == 200 and any(
+                name == endpoint.model or name.split(":")[0] == endpoint.model for name in names)
+        except Exception:
+            healthy = False
+        with self.lock:
+            if not healthy:
+                endpoint.stats["health_failures"] += 1
+            if healthy != endpoint.healthy:
+                print(f"Ollama endpoint {endpoint.name} is {'back' if healthy else 'down'}.")
+            endpoint.healthy = healthy
+        return healthy
+
+    def check_all(self):
+        threads = [threading.Thread(target=self.check_health, args=(endpoint,), daemon=True)
+                   for endpoint in self.endpoints]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def start_health_checks(self):
+        if self.health_thread is None:
+            self.health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+            self.health_thread.start()
+
+    def _health_loop(self):
+        while not self.stop_event.wait(self.health_interval):
+            self.check_all()
+
+    def close(self):
+        self.stop_event.set()
+
+    def warm_up(self):
+        """Ask every endpoint to load its model; returns how many answered"""
+        loaded = [0]
+
+        def load(endpoint):
+            try:
+                response = self.session().post(f"{endpoint.url}/api/generate", json={"model": endpoint.model},
+                                               timeout=max(endpoint.timeout, 60))
+                if response.status_code == 200:
+                    with self.lock:
+                        loaded[0] += 1
+                    return
+            except Exception:
+                pass
+            with self.lock:
+                endpoint.healthy = False
+
+        threads = [threading.Thread(target=load, args=(endpoint,), daemon=True) for endpoint in self.endpoints]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return loaded[0]
+
+    def snapshot(self):
+        with self.lock:
+            return {endpoint.name: endpoint.snapshot() for endpoint in self.endpoints}
@@ -0,0 +1,158 @@
+"""
+Process resource monitor
+
+Samples this process's resource use on an interval so slow leaks show up
+in the metrics long before they take the machine down:
+
+- resident memory (RSS), thread count and open file descriptors
+- child processes, counting exited ones that were never waited for
+  (zombies) separately
+- temp files whose name starts with a given prefix (count and bytes)
+
+Readings come from /proc on Linux. Elsewhere RSS falls back to the peak
+reported by getrusage, descriptors to /dev/fd and children to pgrep.
+"""
+import collections
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+METRICS = ("rss_bytes", "threads", "open_fds", "children", "zombies", "temp_files", "temp_bytes")
+
+def rss_bytes():
+    """Current resident set size (peak RSS where /proc isn't available)"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def open_fd_count():
+    for directory in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(directory))
+        except OSError:
+            continue
+    return 0
+
+def child_processes():
+    """(pid, state) for every direct child; state "Z" is an unreaped zombie"""
+    parent = os.getpid()
+    children = []
+    try:
+        pids = [name for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        pids = None
+    if pids is None:
+        try:
+            output = subprocess.run(["pgrep", "-P", str(parent)], capture_output=True, text=True).stdout
+        except OSError:
+            return []
+        return [(int(pid), "?") for pid in output.split()]
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as file:
+                # The command name is in parentheses and may contain spaces
+                fields = file.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == parent:
+            children.append((int(pid), fields[0]))
+    return children
+
+def temp_usage(prefix):
+    """(count, bytes) of files in the temp directory starting with prefix"""
+    count = size = 0
+    if not prefix:
+        return count, size
+    directory = tempfile.gettempdir()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return count, size
+    for name in names:
+        if name.startswith(prefix):
+            try:
+                size += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                continue
+            count += 1
+    return count, size
+
+def sample(temp_prefix=None):
+    """One reading of every metric"""
+    children = child_processes()
+    temp_files, temp_bytes = temp_usage(temp_prefix)
+    return {"time": time.time(), "rss_bytes": rss_bytes(), "threads": threading.active_count(),
+            "open_fds": open_fd_count(), "children": len(children),
+            "zombies": sum(1 for _, state in children if state == "Z"),
+            "temp_files": temp_files, "temp_bytes": temp_bytes}
+
+class ResourceMonitor:
+    """Samples resource use every interval seconds in a daemon thread
+
+    Keeps the last history samples. before_sample(), if given, runs ahead
+    of each reading (e.g. to reap finished child processes).
+    """
+
+    def __init__(self, interval=5.0, temp_prefix=None, history=720, before_sample=None):
+        self.interval = interval
+        self.temp_prefix = temp_prefix
+        self.before_sample = before_sample
+        self.lock = threading.Lock()
+        self.samples = collections.deque(maxlen=history)
+        self.peak = {}
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def sample(self):
+        """Take a reading now, record it and return it"""
+        if self.before_sample:
+            self.before_sample()
+        reading = sample(self.temp_prefix)
+        with self.lock:
+            self.samples.append(reading)
+            for name in METRICS:
+                self.peak[name] = max(self.peak.get(name, 0), reading[name])
+        return reading
+
+    def start(self):
+        if self.thread is None:
+            self.sample()
+            self.thread = threading.Thread(target=self._run, name="resource-monitor", daemon=True)
+            self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Resource sampling failed: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def history(self):
+        with self.lock:
+            return list(self.samples)
+
+    def snapshot(self):
+        """Latest reading, peaks, and the change since the first kept sample"""
+        with self.lock:
+            if not self.samples:
+                return {}
+            first, latest = self.samples[0], self.samples[-1]
+            return {"current": dict(latest), "peak": dict(self.peak),
+                    "growth": {name: latest[name] - first[name] for name in METRICS},
+                    "samples": len(self.samples), "interval_seconds": self.interval}
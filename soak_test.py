@@ -0,0 +1,143 @@
+"""
+Soak test for bloom_music_voice_assistant.py
+
+Runs thousands of turns through the benchmark's stand-ins (fake Ollama,
+recognizer, Porcupine and TTS) while the resource monitor samples the
+process. The audio players are real, short-lived child processes, so
+unreaped players and leftover speech temp files show up too.
+
+The run fails (exit status 1) when a resource keeps growing:
+
+- growth: the peak over the last part of the run is compared with the peak
+  just after warm-up, against a per-metric tolerance
+- shutdown: once main() returns, no player processes or speech temp files
+  may be left, and the thread count must settle back down
+
+Usage:
+    python soak_test.py --turns 3000 --interval 1
+"""
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import time
+import types
+
+import benchmark_assistant
+
+WARMUP_FRACTION = 0.2
+WINDOW_FRACTION = 0.2
+MIN_SAMPLES = 10
+
+def player_stand_in(playback_time):
+    """Popen replacement that starts a real process 'playing' for playback_time"""
+    sleep = shutil.which("sleep")
+
+    def popen(cmd, **kwargs):
+        if sleep:
+            command = [sleep, str(playback_time)]
+        else:
+            command = [sys.executable, "-c", "import sys, time; time.sleep(float(sys.argv[1]))", str(playback_time)]
+        return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    return popen
+
+def check_growth(samples, tolerances):
+    """Compare the late peak of each metric with its post-warm-up peak
+
+    Returns a list of (metric, baseline, final, growth, tolerance, ok).
+    """
+    count = len(samples)
+    start = int(count * WARMUP_FRACTION)
+    window = max(1, int(count * WINDOW_FRACTION))
+    baseline, final = samples[start:start + window], samples[-window:]
+    results = []
+    for metric, tolerance in tolerances.items():
+        baseline_peak = max(sample[metric] for sample in baseline)
+        final_peak = max(sample[metric] for sample in final)
+        growth = final_peak - baseline_peak
+        results.append((metric, baseline_peak, final_peak, growth, tolerance, growth <= tolerance))
+    return results
+
+def check_shutdown(monitor, thread_limit, settle_seconds):
+    """Sample after main() returned until threads settle (or time runs out)"""
+    deadline = time.time() + settle_seconds
+    while True:
+        reading = monitor.sample()
+        if reading["threads"] <= thread_limit or time.time() >= deadline:
+            break
+        time.sleep(0.2)
+    return [("threads", thread_limit, reading["threads"], reading["threads"] <= thread_limit),
+            ("children", 0, reading["children"], reading["children"] == 0),
+            ("temp_files", 0, reading["temp_files"], reading["temp_files"] == 0)]
+
+def run_soak(args):
+    """Run the soak and return (passed, report dict)"""
+    bench_args = benchmark_assistant.parse_args([
+        "--turns", str(args.turns), "--port", str(args.port), "--llm-latency", str(args.llm_latency),
+        "--token-rate", str(args.token_rate), "--stt-timeout", "1.0"] + (["--verbose"] if args.verbose else []))
+    modules = {}
+
+    def configure(assistant):
+        modules["assistant"] = assistant
+        assistant.RESOURCE_MONITOR_INTERVAL = args.interval
+        assistant.subprocess = types.SimpleNamespace(Popen=player_stand_in(args.playback_time),
+                                                     DEVNULL=subprocess.DEVNULL,
+                                                     TimeoutExpired=subprocess.TimeoutExpired)
+
+    summary = benchmark_assistant.run_benchmark(bench_args, configure)
+    monitor = modules["assistant"].get_resource_monitor()
+    samples = monitor.history()
+    if len(samples) < MIN_SAMPLES:
+        print(f"Only {len(samples)} resource samples; run more turns or lower --interval.")
+        return False, {"summary": summary, "samples": samples}
+
+    tolerances = {"rss_bytes": args.max_rss_growth_mb * 2 ** 20, "threads": args.max_thread_growth,
+                  "open_fds": args.max_fd_growth, "children": 4, "zombies": 2, "temp_files": 4}
+    growth = check_growth(samples, tolerances)
+    baseline_threads = next(baseline for metric, baseline, *_ in growth if metric == "threads")
+    shutdown = check_shutdown(monitor, baseline_threads + args.max_thread_growth, args.settle)
+    passed = all(result[-1] for result in growth) and all(result[-1] for result in shutdown)
+    return passed, {"summary": summary, "samples": samples, "growth": growth, "shutdown": shutdown}
+
+def print_soak_report(report):
+    summary = report["summary"]
+    print(f"Turns: {summary['turns']} in {summary['elapsed_seconds']:.1f}s "
+          f"({summary['turns_per_second']:.1f} turns/s), {len(report['samples'])} resource samples")
+    print(f"{'metric':<14}{'baseline':>12}{'final':>12}{'growth':>12}{'allowed':>12}")
+    for metric, baseline, final, growth, tolerance, ok in report.get("growth", []):
+        scale = 2 ** 20 if metric == "rss_bytes" else 1
+        print(f"{metric:<14}{baseline / scale:>12.1f}{final / scale:>12.1f}{growth / scale:>12.1f}"
+              f"{tolerance / scale:>12.1f}  {'ok' if ok else 'GROWING'}")
+    for metric, limit, value, ok in report.get("shutdown", []):
+        print(f"after exit: {metric} {value} (limit {limit})  {'ok' if ok else 'LEAKED'}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Soak test: many turns, fail on unbounded resource growth")
+    parser.add_argument("--turns", type=int, default=3000, help="number of wake-word turns to run")
+    parser.add_argument("--interval", type=float, default=1.0, help="resource sampling interval (s)")
+    parser.add_argument("--port", type=int, default=11434, help="port for the fake Ollama server")
+    parser.add_argument("--llm-latency", type=float, default=0.01, help="fake Ollama time to first token (s)")
+    parser.add_argument("--token-rate", type=float, default=2000.0, help="fake Ollama tokens per second")
+    parser.add_argument("--playback-time", type=float, default=0.0, help="how long each player process runs (s)")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=32.0, help="allowed RSS growth (MB)")
+    parser.add_argument("--max-thread-growth", type=int, default=16, help="allowed thread count growth")
+    parser.add_argument("--max-fd-growth", type=int, default=16, help="allowed open file descriptor growth")
+    parser.add_argument("--settle", type=float, default=5.0, help="time allowed for threads to exit after the run (s)")
+    parser.add_argument("--json", dest="json_path", help="also write the samples and results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="show the assistant's own output")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    passed, report = run_soak(args)
+    print_soak_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as file:
+            json.dump(report, file, indent=4)
+    print("PASS" if passed else "FAIL: resource use keeps growing")
+    return 0 if passed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""
+Speech recognition dispatcher with circuit breakers
+
+Sends recognition requests to an ordered list of backends (Google first,
+a local recognizer as the fallback):
+
+- each call is bounded by the backend's timeout; a call that runs over is
+  abandoned and counted as a failure instead of stalling the command
+- every backend has its own worker threads, and at most max_in_flight
+  calls (abandoned ones included) per backend, so a backend whose calls
+  hang can't starve the others
+- per-backend latency is tracked over a bounded window
+- a circuit breaker per backend opens after failure_threshold consecutive
+  slow or failed calls; while open the backend is skipped, and after an
+  exponentially growing backoff one trial call decides whether it closes
+  (the breaker is only consulted right before the backend is tried)
+- requests fail over to the next backend; trips and failover latency are
+  counted for the metrics
+- speculative requests (partial transcripts nobody is waiting for) only go
+  to backends whose breaker is closed, and their outcome is not recorded
+  on the breakers, so they can't trip a backend or use up its trial call
+
+"Could not understand" answers are not failures: the backend worked, so
+they are passed straight to the caller.
+"""
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+LATENCY_WINDOW = 200
+MAX_IN_FLIGHT = 4
+
+class BackendUnavailable(Exception):
+    """Every backend failed or was skipped"""
+
+class CircuitBreaker:
+    """Tracks consecutive failures of one backend and when to try it again"""
+
+    def __init__(self, failure_threshold=3, backoff_seconds=5.0, max_backoff_seconds=120.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.backoff = backoff_seconds
+        self.retry_at = 0.0
+
+    def allow(self):
+        """True if a call may go to the backend now (moves open -> half-open)"""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() >= self.retry_at:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.backoff = self.backoff_seconds
+
+    def record_failure(self):
+        """Count a slow or failed call; returns True if the breaker tripped"""
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                # The trial call failed: stay away twice as long
+                self.backoff = min(self.backoff * 2, self.max_backoff_seconds)
+            elif self.failures < self.failure_threshold:
+                return False
+            self.state = OPEN
+            self.trips += 1
+            self.retry_at = self.clock() + self.backoff
+            return True
+
+class RecognizerBackend:
+    """One recognition backend: call(recognizer, audio_data) -> text"""
+
+    def __init__(self, name, call, timeout, breaker, max_in_flight=MAX_IN_FLIGHT):
+        self.name = name
+        self.call = call
+        self.timeout = timeout
+        self.breaker = breaker
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=f"stt-{name}")
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.stats = {"calls": 0, "failures": 0, "timeouts": 0, "skipped": 0, "busy": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def submit(self, recognizer, audio_data):
+        """Start a call on this backend's own workers, or None if too many are still running"""
+        with self.lock:
+            if self.in_flight >= self.max_in_flight:
+                self.stats["busy"] += 1
+                return None
+            self.in_flight += 1
+            self.stats["calls"] += 1
+        future = self.pool.submit(self.call, recognizer, audio_data)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self.lock:
+            self.in_flight -= 1
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = dict(self.stats)
+
+        def percentile(fraction):
+            if not latencies:
+                return 0.0
+            return 1000 * latencies[min(len(latencies) - 1, int(round(fraction * (len(latencies) - 1))))]
+
+        return {**stats, "state": self.breaker.state, "trips": self.breaker.trips, "in_flight": self.in_flight,
+                "p50_ms": percentile(0.50), "p95_ms": percentile(0.95)}
+
+class RecognizerDispatcher:
+    """Routes recognition requests through backends in order of preference
+
+    not_understood is the exception type a backend raises for speech it
+    could not make out (sr.UnknownValueError); on_call(name, seconds) and
+    on_failover(seconds), if given, receive timing for the metrics.
+    """
+
+    def __init__(self, backends, not_understood=(), on_call=None, on_failover=None):
+        self.backends = backends
+        self.not_understood = not_understood
+        self.on_call = on_call
+        self.on_failover = on_failover
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "failovers": 0, "unavailable": 0,
+                      "speculative": 0, "speculative_failed": 0}
+        self.failover_seconds = collections.deque(maxlen=LATENCY_WINDOW)
+
+    def _attempts(self):
+        """Backends to try, in order; each breaker is asked only when its turn comes
+
+        Asking allow() moves an open breaker whose backoff has passed to
+        half-open, which commits us to the trial call, so it must not be
+        asked for a backend we may never reach.
+        """
+        tried = False
+        for backend in self.backends:
+            if backend.breaker.allow():
+                tried = True
+                yield backend
+            else:
+                backend.count("skipped")
+        if not tried:
+            # Everything is open: better a late try than no answer at all
+            yield min(self.backends, key=lambda backend: backend.breaker.retry_at)
+
+    def recognize(self, recognizer, audio_data, speculative=False):
+        """Return the transcript from the first backend that answers in time"""
+        if speculative:
+            return self._recognize_speculatively(recognizer, audio_data)
+        started = time.perf_counter()
+        with self.lock:
+            self.stats["requests"] += 1
+
+        errors = []
+        for backend in self._attempts():
+            try:
+                text = self._call(backend, recognizer, audio_data)
+            except self.not_understood:
+                raise
+            except Exception as e:
+                errors.append(f"{backend.name}: {e or type(e).__name__}")
+                continue
+            if backend is not self.backends[0]:
+                elapsed = time.perf_counter() - started
+                with self.lock:
+                    self.stats["failovers"] += 1
+                    self.failover_seconds.append(elapsed)
+                if self.on_failover:
+                    self.on_failover(elapsed)
+            return text
+
+        with self.lock:
+            self.stats["unavailable"] += 1
+        raise BackendUnavailable("; ".join(errors))
+
+    def _recognize_speculatively(self, recognizer, audio_data):
+        """recognize() that leaves the breakers, latencies and failover counts alone"""
+        with self.lock:
+            self.stats["speculative"] += 1
+        errors = []
+        for backend in self.backends:
+            if backend.breaker.state != CLOSED:
+                continue
+            future = backend.submit(recognizer, audio_data)
+            if future is None:
+                errors.append(f"{backend.name}: {backend.max_in_flight} calls still running")
+                continue
+            try:
+                return future.result(timeout=backend.timeout)
+            except self.not_understood:
+                raise
+            except FutureTimeoutError:
+                errors.append(f"{backend.name}: no answer within {backend.timeout:.1f}s")
+            except Exception as e:
+                errors.append(f"{backend.name}: {e or type(e).__name__}")
+        with self.lock:
+            self.stats["speculative_failed"] += 1
+        raise BackendUnavailable("; ".join(errors) or "no healthy backend")
+
+    def _call(self, backend, recognizer, audio_data):
+        start = time.perf_counter()
+        future = backend.submit(recognizer, audio_data)
+        if future is None:
+            # Its earlier calls are all still hanging
+            self._failed(backend, 0.0)
+            raise TimeoutError(f"{backend.max_in_flight} calls still running")
+        try:
+            text = future.result(timeout=backend.timeout)
+        except FutureTimeoutError:
+            backend.count("timeouts")
+            self._failed(backend, time.perf_counter() - start)
+            raise TimeoutError(f"no answer within {backend.timeout:.1f}s")
+        except self.not_understood:
+            backend.breaker.record_success()
+            self._timed(backend, time.perf_counter() - start)
+            raise
+        except Exception:
+            self._failed(backend, time.perf_counter() - start)
+            raise
+        backend.breaker.record_success()
+        self._timed(backend, time.perf_counter() - start)
+        return text
+
+    def _timed(self, backend, seconds):
+        with backend.lock:
+            backend.latencies.append(seconds)
+        if self.on_call:
+            self.on_call(backend.name, seconds)
+
+    def _failed(self, backend, seconds):
+        backend.count("failures")
+        self._timed(backend, seconds)
+        if backend.breaker.record_failure():
+            print(f"Speech recognition backend '{backend.name}' is failing; "
+                  f"skipping it for {backend.breaker.backoff:.0f}s.")
+
+    def snapshot(self):
+        """Dispatcher counters plus per-backend state and latency"""
+        with self.lock:
+            failovers = sorted(self.failover_seconds)
+            stats = dict(self.stats)
+        stats["failover_p50_ms"] = 1000 * failovers[len(failovers) // 2] if failovers else 0.0
+        stats["backends"] = {backend.name: backend.snapshot() for backend in self.backends}
+        return stats
@@ -0,0 +1,110 @@
+"""
+Unit tests for catalog_store.py (locked edits from many threads and processes)
+
+Usage:
+    python -m pytest test_catalog_store.py
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import catalog_store
+import music_catalog
+
+def song(key):
+    return {"title": key.title(), "artist": "Tester", "file_path": f"Music/{key}.mp3"}
+
+def add_and_remove(database_file, worker, count):
+    """One worker: add its own songs one edit at a time, then remove its seed song"""
+    for number in range(count):
+        key = f"w{worker} song {number}"
+        catalog_store.apply_edit(database_file, catalog_store.CatalogEdit().add(key, song(key)))
+    catalog_store.apply_edit(database_file, catalog_store.CatalogEdit().remove(f"seed {worker}"))
+
+class CatalogStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database_file = os.path.join(self.directory, "music_database.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def seed(self, workers):
+        edit = catalog_store.CatalogEdit()
+        for worker in range(workers):
+            edit.add(f"seed {worker}", song(f"seed {worker}"))
+        edit.add("keeper", song("keeper"))
+        catalog_store.apply_edit(self.database_file, edit)
+
+    def expected(self, workers, count):
+        keys = {"keeper"} | {f"w{worker} song {number}" for worker in range(workers) for number in range(count)}
+        return {key: song(key) for key in keys}
+
+    def assert_catalog_matches_file(self):
+        """The compiled catalog is the one for the current JSON file"""
+        catalog = music_catalog.open_catalog(music_catalog.catalog_path_for(self.database_file),
+                                             catalog_store.file_version(self.database_file))
+        self.assertIsNotNone(catalog)
+        self.assertEqual(dict(catalog.items()), catalog_store.read_database(self.database_file))
+
+    def test_batch_edit_counts(self):
+        self.seed(2)
+        result = catalog_store.apply_edit(self.database_file, catalog_store.CatalogEdit()
+                                          .add("new", song("new")).update("keeper", artist="Someone")
+                                          .remove("seed 0").remove("not there"))
+        self.assertEqual((result["added"], result["updated"], result["removed"]), (1, 1, 1))
+        self.assertEqual(result["missing"], ["not there"])
+        self.assertEqual(result["removed_songs"], [song("seed 0")])
+        database = catalog_store.read_database(self.database_file)
+        self.assertEqual(sorted(database), ["keeper", "new", "seed 1"])
+        self.assertEqual(database["keeper"]["artist"], "Someone")
+        self.assert_catalog_matches_file()
+
+    def test_edits_that_change_nothing_do_not_rewrite(self):
+        self.seed(1)
+        version = catalog_store.file_version(self.database_file)
+        result = catalog_store.apply_edit(self.database_file, catalog_store.CatalogEdit().remove("not there"))
+        self.assertEqual(result["missing"], ["not there"])
+        self.assertEqual(catalog_store.file_version(self.database_file), version)
+
+    def test_every_write_changes_the_version(self):
+        self.seed(1)
+        version = catalog_store.file_version(self.database_file)
+        # Same key and same size: only the mtime can tell the versions apart
+        catalog_store.apply_edit(self.database_file, catalog_store.CatalogEdit().update("keeper", artist="Tester"))
+        self.assertNotEqual(catalog_store.file_version(self.database_file), version)
+        self.assert_catalog_matches_file()
+
+    def test_concurrent_threads_lose_no_edits(self):
+        workers, count = 8, 10
+        self.seed(workers)
+        threads = [threading.Thread(target=add_and_remove, args=(self.database_file, worker, count))
+                   for worker in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        self.assertEqual(catalog_store.read_database(self.database_file), self.expected(workers, count))
+        self.assert_catalog_matches_file()
+
+    @unittest.skipIf(catalog_store.fcntl is None, "edits are only locked across processes where flock exists")
+    def test_concurrent_processes_lose_no_edits(self):
+        workers, count = 4, 10
+        self.seed(workers)
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=add_and_remove, args=(self.database_file, worker, count))
+                     for worker in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+            self.assertEqual(process.exitcode, 0)
+        self.assertEqual(catalog_store.read_database(self.database_file), self.expected(workers, count))
+        self.assert_catalog_matches_file()
+        self.assertEqual([name for name in os.listdir(self.directory) if name.endswith(".tmp")], [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Unit tests for the conversation store in bloom_music_voice_assistant.py
+(eviction, context trimming and their counters)
+
+Runs against the benchmark's stand-in backends, like load_test_server.py.
+
+Usage:
+    python -m pytest test_conversations.py
+"""
+import argparse
+import unittest
+
+import benchmark_assistant
+
+# The assistant imports the speech, wake-word and audio backends at load time
+benchmark_assistant.install_stand_ins([], argparse.Namespace(stt_latency=0.0, speech_pause=0.0,
+                                                             tts_latency=0.0))
+import bloom_music_voice_assistant as assistant
+
+def answer(context=None, ok=True, endpoint="llama3@http://a:11434"):
+    """An Ollama result as returned by request_llama3"""
+    return {"ok": ok, "response": "an answer" if ok else "Sorry, no answer.", "context": context,
+            "endpoint": endpoint, "prompt_eval_count": 4}
+
+class CountersTest(unittest.TestCase):
+    def setUp(self):
+        self.before = assistant.conversation_stats()
+
+    def counted(self, name):
+        """How much a conversation counter went up during the test"""
+        return assistant.conversation_stats()[name] - self.before[name]
+
+class ConversationStoreTest(CountersTest):
+    def test_same_id_gets_the_same_conversation(self):
+        store = assistant.ConversationStore(max_sessions=2)
+        self.assertIs(store.get("a"), store.get("a"))
+        self.assertEqual(self.counted("sessions_evicted"), 0)
+
+    def test_least_recently_used_conversation_is_evicted(self):
+        store = assistant.ConversationStore(max_sessions=2)
+        first = store.get("a")
+        store.get("b")
+        store.get("a")
+        store.get("c")
+        self.assertEqual(list(store.sessions), ["a", "c"])
+        self.assertEqual(self.counted("sessions_evicted"), 1)
+        self.assertIs(store.get("a"), first)
+        # b starts over, pushing out c (a was just used)
+        store.get("b")
+        self.assertEqual(list(store.sessions), ["a", "b"])
+        self.assertEqual(self.counted("sessions_evicted"), 2)
+
+    def test_discarding_is_not_an_eviction(self):
+        store = assistant.ConversationStore(max_sessions=2)
+        store.get("a")
+        store.discard("a")
+        store.discard("never seen")
+        self.assertEqual(list(store.sessions), [])
+        self.assertEqual(self.counted("sessions_evicted"), 0)
+
+class ConversationSessionTest(CountersTest):
+    def setUp(self):
+        super().setUp()
+        self.conversation = assistant.ConversationSession("test")
+
+    def ask(self, question, result):
+        turn = self.conversation.prepare(question)
+        self.conversation.commit(turn, result)
+        return turn
+
+    def test_context_within_the_budget_is_reused(self):
+        first = self.ask("who wrote hey jude", answer(context=[1, 2, 3]))
+        self.assertIsNone(first["context"])
+        second = self.ask("when", answer(context=[1, 2, 3, 4, 5]))
+        self.assertEqual(second["context"], [1, 2, 3])
+        self.assertEqual(second["endpoint"], "llama3@http://a:11434")
+        self.assertFalse(second["recap"])
+        self.assertEqual(self.counted("context_reused"), 1)
+        self.assertEqual(self.counted("context_trimmed"), 0)
+
+    def test_context_over_the_budget_is_trimmed_to_a_recap(self):
+        self.ask("who wrote hey jude", answer(context=list(range(assistant.CONVERSATION_TOKEN_BUDGET + 1))))
+        self.assertEqual(self.counted("context_trimmed"), 1)
+        self.assertIsNone(self.conversation.context)
+        self.assertIsNone(self.conversation.endpoint)
+        turn = self.ask("when", answer(context=[1, 2]))
+        self.assertIsNone(turn["context"])
+        self.assertTrue(turn["recap"])
+        self.assertIn("User: who wrote hey jude\nAssistant: an answer", turn["prompt"])
+        self.assertTrue(turn["prompt"].endswith("User: when"))
+        self.assertEqual(self.counted("recaps"), 1)
+
+    def test_a_missing_context_is_not_counted_as_trimmed(self):
+        self.ask("who wrote hey jude", answer(context=None))
+        self.assertEqual(self.counted("context_trimmed"), 0)
+        self.assertTrue(self.conversation.prepare("when")["recap"])
+
+    def test_failed_turns_leave_the_conversation_alone(self):
+        self.ask("who wrote hey jude", answer(context=[1, 2, 3]))
+        self.ask("when", answer(ok=False))
+        self.assertEqual(self.conversation.context, [1, 2, 3])
+        self.assertEqual([asked for asked, _ in self.conversation.history], ["who wrote hey jude"])
+        self.assertEqual(self.counted("turns"), 2)
+
+    def test_recap_keeps_only_the_last_turns(self):
+        for number in range(assistant.CONVERSATION_RECAP_TURNS + 2):
+            self.ask(f"question {number}", answer())
+        asked = [question for question, _ in self.conversation.history]
+        self.assertEqual(len(asked), assistant.CONVERSATION_RECAP_TURNS)
+        self.assertEqual(asked[-1], f"question {assistant.CONVERSATION_RECAP_TURNS + 1}")
+
+    def test_idle_conversations_expire(self):
+        self.ask("who wrote hey jude", answer(context=[1, 2, 3]))
+        self.conversation.last_used -= assistant.CONVERSATION_IDLE_SECONDS + 1
+        turn = self.conversation.prepare("when")
+        self.assertIsNone(turn["context"])
+        self.assertFalse(turn["recap"])
+        self.assertEqual(self.counted("expired"), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+"""
+Unit tests for llm_dispatcher.py (coalescing, priority and cancel)
+
+Usage:
+    python -m pytest test_llm_dispatcher.py
+"""
+import threading
+import unittest
+
+from llm_dispatcher import HIGH_PRIORITY, NORMAL_PRIORITY, LLMDispatcher, normalize_prompt
+
+class GatedCall:
+    """Records the prompts it is called with; every call waits for the gate"""
+
+    def __init__(self):
+        self.calls = []
+        self.gate = threading.Event()
+        self.started = threading.Semaphore(0)
+
+    def __call__(self, prompt, *args):
+        self.calls.append((prompt, *args))
+        self.started.release()
+        self.gate.wait(5)
+        if prompt == "fail":
+            raise RuntimeError("backend down")
+        return f"answer to {prompt}"
+
+    def wait_started(self):
+        return self.started.acquire(timeout=5)
+
+class LLMDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.call = GatedCall()
+        self.dispatcher = LLMDispatcher(self.call, max_concurrency=1)
+
+    def tearDown(self):
+        self.call.gate.set()
+
+    def occupy_worker(self):
+        """Start a request that holds the only worker until the gate opens"""
+        future = self.dispatcher.submit("busy")
+        self.assertTrue(self.call.wait_started())
+        return future
+
+    def test_normalize_prompt(self):
+        self.assertEqual(normalize_prompt("  What's   the\tTIME "), "what's the time")
+
+    def test_identical_prompts_share_one_request(self):
+        self.occupy_worker()
+        first = self.dispatcher.submit("What is jazz?")
+        second = self.dispatcher.submit("what  is JAZZ?")
+        self.assertIs(first, second)
+        self.call.gate.set()
+        self.assertEqual(first.result(5), "answer to What is jazz?")
+        self.assertEqual([call[0] for call in self.call.calls], ["busy", "What is jazz?"])
+        self.assertEqual(self.dispatcher.snapshot()["coalesced"], 1)
+
+    def test_different_keys_are_not_coalesced(self):
+        self.occupy_worker()
+        first = self.dispatcher.submit("and then?", key=("and then?", 1), args=([1],))
+        second = self.dispatcher.submit("and then?", key=("and then?", 2), args=([2],))
+        self.assertIsNot(first, second)
+        self.call.gate.set()
+        first.result(5)
+        second.result(5)
+        self.assertEqual(self.call.calls[1:], [("and then?", [1]), ("and then?", [2])])
+
+    def test_finished_requests_are_not_reused(self):
+        self.call.gate.set()
+        first = self.dispatcher.submit("hello")
+        first.result(5)
+        self.assertIsNot(self.dispatcher.submit("hello"), first)
+
+    def test_short_prompts_run_first(self):
+        self.assertEqual(self.dispatcher.priority_for("yes"), HIGH_PRIORITY)
+        self.assertEqual(self.dispatcher.priority_for("tell me the whole history of the blues"),
+                         NORMAL_PRIORITY)
+        self.occupy_worker()
+        futures = [self.dispatcher.submit(prompt) for prompt in
+                   ["tell me the whole history of the blues", "thanks",
+                    "explain how a guitar amplifier works please", "ok"]]
+        self.call.gate.set()
+        for future in futures:
+            future.result(5)
+        self.assertEqual([call[0] for call in self.call.calls],
+                         ["busy", "thanks", "ok", "tell me the whole history of the blues",
+                          "explain how a guitar amplifier works please"])
+
+    def test_explicit_priority_overrides_the_prompt_length(self):
+        self.occupy_worker()
+        low = self.dispatcher.submit("hi", priority=NORMAL_PRIORITY)
+        high = self.dispatcher.submit("tell me the whole history of the blues", priority=HIGH_PRIORITY)
+        self.call.gate.set()
+        low.result(5)
+        high.result(5)
+        self.assertEqual(self.call.calls[1][0], "tell me the whole history of the blues")
+
+    def test_cancel_removes_a_queued_request(self):
+        self.occupy_worker()
+        future = self.dispatcher.submit("never mind")
+        self.assertEqual(self.dispatcher.queue_depth(), 1)
+        self.assertTrue(self.dispatcher.cancel("never mind", future))
+        self.assertTrue(future.cancelled())
+        self.assertEqual(self.dispatcher.queue_depth(), 0)
+        # Submitting it again starts a new request
+        self.assertIsNot(self.dispatcher.submit("never mind"), future)
+        self.call.gate.set()
+        self.assertEqual(self.dispatcher.snapshot()["cancelled"], 1)
+
+    def test_cancel_keeps_a_request_others_still_wait_for(self):
+        self.occupy_worker()
+        future = self.dispatcher.submit("shared")
+        self.dispatcher.submit("shared")
+        self.assertFalse(self.dispatcher.cancel("shared", future))
+        self.call.gate.set()
+        self.assertEqual(future.result(5), "answer to shared")
+        self.assertEqual(self.dispatcher.snapshot()["cancelled"], 0)
+
+    def test_cancel_does_not_stop_a_running_request(self):
+        future = self.occupy_worker()
+        self.assertFalse(self.dispatcher.cancel("busy", future))
+        self.call.gate.set()
+        self.assertEqual(future.result(5), "answer to busy")
+
+    def test_failures_reach_every_waiter_and_are_not_cached(self):
+        self.occupy_worker()
+        first = self.dispatcher.submit("fail")
+        second = self.dispatcher.submit("fail")
+        self.call.gate.set()
+        for future in (first, second):
+            with self.assertRaises(RuntimeError):
+                future.result(5)
+        self.assertEqual(self.dispatcher.snapshot()["failed"], 1)
+        self.assertIsNot(self.dispatcher.submit("fail"), first)
+
+    def test_concurrency_is_bounded(self):
+        dispatcher = LLMDispatcher(self.call, max_concurrency=2)
+        futures = [dispatcher.submit(f"question {number}") for number in range(4)]
+        self.assertTrue(self.call.wait_started())
+        self.assertTrue(self.call.wait_started())
+        self.assertFalse(self.call.started.acquire(timeout=0.1))
+        self.assertEqual(dispatcher.snapshot()["running"], 2)
+        self.call.gate.set()
+        for future in futures:
+            future.result(5)
+        self.assertEqual(dispatcher.snapshot()["completed"], 4)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Unit tests for music_catalog.py (binary catalog and search)
+
+Usage:
+    python -m pytest test_music_catalog.py
+"""
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from music_catalog import Catalog, build_catalog, open_catalog, search_database
+
+ALPHABET = "abcé b"
+
+def random_text(rng, longest=6):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, longest)))
+
+def random_library(rng, size):
+    library = {}
+    for number in range(size):
+        song_info = {"title": random_text(rng).title(), "artist": random_text(rng).upper(),
+                     "file_path": f"Music/{number}.mp3"}
+        if rng.random() < 0.2:
+            song_info["gain"] = number
+        library[random_text(rng, 4)] = song_info
+    return library
+
+class CatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def compile(self, library, name="catalog.bin"):
+        path = os.path.join(self.directory, name)
+        build_catalog(library, path, (1, 2))
+        return open_catalog(path, (1, 2))
+
+    def test_behaves_like_the_dict(self):
+        library = random_library(random.Random(1), 50)
+        catalog = self.compile(library)
+        self.assertIsInstance(catalog, Catalog)
+        self.assertEqual(len(catalog), len(library))
+        self.assertEqual(list(catalog), list(library))
+        self.assertEqual(dict(catalog.items()), library)
+        self.assertEqual(list(catalog.values()), list(library.values()))
+        for key in library:
+            self.assertIn(key, catalog)
+            self.assertEqual(catalog[key], library[key])
+        self.assertNotIn("not a key", catalog)
+        with self.assertRaises(KeyError):
+            catalog["not a key"]
+
+    def test_stale_or_missing_catalogs_are_not_opened(self):
+        path = os.path.join(self.directory, "catalog.bin")
+        self.assertIsNone(open_catalog(path))
+        build_catalog({}, path, (1, 2))
+        self.assertIsNone(open_catalog(path, (1, 3)))
+
+    def test_empty_catalog(self):
+        catalog = self.compile({})
+        self.assertEqual(len(catalog), 0)
+        for query in ["", " ", "a"]:
+            self.assertIsNone(catalog.search(query))
+
+    def test_search_matches_search_database_on_random_libraries(self):
+        rng = random.Random(7)
+        for trial in range(200):
+            library = random_library(rng, rng.randint(0, 12))
+            catalog = self.compile(library, f"catalog{trial}.bin")
+            queries = ["", " ", random_text(rng), random_text(rng, 2)]
+            queries += [rng.choice(list(library))[1:] for _ in range(2)] if library else []
+            for query in queries:
+                query = query.lower().strip()
+                self.assertEqual(catalog.search(query), search_database(library, query),
+                                 f"query {query!r} on {library!r}")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+Unit tests for ollama_pool.py (routing, failover and affinity)
+
+Usage:
+    python -m pytest test_ollama_pool.py
+"""
+import unittest
+from types import SimpleNamespace
+
+from ollama_pool import NoHealthyEndpoint, OllamaEndpoint, OllamaPool
+
+class FakeSession:
+    """Answers POSTs per endpoint URL: a status code or an exception to raise"""
+
+    def __init__(self):
+        self.outcomes = {}
+        self.posts = []
+
+    def post(self, url, json=None, timeout=None):
+        base = url[:-len("/api/generate")]
+        self.posts.append((base, json["model"], timeout))
+        outcome = self.outcomes.get(base, 200)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return SimpleNamespace(status_code=outcome)
+
+    def get(self, url, timeout=None):
+        return SimpleNamespace(status_code=200, json=lambda: {"models": [{"name": "llama3:latest"}]})
+
+class OllamaPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.session = FakeSession()
+        self.endpoints = [OllamaEndpoint(f"http://{name}:11434", "llama3", timeout=5.0) for name in "abc"]
+        self.pool = OllamaPool(self.endpoints, lambda: self.session)
+        self.a, self.b, self.c = self.endpoints
+
+    def served_by(self, payload=None, prefer=None):
+        endpoint, _ = self.pool.generate(payload or {"prompt": "hi"}, prefer=prefer)
+        return endpoint
+
+    def test_url_suffixes_are_stripped(self):
+        endpoint = OllamaEndpoint("http://x:11434/api/generate", "llama3")
+        self.assertEqual(endpoint.url, "http://x:11434")
+        self.assertEqual(endpoint.name, "llama3@http://x:11434")
+
+    def test_fewest_outstanding_then_fastest(self):
+        self.a.latency, self.b.latency, self.c.latency = 0.3, 0.1, 0.2
+        self.assertIs(self.served_by(), self.b)
+        self.b.outstanding = 1
+        self.assertIs(self.served_by(), self.c)
+
+    def test_unhealthy_endpoints_are_skipped_unless_all_are_down(self):
+        self.a.healthy = self.b.healthy = False
+        self.assertIs(self.served_by(), self.c)
+        self.c.healthy = False
+        self.assertIn(self.served_by(), self.endpoints)
+
+    def test_fails_over_and_takes_the_failed_endpoint_out_of_rotation(self):
+        self.a.latency, self.b.latency, self.c.latency = 0.1, 0.2, 0.3
+        self.session.outcomes["http://a:11434"] = ConnectionError("refused")
+        self.session.outcomes["http://b:11434"] = 503
+        self.assertIs(self.served_by(), self.c)
+        self.assertFalse(self.a.healthy)
+        self.assertFalse(self.b.healthy)
+        self.assertEqual((self.a.stats["retried_elsewhere"], self.b.stats["retried_elsewhere"]), (1, 1))
+        self.assertEqual([post[2] for post in self.session.posts], [5.0, 5.0, 5.0])
+        # Back in rotation once a health check passes
+        self.pool.check_all()
+        self.assertTrue(self.a.healthy)
+
+    def test_all_failing_raises_the_last_error(self):
+        for endpoint in self.endpoints:
+            self.session.outcomes[endpoint.url] = 500
+        with self.assertRaises(NoHealthyEndpoint):
+            self.pool.generate({"prompt": "hi"})
+
+    def test_client_errors_are_returned_not_retried(self):
+        self.session.outcomes["http://a:11434"] = 400
+        self.a.latency, self.b.latency, self.c.latency = 0.1, 0.2, 0.3
+        endpoint, response = self.pool.generate({"prompt": "hi"})
+        self.assertEqual((endpoint, response.status_code), (self.a, 400))
+        self.assertEqual(len(self.session.posts), 1)
+
+    def test_affinity_keeps_a_conversation_on_its_endpoint(self):
+        self.a.latency, self.b.latency, self.c.latency = 0.15, 0.1, 0.1
+        payload = {"prompt": "and then?", "context": [1, 2, 3]}
+        self.assertIs(self.served_by(payload, prefer=self.a.name), self.a)
+
+    def test_affinity_gives_way_to_a_much_faster_endpoint(self):
+        self.a.latency, self.b.latency, self.c.latency = 0.5, 0.1, 0.3
+        payload = {"prompt": "and then?", "context": [1, 2, 3]}
+        self.assertIs(self.served_by(payload, prefer=self.a.name), self.b)
+
+    def test_affinity_holds_against_endpoints_not_measured_yet(self):
+        # b and c haven't served anything: their latency of 0 is unknown, not fast
+        self.a.latency = 0.05
+        payload = {"prompt": "and then?", "context": [1, 2, 3]}
+        self.assertEqual(self.pool._candidates(self.a)[0], self.a)
+        for _ in range(3):
+            self.assertIs(self.served_by(payload, prefer=self.a.name), self.a)
+
+    def test_context_never_goes_to_a_different_model(self):
+        other = OllamaEndpoint("http://d:11434", "mistral")
+        other.latency = 0.001
+        self.pool.endpoints.append(other)
+        self.a.latency, self.b.latency, self.c.latency = 0.5, 0.4, 0.4
+        self.a.outstanding = self.b.outstanding = self.c.outstanding = 1
+        payload = {"prompt": "and then?", "context": [1, 2, 3]}
+        self.assertEqual(self.served_by(payload, prefer=self.a.name).model, "llama3")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+"""
+Unit tests for stt_dispatcher.py (circuit breaker and failover)
+
+Usage:
+    python -m pytest test_stt_dispatcher.py
+"""
+import threading
+import unittest
+
+from stt_dispatcher import (CLOSED, HALF_OPEN, OPEN, BackendUnavailable, CircuitBreaker,
+                            RecognizerBackend, RecognizerDispatcher)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class NotUnderstood(Exception):
+    pass
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=3, backoff_seconds=5, max_backoff_seconds=20,
+                                      clock=self.clock)
+
+    def trip(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+
+    def test_opens_after_threshold_consecutive_failures(self):
+        self.assertFalse(self.breaker.record_failure())
+        self.assertFalse(self.breaker.record_failure())
+        self.assertTrue(self.breaker.record_failure())
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.trips, 1)
+        self.assertFalse(self.breaker.allow())
+
+    def test_success_resets_the_failure_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.assertFalse(self.breaker.record_failure())
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_half_open_after_backoff_then_closes_on_success(self):
+        self.trip()
+        self.clock.now = 4.9
+        self.assertFalse(self.breaker.allow())
+        self.clock.now = 5.0
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        # Only the one trial call goes through
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_trial_doubles_the_backoff_up_to_the_maximum(self):
+        self.trip()
+        for expected in (10, 20, 20):
+            self.clock.now = self.breaker.retry_at
+            self.assertTrue(self.breaker.allow())
+            self.assertTrue(self.breaker.record_failure())
+            self.assertEqual(self.breaker.state, OPEN)
+            self.assertEqual(self.breaker.retry_at - self.clock.now, expected)
+
+class RecognizerDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.outcomes = {"google": "google text", "sphinx": "sphinx text"}
+        self.calls = []
+
+    def backend(self, name, timeout=1.0):
+        def call(recognizer, audio_data):
+            self.calls.append(name)
+            outcome = self.outcomes[name]
+            if isinstance(outcome, BaseException):
+                raise outcome
+            if isinstance(outcome, threading.Event):
+                outcome.wait(5)
+                return "late"
+            return outcome
+        breaker = CircuitBreaker(failure_threshold=2, backoff_seconds=5, clock=self.clock)
+        return RecognizerBackend(name, call, timeout, breaker)
+
+    def dispatcher(self, **timeouts):
+        backends = [self.backend("google", timeouts.get("google", 1.0)),
+                    self.backend("sphinx", timeouts.get("sphinx", 1.0))]
+        return RecognizerDispatcher(backends, not_understood=NotUnderstood)
+
+    def test_fails_over_and_trips_the_failing_backend(self):
+        dispatcher = self.dispatcher()
+        self.outcomes["google"] = ConnectionError("offline")
+        self.assertEqual(dispatcher.recognize(None, None), "sphinx text")
+        self.assertEqual(dispatcher.recognize(None, None), "sphinx text")
+        google, sphinx = dispatcher.backends
+        self.assertEqual(google.breaker.state, OPEN)
+        self.calls.clear()
+        self.assertEqual(dispatcher.recognize(None, None), "sphinx text")
+        self.assertEqual(self.calls, ["sphinx"])
+        self.assertEqual(dispatcher.snapshot()["failovers"], 3)
+
+    def test_not_understood_is_passed_through_and_not_a_failure(self):
+        dispatcher = self.dispatcher()
+        self.outcomes["google"] = NotUnderstood()
+        with self.assertRaises(NotUnderstood):
+            dispatcher.recognize(None, None)
+        self.assertEqual(self.calls, ["google"])
+        self.assertEqual(dispatcher.backends[0].breaker.failures, 0)
+
+    def test_unreached_fallback_is_not_left_half_open(self):
+        dispatcher = self.dispatcher()
+        google, sphinx = dispatcher.backends
+        for _ in range(2):
+            sphinx.breaker.record_failure()
+        self.clock.now = sphinx.breaker.retry_at
+        # Google answers, so the fallback's trial call never happens...
+        self.assertEqual(dispatcher.recognize(None, None), "google text")
+        self.assertEqual(sphinx.breaker.state, OPEN)
+        # ...and when Google fails later, the fallback still gets its trial
+        self.outcomes["google"] = ConnectionError("offline")
+        self.assertEqual(dispatcher.recognize(None, None), "sphinx text")
+        self.assertEqual(sphinx.breaker.state, CLOSED)
+
+    def test_all_failing_raises_backend_unavailable(self):
+        dispatcher = self.dispatcher()
+        self.outcomes["google"] = ConnectionError("offline")
+        self.outcomes["sphinx"] = OSError("no model")
+        with self.assertRaises(BackendUnavailable):
+            dispatcher.recognize(None, None)
+        self.assertEqual(dispatcher.snapshot()["unavailable"], 1)
+
+    def test_speculative_requests_leave_the_breakers_alone(self):
+        dispatcher = self.dispatcher()
+        google, sphinx = dispatcher.backends
+        self.outcomes["google"] = ConnectionError("offline")
+        for _ in range(3):
+            self.assertEqual(dispatcher.recognize(None, None, speculative=True), "sphinx text")
+        self.assertEqual(google.breaker.failures, 0)
+        self.assertEqual(google.breaker.state, CLOSED)
+        # Nor do they take the trial call of a backend that is backing off
+        for _ in range(2):
+            sphinx.breaker.record_failure()
+        self.clock.now = sphinx.breaker.retry_at
+        with self.assertRaises(BackendUnavailable):
+            dispatcher.recognize(None, None, speculative=True)
+        self.assertEqual(sphinx.breaker.state, OPEN)
+        snapshot = dispatcher.snapshot()
+        self.assertEqual((snapshot["speculative"], snapshot["speculative_failed"]), (4, 1))
+        self.assertEqual((snapshot["requests"], snapshot["failovers"]), (0, 0))
+
+    def test_hung_calls_do_not_starve_the_fallback(self):
+        dispatcher = self.dispatcher(google=0.05)
+        hang = threading.Event()
+        self.outcomes["google"] = hang
+        google, sphinx = dispatcher.backends
+        google.breaker.failure_threshold = 100
+        try:
+            for _ in range(google.max_in_flight + 2):
+                self.assertEqual(dispatcher.recognize(None, None), "sphinx text")
+            self.assertEqual(google.in_flight, google.max_in_flight)
+            self.assertEqual(google.snapshot()["busy"], 2)
+        finally:
+            hang.set()
+
+if __name__ == "__main__":
+    unittest.main()